@@ -0,0 +1,94 @@
+"""
+Parsing of the Accept, Accept-Language and Accept-Encoding headers, and negotiation against them.
+
+Clients send few distinct values of these headers, so parsed values are kept in a bounded LRU
+cache keyed by the raw header, and a repeated value is never parsed twice.
+"""
+from collections.abc import Callable, Sequence
+from functools import lru_cache
+
+# The number of distinct values of each header whose parsed form is kept
+ACCEPT_CACHE_SIZE = 256
+
+# Entries of a header in order of preference, as (range, quality) pairs. Ranges are lowercased and
+# have any parameters other than the quality removed.
+type AcceptList = tuple[tuple[str, float], ...]
+
+
+@lru_cache(maxsize=ACCEPT_CACHE_SIZE)
+def parse_accept(header: str) -> AcceptList:
+    """
+    Parse an Accept style header into its ranges sorted by quality, highest first. Ranges of equal
+    quality keep the order of the header. Entries with an invalid quality are left out, while those
+    with a quality of 0 are kept, at the end, as they exclude what they match.
+    """
+    entries: list[tuple[float, int, str]] = []
+    for i, item in enumerate(header.split(",")):
+        value, *params = item.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(raw)
+                except ValueError:
+                    quality = -1.0
+        if 0 <= quality <= 1:
+            entries.append((-quality, i, value))
+    entries.sort()
+    return tuple((value, -neg_quality) for neg_quality, _, value in entries)
+
+
+def media_range_matches(media_range: str, media_type: str) -> int:
+    """
+    Get how specifically a media range such as 'text/*' matches a media type. Higher values are
+    more specific, and 0 means the range does not match.
+    """
+    if media_range == media_type:
+        return 3
+    if media_range == "*/*":
+        return 1
+    if media_range.endswith("/*") and media_type.startswith(media_range[:-1]):
+        return 2
+    return 0
+
+
+def language_range_matches(language_range: str, language: str) -> int:
+    """
+    Get how specifically a language range such as 'en' matches a language tag such as 'en-gb'.
+    Higher values are more specific, and 0 means the range does not match.
+    """
+    if language_range == language:
+        return len(language) + 2
+    if language_range == "*":
+        return 1
+    if language.startswith(language_range + "-"):
+        return len(language_range) + 1
+    return 0
+
+
+def best_match(accepted: AcceptList, offered: Sequence[str],
+               matches: Callable[[str, str], int] = media_range_matches) -> str | None:
+    """
+    Choose the offered value the client prefers. Each offered value takes the quality of the most
+    specific range matching it, and the highest quality wins, with ties going to the earlier
+    offered value. None is returned if nothing offered is acceptable, and an empty header accepts
+    the first offered value.
+    """
+    if not accepted:
+        return offered[0] if offered else None
+    best: str | None = None
+    best_quality = 0.0
+    for value in offered:
+        lowered = value.lower()
+        specificity, quality = 0, 0.0
+        for accepted_range, accepted_quality in accepted:
+            found = matches(accepted_range, lowered)
+            if found > specificity:
+                specificity, quality = found, accepted_quality
+        if quality > best_quality:
+            best, best_quality = value, quality
+    return best
@@ -1,56 +1,213 @@
+import time
 from collections.abc import Callable, Iterable
-from typing import TypedDict, Unpack
+from typing import Any, TypedDict, Unpack
 from wsgiref.types import StartResponse, WSGIEnvironment
 
+from terminus.background import BackgroundTaskRunner
+from terminus.coalesce import SingleFlight
 from terminus.execution_pipeline import AfterWareFn, ExecutionPipeline, MiddlewareFn
+from terminus.idempotency import Idempotency
+from terminus.limits import ConcurrencyLimiter
+from terminus.metrics import MetricsCollector
+from terminus.middleware.cors import CORSPolicy
+from terminus.profiler import RequestProfiler
 from terminus.request_factory import RequestFactory
-from terminus.response import Response
-from terminus.router import RouteFn, Router
-from terminus.types import HTTPError, HTTPMethod
+from terminus.response import EmptyBody, EncodedResponse, Response
+from terminus.router import RouteDetails, RouteFn, Router
+from terminus.schema import RouteSchema
+from terminus.structs import compile_decoder
+from terminus.types import HTTPError, HTTPMethod, Request, RouteError, WSGIFormatHeaders
+from terminus.watchdog import SlowRequestWatchdog
 
 type RouteDecorator = Callable[[RouteFn], RouteFn]
 
+# Looking the request method up by its name avoids a linear scan of the enum on every request
+METHODS = {method.value: method for method in HTTPMethod}
+
+# Requests for unknown paths are common enough, from scanners and bots, to send a prebuilt response
+NOT_FOUND = EncodedResponse.error("Route not found", 404)
+
 # Options declared as a type dict for easy unpacking in each method route
 class RouteOptions(TypedDict, total=False):
     pre: list[MiddlewareFn]
     after: list[AfterWareFn]
+    schema: RouteSchema
+    body_type: Any
+    max_in_flight: int
+    timeout: float
+    coalesce: SingleFlight
+    idempotency: Idempotency
 
 class API:
-    def __init__(self) -> None:
+    def __init__(self, metrics: MetricsCollector | None = None,
+                 profiler: RequestProfiler | None = None,
+                 watchdog: SlowRequestWatchdog | None = None,
+                 background_tasks: BackgroundTaskRunner | None = None,
+                 limiter: ConcurrencyLimiter | None = None,
+                 timeout: float | None = None,
+                 cors: CORSPolicy | None = None) -> None:
         self._router = Router()
-        self._pipeline = ExecutionPipeline()
+        self._pipeline = ExecutionPipeline(watchdog)
+        self._metrics = metrics
+        self._profiler = profiler
+        # The runner only starts its threads once a task is scheduled
+        self._background_tasks = background_tasks or BackgroundTaskRunner()
+        self._limiter = limiter
+        self._timeout = timeout
+        self._timeouts: list[float | None] = []
+        # Prebuilt 405 responses for each Allow header
+        self._not_allowed: dict[str, EncodedResponse] = {}
+        self._cors = cors
+        self._vary: WSGIFormatHeaders = []
+        if cors is not None:
+            self._pipeline.add_before_main_fn(cors)
+            self._vary = cors.vary
+        if metrics is not None:
+            self.get(metrics.path)(metrics.serve)
+            if limiter is not None:
+                metrics.add_renderer(limiter.render)
     
     def __call__(self, environ: WSGIEnvironment,
                  start_response: StartResponse) -> Iterable[bytes]:
         """Entrypoint to the gunicorn web server"""
+        if self._vary:
+            # Added here so that responses sent before any middleware runs carry them too
+            start_response = _with_headers(start_response, self._vary)
         
         method_str = environ["REQUEST_METHOD"]
-        if method_str not in HTTPMethod:
+        method = METHODS.get(method_str)
+        if method is None:
             return Response.send_err(start_response, f"HTTP method '{method_str}' not recognised")
-        method = HTTPMethod(method_str)
+        
+        if (method is HTTPMethod.OPTIONS and self._cors is not None
+                and CORSPolicy.is_preflight(environ)):
+            return self._cors.preflight(environ, start_response)
         
         path = environ.get("PATH_INFO", "/")
         route_details = self._router.match_route(method, path)
+        if route_details is None and method is HTTPMethod.HEAD:
+            # HEAD requests are answered by the GET route, with the body left out
+            route_details = self._router.match_route(HTTPMethod.GET, path)
         if route_details is None:
-            return Response.send_err(start_response, f"Route '{method_str} {path}' not found", 404)
+            body = self._unmatched(method, path, start_response)
+        elif self._metrics is None:
+            body = self._dispatch(route_details, environ, start_response)[1]
+        else:
+            started = self._metrics.start(route_details)
+            # Exceptions escaping the pipeline are reported by the server as internal errors
+            status = 500
+            try:
+                status, body = self._dispatch(route_details, environ, start_response)
+            finally:
+                self._metrics.finish(route_details, status, started)
         
+        if method is HTTPMethod.HEAD:
+            return EmptyBody(body)
+        return body
+    
+    def _unmatched(self, method: HTTPMethod, path: str,
+                   start_response: StartResponse) -> Iterable[bytes]:
+        """
+        Respond to a request with no route for its method. If the path has routes for other methods,
+        they are listed in an Allow header, and OPTIONS requests are answered with them.
+        """
+        allow = self._router.allowed_methods(path)
+        if allow is None:
+            return NOT_FOUND.send(start_response)
+        if method is HTTPMethod.OPTIONS:
+            return Response.send_empty(start_response, 204, [("Allow", allow)])
+        not_allowed = self._not_allowed.get(allow)
+        if not_allowed is None:
+            not_allowed = EncodedResponse.error("Method not allowed", 405, [("Allow", allow)])
+            self._not_allowed[allow] = not_allowed
+        return not_allowed.send(start_response)
+
+    def _dispatch(self, route_details: RouteDetails, environ: WSGIEnvironment,
+                  start_response: StartResponse) -> tuple[int, Iterable[bytes]]:
+        """Run a matched route through the pipeline, returning the status code and the body"""
+        deadline = RequestFactory.deadline(environ, self._timeouts[route_details.route_id])
+        if self._limiter is None:
+            return self._profile(route_details, environ, start_response, deadline)
+        if not self._limiter.acquire(route_details, deadline):
+            if deadline is not None and time.monotonic() >= deadline:
+                return 504, Response.send_err(start_response, "Request deadline exceeded", 504)
+            retry_after = [("Retry-After", str(self._limiter.retry_after))]
+            return 503, Response.send_err(start_response, "Server is over capacity", 503,
+                                          retry_after)
         try:
-            req = RequestFactory.build_req(environ, route_details)
-            pipeline_res = self._pipeline.execute(route_details.fn, req)
+            return self._profile(route_details, environ, start_response, deadline)
+        finally:
+            self._limiter.release(route_details)
+
+    def _profile(self, route_details: RouteDetails, environ: WSGIEnvironment,
+                 start_response: StartResponse, deadline: float | None
+                 ) -> tuple[int, Iterable[bytes]]:
+        """Respond to a request, profiling it if it is sampled"""
+        if self._profiler is not None and self._profiler.should_profile(route_details, environ):
+            with self._profiler.profile(route_details):
+                return self._respond(route_details, environ, start_response, deadline)
+        return self._respond(route_details, environ, start_response, deadline)
+    
+    def _respond(self, route_details: RouteDetails, environ: WSGIEnvironment,
+                 start_response: StartResponse, deadline: float | None
+                 ) -> tuple[int, Iterable[bytes]]:
+        """Build the request, execute the pipeline and start the response"""
+        req: Request | None = None
+        try:
+            req = RequestFactory.build_req(environ, route_details, deadline)
+            pipeline_res = self._pipeline.execute(route_details, req)
         except HTTPError as e:
-            return Response.send_err(start_response, str(e), e.status)
+            headers = req.response_headers if req is not None else None
+            status, body = e.status, Response.send_err(start_response, str(e), e.status, headers)
         else:
-            http_res = Response(pipeline_res, start_response)
-            return http_res.send()
+            http_res = Response(pipeline_res, start_response, environ.get("HTTP_ACCEPT"),
+                                req.response_headers)
+            status, body = http_res.status_code, http_res.send()
+
+        if req is not None and req.background_tasks:
+            body = self._background_tasks.after_response(body, req, status)
+        return status, body
     
     def _build_route_decorator(self, method: HTTPMethod, path: str, **opts: Unpack[RouteOptions]
                                ) -> RouteDecorator:
         """Build a decorator function for some specific HTTP method"""
         def decorator(fn: RouteFn) -> RouteFn:
+            route_fn = fn
+            if "coalesce" in opts:
+                if method != HTTPMethod.GET:
+                    raise RouteError(f"Only GET routes can coalesce requests, not {method.value} " +
+                                     f"'{path}'")
+                route_fn = opts["coalesce"].wrap(fn)
+            if "idempotency" in opts:
+                if method in (HTTPMethod.GET, HTTPMethod.HEAD, HTTPMethod.OPTIONS):
+                    raise RouteError(f"{method.value} routes are already idempotent, so '{path}' " +
+                                     "cannot use idempotency keys")
+                route_fn = opts["idempotency"].wrap(fn)
             fn_with_middleware = ExecutionPipeline.compose_middleware(
-                fn, opts.get("pre"), opts.get("after")
+                route_fn, opts.get("pre"), opts.get("after")
             )                
-            self._router.register_route(method, path, fn_with_middleware)
+            if "max_in_flight" in opts and self._limiter is None:
+                raise RouteError(f"Route '{path}' has a concurrency limit but the API has no " +
+                                 "limiter")
+            schema = opts.get("schema")
+            body_decoder = None
+            if "body_type" in opts:
+                if schema is not None and schema.has_body:
+                    raise RouteError(f"Route '{path}' cannot have both a body type and a body " +
+                                     "schema")
+                body_decoder = compile_decoder(opts["body_type"])
+            route_details = self._router.register_route(
+                method, path, fn_with_middleware, schema, body_decoder
+            )
+            if self._metrics is not None:
+                self._metrics.add_route(route_details)
+            if self._profiler is not None:
+                self._profiler.add_route(route_details)
+            self._timeouts.append(opts.get("timeout", self._timeout))
+            if self._limiter is not None:
+                # The metrics route stays reachable when the API is saturated
+                exempt = self._metrics is not None and fn == self._metrics.serve
+                self._limiter.add_route(route_details, opts.get("max_in_flight"), exempt)
             return fn
         return decorator
     
@@ -70,6 +227,9 @@ class API:
     def get(self, path, **opts: Unpack[RouteOptions]):
         return self._build_route_decorator(HTTPMethod.GET, path, **opts)
 
+    def head(self, path, **opts: Unpack[RouteOptions]):
+        return self._build_route_decorator(HTTPMethod.HEAD, path, **opts)
+
     def post(self, path, **opts: Unpack[RouteOptions]):
         return self._build_route_decorator(HTTPMethod.POST, path, **opts)
 
@@ -91,4 +251,14 @@ class API:
     def connect(self, path, **opts: Unpack[RouteOptions]):
         return self._build_route_decorator(HTTPMethod.CONNECT, path, **opts)
             
-api = API()
\ No newline at end of file
+api = API()
+
+
+def _with_headers(start_response: StartResponse, headers: WSGIFormatHeaders) -> StartResponse:
+    """Wrap a start response routine so every response it starts has some extra headers"""
+    def start(status: str, response_headers: WSGIFormatHeaders,
+              exc_info: Any = None) -> Callable[[bytes], object]:
+        if exc_info is None:
+            return start_response(status, [*response_headers, *headers])
+        return start_response(status, [*response_headers, *headers], exc_info)
+    return start
@@ -0,0 +1,159 @@
+"""
+Work scheduled by routes and middleware to run after their response has been sent
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+from collections.abc import Callable, Iterable, Iterator
+from typing import Literal
+
+from terminus.types import BackgroundTask, Request, RouteError
+
+type OverflowPolicy = Literal["drop", "inline", "block"]
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_QUEUE = 1000
+DEFAULT_DRAIN_TIMEOUT = 10.0
+
+type QueuedTask = tuple[BackgroundTask, Request, int]
+
+
+class BackgroundTaskRunner:
+    """
+    Runs the background tasks of each request on a bounded pool of threads in each worker, once
+    the server has finished sending the response. Each task is called with the finished request and
+    the status code of its response.
+    Arguments:
+        - <workers> The number of threads running tasks
+        - <max_queue> The number of tasks which may wait for a thread before the overflow policy
+          applies
+        - <overflow> What happens to a task when the queue is full:
+            - "drop" The task is discarded and a warning printed
+            - "inline" The task runs on the thread which handled the request
+            - "block" The thread which handled the request waits for space in the queue
+        - <drain_timeout> The number of seconds queued tasks may take to finish when the process
+          exits
+    """
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE,
+                 overflow: OverflowPolicy = "drop",
+                 drain_timeout: float = DEFAULT_DRAIN_TIMEOUT) -> None:
+        if workers < 1:
+            raise RouteError("A background task runner needs at least one worker")
+        self._workers = workers
+        self._max_queue = max_queue
+        self._overflow = overflow
+        self._drain_timeout = drain_timeout
+        self._queue: queue.Queue[QueuedTask | None] = queue.Queue(max_queue)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._closed = False
+        self.dropped = 0
+
+    def after_response(self, body: Iterable[bytes], req: Request, status: int) -> Iterable[bytes]:
+        """
+        Wrap a response body so the tasks of its request are submitted when the server closes it,
+        which happens once the body has been sent
+        """
+        return _ClosingBody(body, lambda: self.submit_all(req, status))
+
+    def submit_all(self, req: Request, status: int) -> None:
+        """Submit every background task of a request"""
+        for task in req.background_tasks:
+            self.submit(task, req, status)
+
+    def submit(self, task: BackgroundTask, req: Request, status: int) -> None:
+        """Queue a task, applying the overflow policy if the queue is full"""
+        if self._closed:
+            self._run(task, req, status)
+            return
+        self._ensure_started()
+        item = (task, req, status)
+        if self._overflow == "block":
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            if self._overflow == "inline":
+                self._run(task, req, status)
+            else:
+                self.dropped += 1
+                print(f"Background task queue is full, dropping task {_task_name(task)} of " +
+                      f"{req.method.value} {req.path}")
+
+    def shutdown(self, timeout: float | None = None) -> bool:
+        """
+        Stop accepting tasks and wait for queued tasks to finish, returning False if they did not
+        finish within <timeout> seconds. Tasks submitted afterwards run immediately on the caller.
+        """
+        with self._lock:
+            self._closed = True
+            threads = self._threads if self._pid == os.getpid() else []
+            for _ in threads:
+                # Each worker exits when it reaches a sentinel, which is queued after every task
+                self._queue.put(None)
+        deadline = time.monotonic() + (self._drain_timeout if timeout is None else timeout)
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in threads)
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is None:
+                atexit.register(self.shutdown)
+            self._queue = queue.Queue(self._max_queue)
+            self._threads = [
+                threading.Thread(target=self._work, name=f"terminus-background-{i}", daemon=True)
+                for i in range(self._workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def _work(self) -> None:
+        task_queue = self._queue
+        while True:
+            item = task_queue.get()
+            if item is None:
+                return
+            self._run(*item)
+
+    @staticmethod
+    def _run(task: BackgroundTask, req: Request, status: int) -> None:
+        try:
+            task(req, status)
+        # A failing task must not stop the thread running it
+        except Exception:  # noqa: BLE001
+            print(f"Background task {_task_name(task)} of {req.method.value} {req.path} failed")
+            traceback.print_exc()
+
+
+class _ClosingBody:
+    """A response body which calls a function once the server has closed it"""
+    def __init__(self, body: Iterable[bytes], on_close: Callable[[], None]) -> None:
+        self._body = body
+        self._on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._body)
+
+    def close(self) -> None:
+        try:
+            close = getattr(self._body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._on_close()
+
+
+def _task_name(task: BackgroundTask) -> str:
+    return getattr(task, "__qualname__", repr(task))
@@ -0,0 +1,315 @@
+"""
+Micro-benchmarks for the request hot path. Synthetic WSGI environs are driven straight through
+API.__call__, so results measure the framework itself with no server or network involved.
+
+Run while in the src folder:
+    python -m terminus.benchmark --save baseline.json
+    python -m terminus.benchmark --compare baseline.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter_ns
+from typing import Any
+from wsgiref.types import WSGIEnvironment
+
+from terminus.api import API, RouteOptions
+from terminus.execution_pipeline import MiddlewareFn
+from terminus.schema import RouteSchema, s
+from terminus.types import ContentType, HTTPMethod, Request
+
+# Relative drop in throughput before a scenario is reported as a regression
+DEFAULT_THRESHOLD = 0.1
+DEFAULT_ITERATIONS = 5000
+# Measuring allocations is slow, so it is done over a smaller sample of requests
+ALLOC_SAMPLE = 200
+
+BASE_ENVIRON: WSGIEnvironment = {
+    "SERVER_NAME": "127.0.0.1",
+    "SERVER_PORT": "80",
+    "SERVER_PROTOCOL": "HTTP/1.1",
+    "HTTP_HOST": "127.0.0.1",
+    "HTTP_ACCEPT": "application/json,text/plain;q=0.9,*/*;q=0.8",
+    "HTTP_ACCEPT_LANGUAGE": "en-US,en;q=0.9",
+    "HTTP_ACCEPT_ENCODING": "gzip, deflate, br",
+    "HTTP_CONNECTION": "keep-alive",
+    "REMOTE_ADDR": "127.0.0.1",
+    "QUERY_STRING": "",
+    "wsgi.url_scheme": "http",
+}
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    setup: Callable[[], API]
+    path: str
+    method: HTTPMethod = HTTPMethod.GET
+    body: bytes | None = None
+    content_type: ContentType = ContentType.APPLICATION_JSON
+
+@dataclass(frozen=True)
+class Result:
+    requests_per_sec: float
+    p50_us: float
+    p90_us: float
+    p99_us: float
+    alloc_peak_bytes: float
+
+def _start_response(status: str, headers: list[tuple[str, str]], exc_info=None) -> None:
+    pass
+
+def _routes_api(route_count: int, parameterised: bool) -> Callable[[], API]:
+    """Build an API with a number of GET routes spread over 100 top level segments"""
+    def setup() -> API:
+        api = API()
+        for i in range(route_count):
+            path = f"/svc{i % 100}/res{i}" + ("/[id]" if parameterised else "")
+            api.get(path)(lambda req: "OK")
+        return api
+    return setup
+
+def _overlapping_api(depth: int) -> Callable[[], API]:
+    """
+    Build an API where each route has a single exact part, and a single path variable, among
+    <depth> parts. Paths of exact parts followed by an unknown part make the matcher try every
+    route before failing.
+    """
+    def setup() -> API:
+        api = API()
+        for i in range(depth):
+            for literal, param in (("a", "[p]"), ("[p]", "a")):
+                parts = [literal if j == i else param for j in range(depth)]
+                api.get("/" + "/".join(parts) + "/end")(lambda req: "OK")
+        api.get("/a/[x]/end")(lambda req: "OK")
+        api.get("/a/b/other")(lambda req: "OK")
+        return api
+    return setup
+
+def _json_api(schema: RouteSchema | None = None, body_type: Any = None) -> Callable[[], API]:
+    def setup() -> API:
+        api = API()
+        opts: RouteOptions = {}
+        if schema is not None:
+            opts["schema"] = schema
+        if body_type is not None:
+            opts["body_type"] = body_type
+
+        @api.post("/ingest", **opts)
+        def ingest(req: Request):
+            return {"received": len(req.body) if isinstance(req.body, list | dict) else 0}
+        return api
+    return setup
+
+def _middleware_api(depth: int) -> Callable[[], API]:
+    """Build an API where requests pass through a number of global and route middleware"""
+    def setup() -> API:
+        api = API()
+
+        def tag(req: Request) -> None:
+            req.context["depth"] = req.context.get("depth", 0) + 1
+
+        for _ in range(depth // 2):
+            api.pre_request(tag)
+        route_middleware: list[MiddlewareFn] = [tag] * (depth - depth // 2)
+
+        @api.get("/users/[id]", pre=route_middleware)
+        def user(req: Request):
+            return {"id": req.params["id"], "depth": req.context.get("depth", 0)}
+        return api
+    return setup
+
+RECORDS_SCHEMA = RouteSchema(body=s.list(elements={
+    "id": s.int(min=0),
+    "name": s.string(max_length=64),
+    "email": s.string(pattern=r"[^@\s]+@[^@\s]+"),
+    "active": s.bool()
+}))
+
+@dataclass
+class Record:
+    id: int
+    name: str
+    email: str
+    active: bool
+
+def _listing_api(records: int, structs: bool) -> Callable[[], API]:
+    """Build an API returning a list of records, either as dictionaries or as structs"""
+    def setup() -> API:
+        api = API()
+        listing: list = [
+            Record(i, f"user{i}", f"user{i}@example.com", i % 2 == 0) for i in range(records)
+        ]
+        if not structs:
+            listing = [vars(record) for record in listing]
+
+        @api.get("/users")
+        def users(req: Request):
+            return listing
+        return api
+    return setup
+
+def _json_body(records: int) -> bytes:
+    return json.dumps([
+        {"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "active": i % 2 == 0}
+        for i in range(records)
+    ]).encode("utf-8")
+
+SCENARIOS = [
+    Scenario("static_10_routes", _routes_api(10, False), "/svc9/res9"),
+    Scenario("static_10000_routes", _routes_api(10_000, False), "/svc99/res9999"),
+    Scenario("param_10_routes", _routes_api(10, True), "/svc9/res9/42"),
+    Scenario("param_10000_routes", _routes_api(10_000, True), "/svc99/res9999/42"),
+    Scenario("not_found_10000_routes", _routes_api(10_000, True), "/wp-admin/includes/setup.php"),
+    Scenario("backtrack_1_part", _overlapping_api(12), "/a/b/end"),
+    Scenario("backtrack_worst_case", _overlapping_api(12), "/a" * 12 + "/miss"),
+    Scenario("json_body_1", _json_api(), "/ingest", HTTPMethod.POST, _json_body(1)),
+    Scenario("json_body_100", _json_api(), "/ingest", HTTPMethod.POST, _json_body(100)),
+    Scenario("json_body_1000", _json_api(), "/ingest", HTTPMethod.POST, _json_body(1000)),
+    Scenario("json_body_100_schema", _json_api(RECORDS_SCHEMA), "/ingest", HTTPMethod.POST,
+             _json_body(100)),
+    Scenario("json_body_1000_schema", _json_api(RECORDS_SCHEMA), "/ingest", HTTPMethod.POST,
+             _json_body(1000)),
+    Scenario("json_body_1000_struct", _json_api(body_type=list[Record]), "/ingest",
+             HTTPMethod.POST, _json_body(1000)),
+    Scenario("json_response_1000", _listing_api(1000, False), "/users"),
+    Scenario("json_response_1000_struct", _listing_api(1000, True), "/users"),
+    Scenario("middleware_0", _middleware_api(0), "/users/42"),
+    Scenario("middleware_4", _middleware_api(4), "/users/42"),
+    Scenario("middleware_16", _middleware_api(16), "/users/42"),
+]
+
+def build_environ(scenario: Scenario) -> WSGIEnvironment:
+    """Build a fresh environ for a single request in a scenario"""
+    environ = dict(BASE_ENVIRON)
+    environ["REQUEST_METHOD"] = scenario.method.value
+    environ["PATH_INFO"] = scenario.path
+    environ["wsgi.input"] = BytesIO(scenario.body or b"")
+    if scenario.body is not None:
+        environ["CONTENT_TYPE"] = scenario.content_type.value
+        environ["CONTENT_LENGTH"] = str(len(scenario.body))
+    return environ
+
+def run_scenario(scenario: Scenario, iterations: int = DEFAULT_ITERATIONS) -> Result:
+    """Measure throughput, latency percentiles and allocations for a scenario"""
+    api = scenario.setup()
+
+    # Environs are built ahead of time so their construction is not measured
+    for environ in [build_environ(scenario) for _ in range(min(iterations, 100))]:
+        api(environ, _start_response)
+
+    environs = [build_environ(scenario) for _ in range(iterations)]
+    latencies: list[int] = []
+    for environ in environs:
+        start = perf_counter_ns()
+        api(environ, _start_response)
+        latencies.append(perf_counter_ns() - start)
+
+    alloc_environs = [build_environ(scenario) for _ in range(min(iterations, ALLOC_SAMPLE))]
+    peaks: list[int] = []
+    tracemalloc.start()
+    try:
+        for environ in alloc_environs:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            api(environ, _start_response)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+    else:
+        p50 = p90 = p99 = latencies[0]
+
+    return Result(
+        requests_per_sec=iterations / (sum(latencies) / 1e9),
+        p50_us=p50 / 1000,
+        p90_us=p90 / 1000,
+        p99_us=p99 / 1000,
+        alloc_peak_bytes=statistics.fmean(peaks)
+    )
+
+def run_all(iterations: int = DEFAULT_ITERATIONS, name_filter: str | None = None
+            ) -> dict[str, Result]:
+    """Run every scenario whose name contains the filter string"""
+    return {
+        scenario.name: run_scenario(scenario, iterations)
+        for scenario in SCENARIOS
+        if name_filter is None or name_filter in scenario.name
+    }
+
+def save_results(results: dict[str, Result], path: Path) -> None:
+    """Store results as a JSON baseline for later comparison"""
+    path.write_text(json.dumps({
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scenarios": {name: asdict(res) for name, res in results.items()}
+    }, indent=2))
+
+def load_results(path: Path) -> dict[str, Result]:
+    """Load results from a JSON baseline"""
+    data = json.loads(path.read_text())
+    return {name: Result(**res) for name, res in data["scenarios"].items()}
+
+def find_regressions(baseline: dict[str, Result], current: dict[str, Result],
+                     threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+    """
+    Compare results with a baseline, returning the names of scenarios where throughput dropped by
+    more than the threshold
+    """
+    return [
+        name for name, res in current.items()
+        if name in baseline
+        and res.requests_per_sec < baseline[name].requests_per_sec * (1 - threshold)
+    ]
+
+def format_results(results: dict[str, Result], baseline: dict[str, Result] | None = None) -> str:
+    """Format results as a table, including the change in throughput against a baseline"""
+    header = f"{'scenario':<22}{'req/s':>12}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}" + \
+             f"{'alloc KiB':>11}"
+    if baseline is not None:
+        header += f"{'vs base':>10}"
+
+    rows = [header]
+    for name, res in results.items():
+        row = f"{name:<22}{res.requests_per_sec:>12,.0f}{res.p50_us:>10.1f}{res.p90_us:>10.1f}" + \
+              f"{res.p99_us:>10.1f}{res.alloc_peak_bytes / 1024:>11.1f}"
+        if baseline is not None and name in baseline:
+            change = res.requests_per_sec / baseline[name].requests_per_sec - 1
+            row += f"{change:>+10.1%}"
+        rows.append(row)
+    return "\n".join(rows)
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Terminus request hot path")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--filter", help="Only run scenarios whose name contains this string")
+    parser.add_argument("--save", type=Path, help="Write the results to a JSON baseline")
+    parser.add_argument("--compare", type=Path, help="Compare the results with a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative drop in throughput that counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_all(args.iterations, args.filter)
+    baseline = load_results(args.compare) if args.compare is not None else None
+    print(format_results(results, baseline))
+
+    if args.save is not None:
+        save_results(results, args.save)
+    if baseline is not None:
+        regressions = find_regressions(baseline, results, args.threshold)
+        if regressions:
+            print("\nRegressions: " + ", ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
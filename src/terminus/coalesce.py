@@ -0,0 +1,103 @@
+"""
+Coalescing of identical concurrent requests, so an expensive route runs once for all of them
+"""
+import threading
+from collections.abc import Hashable, Sequence
+
+from terminus.response import Response, ResponseFields
+from terminus.router import RouteFn
+from terminus.types import HTTPError, Request
+
+DEFAULT_COALESCE_TIMEOUT = 5.0
+
+
+class _Flight:
+    """A running call of a route function, which identical requests wait on"""
+    __slots__ = ("done", "error", "res")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.res: ResponseFields | None = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests to a route within a worker. While one request for a key is
+    running the route function, other requests for the key wait for it and are sent the same
+    encoded response, including any cookies it sets. If the route function raises an exception,
+    the waiting requests raise it as well.
+
+    Requests are identical if they have the same method, path, Accept header and the selected
+    query parameters and headers. Middleware still runs for every request, so authorisation can be
+    checked before a request joins a flight, but responses must not depend on anything outside the
+    key.
+    Arguments:
+        - <query> The query parameters which are part of the key. If left blank, every parameter is.
+        - <headers> The headers which are part of the key
+        - <timeout> The number of seconds a request waits for a running call before it fails with a
+          504 response. Requests never wait past their own deadline.
+    """
+    def __init__(self, query: Sequence[str] | None = None, headers: Sequence[str] = (),
+                 timeout: float = DEFAULT_COALESCE_TIMEOUT) -> None:
+        self._query = query
+        self._headers = headers
+        self._timeout = timeout
+        self._flights: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, fn: RouteFn) -> RouteFn:
+        """Wrap a route function so identical concurrent calls share one result"""
+        def coalesced(req: Request) -> ResponseFields:
+            key = self._key(req)
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+            if leader:
+                return self._lead(fn, req, key, flight)
+            return self._follow(req, flight)
+        return coalesced
+
+    def in_flight(self) -> int:
+        """Get the number of keys with a running call"""
+        return len(self._flights)
+
+    def _lead(self, fn: RouteFn, req: Request, key: Hashable, flight: _Flight) -> ResponseFields:
+        try:
+            # Every request in the flight negotiated the same format, so it is encoded once
+            flight.res = Response.encode(fn(req), req.headers.get("Accept"))
+            return flight.res
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _follow(self, req: Request, flight: _Flight) -> ResponseFields:
+        timeout = self._timeout
+        remaining = req.remaining()
+        if remaining is not None and remaining < timeout:
+            timeout = max(0.0, remaining)
+        if not flight.done.wait(timeout):
+            req.check_deadline()
+            raise HTTPError("Timed out waiting for an identical request", 504)
+        if flight.error is not None:
+            raise flight.error
+        assert flight.res is not None
+        return flight.res
+
+    def _key(self, req: Request) -> Hashable:
+        if self._query is None:
+            query = tuple(sorted((name, _hashable(val)) for name, val in req.query.items()))
+        else:
+            query = tuple(_hashable(req.query.get(name)) for name in self._query)
+        headers = tuple(req.headers.get(name) for name in self._headers)
+        return (req.method, req.path, req.headers.get("Accept"), query, headers)
+
+
+def _hashable(val: str | list[str] | None) -> Hashable:
+    return tuple(val) if isinstance(val, list) else val
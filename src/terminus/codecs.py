@@ -0,0 +1,103 @@
+"""
+Serialisation formats for structured bodies, chosen for responses by the Accept header of the
+request and for requests by their Content-Type header.
+
+JSON and MessagePack are always available. MessagePack uses the msgpack package when it is
+installed, and otherwise a pure Python implementation. CBOR is available when the cbor2 package is
+installed. Other formats can be added with register_codec().
+"""
+import json
+from collections.abc import Callable
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from terminus import messagepack
+from terminus.accept import ACCEPT_CACHE_SIZE, best_match, parse_accept
+from terminus.forms import parse_header_params
+from terminus.structs import encode_json, read_fields
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+@dataclass(frozen=True)
+class Codec:
+    """
+    A serialisation format. <encode> may raise a TypeError for values it cannot represent, or an
+    OverflowError for numbers too large for the format, and <decode> should raise a ValueError for
+    invalid input.
+    """
+    media_type: str
+    encode: Callable[[Any], bytes]
+    decode: Callable[[bytes], Any]
+
+
+JSON_CODEC = Codec("application/json", lambda value: encode_json(value).encode("utf-8"), json.loads)
+
+if msgpack is not None:
+    MSGPACK_CODEC = Codec(
+        "application/msgpack", lambda value: msgpack.packb(value, default=read_fields),
+        msgpack.unpackb
+    )
+else:
+    MSGPACK_CODEC = Codec("application/msgpack", messagepack.packb, messagepack.unpackb)
+
+_codecs: dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec, *aliases: str) -> None:
+    """Make a format available for negotiation, optionally under other media types as well"""
+    for media_type in (codec.media_type, *aliases):
+        _codecs[media_type.lower()] = codec
+    _negotiate.cache_clear()
+
+
+def get_codec(content_type: str) -> Codec | None:
+    """Get the codec of a Content-Type header, if there is one"""
+    return _codecs.get(parse_header_params(content_type)[0])
+
+
+def negotiate(accept: str | None) -> Codec:
+    """
+    Choose the codec for a response from an Accept header. Each format takes the quality of the
+    most specific media range matching it, and ties, wildcards or a header that accepts no available
+    format fall back to JSON.
+    """
+    if not accept:
+        return JSON_CODEC
+    return _negotiate(accept)
+
+
+@lru_cache(maxsize=ACCEPT_CACHE_SIZE)
+def _negotiate(accept: str) -> Codec:
+    # JSON is registered first, so it wins ties
+    media_type = best_match(parse_accept(accept), list(_codecs))
+    return JSON_CODEC if media_type is None else _codecs[media_type]
+
+
+register_codec(JSON_CODEC)
+register_codec(MSGPACK_CODEC, "application/x-msgpack", "application/vnd.msgpack")
+if cbor2 is not None:
+    def _cbor_loads(raw: bytes) -> Any:
+        # Decode errors of cbor2 are not ValueErrors, so they are converted to keep to the Codec
+        # contract
+        try:
+            return cbor2.loads(raw)
+        except cbor2.CBORDecodeError as e:
+            raise ValueError(str(e)) from e
+
+    register_codec(Codec(
+        "application/cbor",
+        lambda value: cbor2.dumps(
+            value, default=lambda encoder, obj: encoder.encode(read_fields(obj))
+        ),
+        _cbor_loads
+    ))
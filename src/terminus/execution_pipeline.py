@@ -1,7 +1,8 @@
 from collections.abc import Callable
 
-from terminus.router import RouteFn
+from terminus.router import RouteDetails, RouteFn
 from terminus.types import Request, RouteFnRes
+from terminus.watchdog import SlowRequestWatchdog
 
 type MiddlewareFnRes = RouteFnRes | None
 type MiddlewareFn = Callable[[Request], MiddlewareFnRes]
@@ -9,9 +10,10 @@ type MiddlewareFn = Callable[[Request], MiddlewareFnRes]
 type AfterWareFn = Callable[[Request], None]
 
 class ExecutionPipeline:
-    def __init__(self) -> None:
+    def __init__(self, watchdog: SlowRequestWatchdog | None = None) -> None:
         self._before_fn: list[MiddlewareFn] = []
         self._after_fn: list[AfterWareFn] = []
+        self._watchdog = watchdog
     
     def add_before_main_fn(self, fn: MiddlewareFn) -> None:
         """
@@ -25,25 +27,37 @@ class ExecutionPipeline:
         """
         self._after_fn.append(fn)
         
-    def execute(self, fn: RouteFn, req: Request) -> RouteFnRes:
+    def execute(self, route_details: RouteDetails, req: Request) -> RouteFnRes:
         """
         Execute the request-response pipeline with middleware and the core route function.
         """
-        composed = ExecutionPipeline.compose_middleware(fn, self._before_fn, self._after_fn)
-        return composed(req)
+        composed = ExecutionPipeline.compose_middleware(
+            route_details.fn, self._before_fn, self._after_fn
+        )
+        if self._watchdog is None:
+            return composed(req)
+        
+        self._watchdog.start(req, route_details.raw_path)
+        try:
+            return composed(req)
+        finally:
+            self._watchdog.finish()
         
     @staticmethod
     def compose_middleware(fn: RouteFn, pre_fn: list[MiddlewareFn] | None,
                            post_fn: list[AfterWareFn] | None) -> RouteFn:
         """
-        Take middleware and a primary function and fuse it into a single executable function
+        Take middleware and a primary function and fuse it into a single executable function. Once
+        the deadline of the request passes, no further middleware or route function is started.
         """
         def composed(req: Request):
             if pre_fn is not None:
                 for middleware in pre_fn:
+                    req.check_deadline()
                     middleware_res = middleware(req)
                     if middleware_res is not None:
                         return middleware_res
+            req.check_deadline()
             fn_res = fn(req)
             if post_fn is not None:
                 for middleware in post_fn:
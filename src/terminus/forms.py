@@ -0,0 +1,243 @@
+"""
+Parsing of form bodies and of header values carrying parameters, such as Content-Type
+"""
+import re
+from dataclasses import dataclass
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any
+from urllib.parse import parse_qs
+
+from terminus.streams import READ_CHUNK_SIZE, iter_chunks
+from terminus.types import HTTPError
+
+type FormBody = dict[str, Any]
+
+# Uploaded files are held in memory up to this size, then moved to a temporary file on disk
+SPOOL_MAX_MEMORY = 1024 * 1024
+# Fields which are not files are always held in memory, so their size is limited
+MAX_FIELD_SIZE = 1024 * 1024
+MAX_PART_HEADERS_SIZE = 16 * 1024
+# Many small parts would each stay below the limits above, so a body as a whole is limited too
+MAX_PARTS = 1000
+MAX_FORM_MEMORY = 16 * 1024 * 1024
+
+_PARAM_RE = re.compile(r';\s*([^\s;=]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+_QUOTED_PAIR_RE = re.compile(r"\\(.)")
+
+
+@dataclass(frozen=True)
+class UploadedFile:
+    """A file part of a multipart body. The file is positioned at the start of its content."""
+    name: str
+    filename: str
+    content_type: str
+    size: int
+    file: IO[bytes]
+
+    def read(self) -> bytes:
+        return self.file.read()
+
+
+def parse_header_params(value: str) -> tuple[str, dict[str, str]]:
+    """
+    Split a header value such as 'multipart/form-data; boundary="abc"' into its lowercased main
+    value and its parameters. Parameter names are lowercased and quoted values are unquoted.
+    """
+    main, _, rest = value.partition(";")
+    params: dict[str, str] = {}
+    for match in _PARAM_RE.finditer(";" + rest):
+        key, val = match.group(1).lower(), match.group(2).strip()
+        if len(val) >= 2 and val[0] == val[-1] == '"':
+            val = _QUOTED_PAIR_RE.sub(r"\1", val[1:-1])
+        params[key] = val
+    return main.strip().lower(), params
+
+
+def add_field(form: FormBody, name: str, value: Any) -> None:
+    """Add a value to a form, collecting repeated names into a list"""
+    if name not in form:
+        form[name] = value
+    elif isinstance(form[name], list):
+        form[name].append(value)
+    else:
+        form[name] = [form[name], value]
+
+
+def parse_urlencoded(raw: bytes, charset: str = "utf-8") -> FormBody:
+    """Parse an application/x-www-form-urlencoded body"""
+    try:
+        parsed = parse_qs(raw.decode(charset), keep_blank_values=True, encoding=charset)
+    except (UnicodeDecodeError, LookupError) as e:
+        raise HTTPError(f"Form body could not be decoded: {e}")
+    return {key: val[0] if len(val) == 1 else val for key, val in parsed.items()}
+
+
+class MultipartParser:
+    """
+    An incremental multipart/form-data parser. The body is read from the input stream in chunks,
+    and each part is written out as soon as it is known not to contain the boundary, so memory use
+    is bounded by the chunk size and the in memory limits of fields and files.
+    Arguments:
+        - <boundary> The boundary parameter of the Content-Type header
+        - <spool_max_memory> The size above which an uploaded file is moved to disk
+        - <max_field_size> The largest size allowed for a field which is not a file
+        - <max_parts> The largest number of parts allowed in a body
+        - <max_memory> The largest number of bytes of fields and files held in memory at once
+          for a body. Files which have been moved to disk do not count towards it.
+    """
+    def __init__(self, boundary: str, spool_max_memory: int = SPOOL_MAX_MEMORY,
+                 max_field_size: int = MAX_FIELD_SIZE, max_parts: int = MAX_PARTS,
+                 max_memory: int = MAX_FORM_MEMORY) -> None:
+        if not 0 < len(boundary) <= 70:
+            raise HTTPError("Multipart boundary must be between 1 and 70 characters")
+        self._delimiter = b"\r\n--" + boundary.encode("latin-1")
+        self._spool_max_memory = spool_max_memory
+        self._max_field_size = max_field_size
+        self._max_parts = max_parts
+        self._max_memory = max_memory
+
+    def parse(self, stream: IO[bytes], content_len: int | None,
+              charset: str = "utf-8") -> FormBody:
+        """Parse a multipart body of <content_len> bytes, or of unknown length, from a stream"""
+        form: FormBody = {}
+        chunks = iter_chunks(stream, content_len, READ_CHUNK_SIZE)
+        # The first delimiter has no preceding line break, so one is added to match it the same way
+        buffer = bytearray(b"\r\n")
+        delimiter = self._delimiter
+        sink: _PartSink | None = None
+        state = "preamble"
+
+        # The bytes held in memory by finished parts, and the number of parts started
+        memory = 0
+        parts = 0
+        try:
+            while True:
+                if state in ("preamble", "body"):
+                    idx = buffer.find(delimiter)
+                    # The delimiter must be followed by '--' or a line break, so two bytes are
+                    # needed
+                    if idx != -1 and len(buffer) >= idx + len(delimiter) + 2:
+                        if sink is not None:
+                            sink.write(buffer[:idx])
+                            memory += sink.in_memory
+                            self._check_memory(memory)
+                            add_field(form, sink.name, sink.finish(charset))
+                            sink = None
+                        after = buffer[idx + len(delimiter):idx + len(delimiter) + 2]
+                        del buffer[:idx + len(delimiter) + 2]
+                        if after == b"--":
+                            return form
+                        if after != b"\r\n":
+                            raise HTTPError("Malformed multipart body: invalid boundary line")
+                        state = "headers"
+                        continue
+                    if idx == -1 and len(buffer) > len(delimiter) + 1:
+                        # Anything before the final bytes cannot be part of a delimiter
+                        keep = len(buffer) - len(delimiter) - 1
+                        if sink is not None:
+                            sink.write(buffer[:keep])
+                            self._check_memory(memory + sink.in_memory)
+                        del buffer[:keep]
+                else:
+                    idx = buffer.find(b"\r\n\r\n")
+                    if idx != -1:
+                        parts += 1
+                        if parts > self._max_parts:
+                            raise HTTPError(f"Multipart body has more than {self._max_parts} " +
+                                            "parts", 413)
+                        sink = self._start_part(bytes(buffer[:idx]))
+                        del buffer[:idx + 4]
+                        state = "body"
+                        continue
+                    if len(buffer) > MAX_PART_HEADERS_SIZE:
+                        raise HTTPError("Malformed multipart body: part headers are too large")
+
+                chunk = next(chunks, b"")
+                if not chunk:
+                    raise HTTPError("Malformed multipart body: missing closing boundary")
+                buffer += chunk
+        except BaseException:
+            # Files already collected are released, as the route will never receive them
+            if sink is not None:
+                sink.discard()
+            _close_files(form)
+            raise
+
+    def _check_memory(self, memory: int) -> None:
+        if memory > self._max_memory:
+            raise HTTPError(f"Multipart body holds more than {self._max_memory} bytes in memory",
+                            413)
+
+    def _start_part(self, raw_headers: bytes) -> "_PartSink":
+        headers: dict[str, str] = {}
+        for line in raw_headers.decode("utf-8", "replace").split("\r\n"):
+            key, sep, val = line.partition(":")
+            if not sep:
+                raise HTTPError("Malformed multipart body: invalid part header")
+            headers[key.strip().lower()] = val.strip()
+
+        disposition, params = parse_header_params(headers.get("content-disposition", ""))
+        if disposition != "form-data" or "name" not in params:
+            raise HTTPError("Multipart parts must have a form-data disposition with a name")
+        if "filename" in params:
+            return _PartSink(
+                params["name"], self._spool_max_memory, None, params["filename"],
+                headers.get("content-type", "application/octet-stream")
+            )
+        return _PartSink(params["name"], None, self._max_field_size, None, None)
+
+
+class _PartSink:
+    """Collects the content of one part, either as a field in memory or as a spooled file"""
+    def __init__(self, name: str, spool_max_memory: int | None, max_size: int | None,
+                 filename: str | None, content_type: str | None) -> None:
+        self.name = name
+        self._max_size = max_size
+        self._filename = filename
+        self._content_type = content_type
+        self._size = 0
+        self._spool_max_memory = spool_max_memory or 0
+        self._data = bytearray()
+        self._file: SpooledTemporaryFile[bytes] | None = None
+        if spool_max_memory is not None:
+            # The file is handed to the route in the parsed body, so it outlives this object
+            self._file = SpooledTemporaryFile(max_size=spool_max_memory)  # noqa: SIM115
+
+    def write(self, data: bytearray) -> None:
+        self._size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        if self._max_size is not None and self._size > self._max_size:
+            raise HTTPError(f"Form field '{self.name}' is larger than {self._max_size} bytes",
+                            413)
+        self._data += data
+
+    def finish(self, charset: str) -> str | UploadedFile:
+        if self._file is None:
+            try:
+                return self._data.decode(charset)
+            except (UnicodeDecodeError, LookupError) as e:
+                raise HTTPError(f"Form field '{self.name}' could not be decoded: {e}")
+        self._file.seek(0)
+        assert self._filename is not None and self._content_type is not None
+        return UploadedFile(self.name, self._filename, self._content_type, self._size, self._file)
+
+    @property
+    def in_memory(self) -> int:
+        """The number of bytes of the part held in memory, which is none once a file is on disk"""
+        if self._file is not None and self._size > self._spool_max_memory:
+            return 0
+        return self._size
+
+    def discard(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+
+def _close_files(form: FormBody) -> None:
+    """Close the uploaded files of a form"""
+    for value in form.values():
+        for item in value if isinstance(value, list) else [value]:
+            if isinstance(item, UploadedFile):
+                item.file.close()
@@ -0,0 +1,225 @@
+"""
+Idempotency keys, so a client retrying a request is sent the response to the first attempt rather
+than having the route run again
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import replace
+from pathlib import Path
+
+from terminus.response import Response, ResponseFields
+from terminus.router import RouteFn
+from terminus.types import HTTPError, Request, RouteFnRes
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+# Keys are generated by clients, so their length is limited to bound the size of the store
+MAX_KEY_LENGTH = 255
+# Responses are kept for a day by default, longer than clients keep retrying
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_WAIT_TIMEOUT = 10.0
+# How often a request checks whether the request holding its key has finished
+POLL_INTERVAL = 0.02
+
+
+class IdempotencyStore:
+    """
+    Encoded responses by idempotency key, kept in a local SQLite database so every worker process
+    on a machine shares them. A key is claimed by the first request to use it, and holds its
+    response once that request finishes.
+    Arguments:
+        - <path> The file of the database
+        - <lock_timeout> The number of seconds after which a claim whose request never finished is
+          given to another request, if the worker process holding it has exited. Claims of running
+          workers are never taken over, however long their request runs.
+    """
+    def __init__(self, path: str | Path, lock_timeout: float = 60.0) -> None:
+        self._path = str(path)
+        self._lock_timeout = lock_timeout
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, "
+            + "owner INTEGER, status TEXT, content_type TEXT, content_length INTEGER, "
+            + "headers TEXT, body BLOB)"
+        )
+        self.purge()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection of this thread, opening a new one in a forked process"""
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def claim(self, key: str) -> tuple[bool, ResponseFields | None]:
+        """
+        Claim a key for a request, returning whether it was claimed and the stored response if
+        the key has one. A key held by a running request is neither.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("DELETE FROM responses WHERE key = ? AND expires <= ? AND status IS NOT NULL",
+                     (key, now))
+        self._free_abandoned(conn, now, key)
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO responses (key, expires, owner) VALUES (?, ?, ?)",
+            (key, now + self._lock_timeout, os.getpid())
+        ).rowcount
+        if inserted:
+            return True, None
+        row = conn.execute(
+            "SELECT status, content_type, content_length, headers, body FROM responses "
+            + "WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return False, None
+        status, content_type, content_length, headers, body = row
+        extra_headers = [(name, val) for name, val in json.loads(headers)]
+        return False, ResponseFields(status, body, content_type, extra_headers, content_length)
+
+    def complete(self, key: str, res: ResponseFields, ttl: float) -> None:
+        """Store the response to the request holding a key"""
+        self._connection().execute(
+            "UPDATE responses SET expires = ?, status = ?, content_type = ?, content_length = ?, "
+            + "headers = ?, body = ? WHERE key = ?",
+            (time.time() + ttl, res.status, res.content_type, res.content_length,
+             json.dumps(res.extra_headers), res.body, key)
+        )
+
+    def release(self, key: str) -> None:
+        """Give up the claim on a key without a response, so a retry runs the route again"""
+        self._connection().execute(
+            "DELETE FROM responses WHERE key = ? AND status IS NULL", (key,)
+        )
+
+    def purge(self) -> None:
+        """Delete every expired response and abandoned claim"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("DELETE FROM responses WHERE expires <= ? AND status IS NOT NULL", (now,))
+        self._free_abandoned(conn, now)
+
+    @staticmethod
+    def _free_abandoned(conn: sqlite3.Connection, now: float, key: str | None = None) -> None:
+        """Delete the expired claims, of one key or of all of them, whose worker has exited"""
+        query = "SELECT key, owner FROM responses WHERE expires <= ? AND status IS NULL"
+        params: tuple = (now,)
+        if key is not None:
+            query += " AND key = ?"
+            params = (now, key)
+        for claimed_key, owner in conn.execute(query, params).fetchall():
+            if not _is_running(owner):
+                # Conditional on the owner, so a claim taken over meanwhile is left alone
+                conn.execute("DELETE FROM responses WHERE key = ? AND owner = ? AND status IS NULL",
+                             (claimed_key, owner))
+
+
+def _is_running(pid: int) -> bool:
+    """Whether a process is running, so the claims it holds belong to requests still in progress"""
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # Signals cannot probe a process on Windows, where they terminate it instead, so claims
+        # are taken over once they expire
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # The process exists, but belongs to another user
+        pass
+    return True
+
+
+class Idempotency:
+    """
+    Makes a route idempotent for requests with an Idempotency-Key header. The first request with a
+    key runs the route function, and its encoded response is stored. Retries are sent the stored
+    response, with an Idempotent-Replayed header, without the route function running again, while
+    duplicates arriving before the first request finishes wait for it.
+
+    Middleware still runs for every request, so headers it adds, such as CORS headers, are built
+    again for each retry rather than stored. Headers the route function adds with
+    req.add_response_header are stored with the response, but those afterware adds to the first
+    request, such as the cookie of a session the route created, are not replayed. Responses with a
+    5xx status and errors raised by the route function are not stored, so the request can be
+    retried. Keys are scoped to the method, path and selected headers of a request, so one client
+    cannot be sent the response of another.
+    Arguments:
+        - <store> Where responses are kept
+        - <ttl> The number of seconds a response is kept for
+        - <timeout> The number of seconds a duplicate waits for the first request before failing
+          with a 409 response. Requests never wait past their own deadline.
+        - <headers> The headers which are part of the key, identifying the client
+    """
+    def __init__(self, store: IdempotencyStore, ttl: float = DEFAULT_TTL,
+                 timeout: float = DEFAULT_WAIT_TIMEOUT,
+                 headers: Sequence[str] = ("Authorization",)) -> None:
+        self._store = store
+        self._ttl = ttl
+        self._timeout = timeout
+        self._headers = headers
+
+    def wrap(self, fn: RouteFn) -> RouteFn:
+        """Wrap a route function so requests repeating an idempotency key replay its response"""
+        def idempotent(req: Request) -> RouteFnRes:
+            idempotency_key = req.headers.get(IDEMPOTENCY_KEY_HEADER)
+            if idempotency_key is None:
+                return fn(req)
+            if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+                raise HTTPError(f"{IDEMPOTENCY_KEY_HEADER} must be between 1 and "
+                                + f"{MAX_KEY_LENGTH} characters")
+
+            key = self._key(req, idempotency_key)
+            stored = self._wait_for_claim(req, key)
+            if stored is not None:
+                req.add_response_header("Idempotent-Replayed", "true")
+                return stored
+            added_before = len(req.response_headers)
+            try:
+                res = Response.encode(fn(req), req.headers.get("Accept"))
+            except BaseException:
+                self._store.release(key)
+                raise
+            added = req.response_headers[added_before:]
+            if added:
+                # Headers the route function added are stored as part of its response, and are
+                # taken out of the request so the first response does not send them twice
+                del req.response_headers[added_before:]
+                res = replace(res, extra_headers=[*res.extra_headers, *added])
+            if res.status.startswith("5"):
+                self._store.release(key)
+            else:
+                self._store.complete(key, res, self._ttl)
+            return res
+        return idempotent
+
+    def _wait_for_claim(self, req: Request, key: str) -> ResponseFields | None:
+        """Claim a key, or get the stored response once the request holding it has finished"""
+        give_up = time.monotonic() + self._timeout
+        if req.deadline is not None:
+            give_up = min(give_up, req.deadline)
+        while True:
+            claimed, stored = self._store.claim(key)
+            if claimed:
+                return None
+            if stored is not None:
+                return stored
+            if time.monotonic() >= give_up:
+                req.check_deadline()
+                raise HTTPError("A request with this idempotency key is still in progress", 409)
+            time.sleep(POLL_INTERVAL)
+
+    def _key(self, req: Request, idempotency_key: str) -> str:
+        scope = [req.method.value, req.path, idempotency_key,
+                 *(req.headers.get(name) or "" for name in self._headers)]
+        return hashlib.sha256("\n".join(scope).encode("utf-8")).hexdigest()
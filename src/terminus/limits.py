@@ -0,0 +1,168 @@
+"""
+Limits on the number of requests handled at once, per route and across the API
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from terminus.router import RouteDetails
+from terminus.types import RouteError
+
+DEFAULT_QUEUE_TIMEOUT = 0.1
+DEFAULT_RETRY_AFTER = 1
+
+
+@dataclass(frozen=True)
+class LimitStats:
+    method: str
+    route: str
+    limit: int | None
+    in_flight: int
+    queued: int
+    shed: int
+
+
+class _Gate:
+    """Admits up to <limit> holders at once, with up to <queue_size> callers waiting for a turn"""
+    def __init__(self, limit: int | None, queue_size: int) -> None:
+        self.limit = limit
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self.queued = 0
+        self.shed = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def acquire(self, deadline: float) -> bool:
+        with self._cond:
+            if self.limit is None or self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            if self.queued >= self.queue_size:
+                self.shed += 1
+                return False
+            self.queued += 1
+            try:
+                admitted = self._cond.wait_for(
+                    lambda: self.in_flight < self.limit, deadline - time.monotonic()
+                )
+            finally:
+                self.queued -= 1
+            if not admitted:
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class ConcurrencyLimiter:
+    """
+    Limits the requests each worker handles at once, both for individual routes and across the
+    whole API, so a slow downstream holding up one route cannot take every thread. Per route limits
+    are given with the max_in_flight route option. A request over a limit waits in a short queue
+    for a turn, and if the queue is full or the wait times out, it is shed with a 503 response and a
+    Retry-After header.
+    Arguments:
+        - <max_in_flight> The number of requests to any route which may be handled at once
+        - <queue_size> The number of requests which may wait for each limit
+        - <queue_timeout> The number of seconds a request may wait before it is shed
+        - <retry_after> The number of seconds clients are told to wait before retrying
+    """
+    def __init__(self, max_in_flight: int | None = None, queue_size: int = 0,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+                 retry_after: int = DEFAULT_RETRY_AFTER) -> None:
+        if max_in_flight is not None and max_in_flight < 1:
+            raise RouteError("A concurrency limit must be at least 1")
+        self.retry_after = retry_after
+        self._queue_size = queue_size
+        self._queue_timeout = queue_timeout
+        self._global = _Gate(max_in_flight, queue_size)
+        self._routes: list[tuple[str, str]] = []
+        self._gates: list[_Gate | None] = []
+        self._exempt: list[bool] = []
+
+    def add_route(self, details: RouteDetails, max_in_flight: int | None = None,
+                  exempt: bool = False) -> None:
+        """
+        Set the limit of a newly registered route. Exempt routes, such as the metrics route, are
+        not counted towards the global limit.
+        """
+        if details.route_id != len(self._routes):
+            raise RouteError("A concurrency limiter can only be attached to a single API")
+        if max_in_flight is not None and max_in_flight < 1:
+            raise RouteError(f"The concurrency limit of route '{details.raw_path}' must be at " +
+                             "least 1")
+        self._routes.append((details.method.value, details.raw_path))
+        self._gates.append(None if max_in_flight is None else _Gate(max_in_flight,
+                                                                    self._queue_size))
+        self._exempt.append(exempt)
+
+    def acquire(self, details: RouteDetails, deadline: float | None = None) -> bool:
+        """
+        Admit a request to a route, waiting in a queue if it is over a limit. False is returned if
+        the request should be shed, otherwise release() must be called once it is handled. A
+        request never waits past its own <deadline>.
+        """
+        queue_deadline = time.monotonic() + self._queue_timeout
+        if deadline is None or queue_deadline < deadline:
+            deadline = queue_deadline
+        gate = self._gates[details.route_id]
+        # The route limit is taken first, so requests queued on a slow route hold no global slot
+        if gate is not None and not gate.acquire(deadline):
+            return False
+        if not self._exempt[details.route_id] and not self._global.acquire(deadline):
+            if gate is not None:
+                gate.release()
+            return False
+        return True
+
+    def release(self, details: RouteDetails) -> None:
+        """Mark an admitted request as handled"""
+        if not self._exempt[details.route_id]:
+            self._global.release()
+        gate = self._gates[details.route_id]
+        if gate is not None:
+            gate.release()
+
+    def stats(self) -> list[LimitStats]:
+        """Get the state of the global limit followed by that of each limited route"""
+        stats = [LimitStats("*", "*", self._global.limit, self._global.in_flight,
+                            self._global.queued, self._global.shed)]
+        for (method, route), gate in zip(self._routes, self._gates, strict=True):
+            if gate is not None:
+                stats.append(LimitStats(method, route, gate.limit, gate.in_flight, gate.queued,
+                                        gate.shed))
+        return stats
+
+    def render(self) -> str:
+        """
+        Render the queue depth and shed count of each limit in the Prometheus text exposition
+        format. These are kept per worker process, so they are labelled with its pid.
+        """
+        stats = self.stats()
+        labels = [_labels(s) for s in stats]
+        lines = [
+            "# HELP terminus_limit_queued Requests waiting for a concurrency limit",
+            "# TYPE terminus_limit_queued gauge"
+        ]
+        lines += [f"terminus_limit_queued{{{label}}} {s.queued}" for s, label in zip(
+            stats, labels, strict=True
+        )]
+        lines += [
+            "# HELP terminus_limit_shed_total Requests shed by a concurrency limit",
+            "# TYPE terminus_limit_shed_total counter"
+        ]
+        lines += [f"terminus_limit_shed_total{{{label}}} {s.shed}" for s, label in zip(
+            stats, labels, strict=True
+        )]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(stats: LimitStats) -> str:
+    route = stats.route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{stats.method}",route="{route}",pid="{os.getpid()}"'
@@ -0,0 +1,342 @@
+"""
+End-to-end load testing against a locally spawned server. An app is started under gunicorn, or a
+threaded wsgiref server if gunicorn is not installed, and driven over keep-alive connections by a
+concurrent asyncio client.
+
+Run while in the src folder:
+    python -m terminus.loadtest --concurrency 64 --duration 10 --workers 4 --threads 8
+    python -m terminus.loadtest --app my_app:api --request "GET /users/42" --request "3*GET /"
+"""
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from terminus.api import API
+from terminus.types import Request
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+SERVER_START_TIMEOUT = 10
+DEFAULT_APP = "terminus.loadtest:demo_api"
+
+demo_api = API()
+
+@demo_api.get("/hello")
+def _hello(req: Request):
+    return "Hello World"
+
+@demo_api.get("/users/[id]")
+def _user(req: Request):
+    return {"id": req.params["id"], "name": "Ada", "roles": ["admin", "dev"]}
+
+@demo_api.post("/echo")
+def _echo(req: Request):
+    return req.body
+
+@dataclass(frozen=True)
+class LoadRequest:
+    method: str
+    path: str
+    body: bytes | None = None
+    content_type: str = "application/json"
+    weight: float = 1
+
+    def encode(self, host: str) -> bytes:
+        """Encode the request as raw HTTP/1.1 bytes"""
+        # Terminus requires these headers to build a request
+        lines = [
+            f"{self.method} {self.path} HTTP/1.1",
+            f"Host: {host}",
+            "Accept: application/json,text/plain;q=0.9,*/*;q=0.8",
+            "Accept-Language: en-US,en;q=0.9",
+            "Accept-Encoding: gzip, deflate",
+            "Connection: keep-alive"
+        ]
+        if self.body is not None:
+            lines.append(f"Content-Type: {self.content_type}")
+            lines.append(f"Content-Length: {len(self.body)}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + (self.body or b"")
+
+    @staticmethod
+    def parse(spec: str) -> "LoadRequest":
+        """Parse a request of the form '[WEIGHT*]METHOD PATH'"""
+        weight = 1.0
+        if "*" in spec.split(" ", 1)[0]:
+            weight_str, spec = spec.split("*", 1)
+            weight = float(weight_str)
+        method, path = spec.split()
+        return LoadRequest(method.upper(), path, weight=weight)
+
+@dataclass
+class LoadStats:
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter[int] = field(default_factory=Counter)
+    connection_errors: int = 0
+    connections: int = 0
+
+@dataclass(frozen=True)
+class LoadReport:
+    requests: int
+    duration: float
+    throughput: float
+    error_rate: float
+    statuses: dict[int, int]
+    connection_errors: int
+    connections: int
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    histogram: list[int]
+
+    @staticmethod
+    def of(stats: LoadStats, duration: float) -> "LoadReport":
+        latencies_ms = sorted(lat * 1000 for lat in stats.latencies)
+        if len(latencies_ms) >= 2:
+            percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+            p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+        else:
+            p50 = p90 = p99 = latencies_ms[0] if latencies_ms else 0.0
+
+        histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for lat in latencies_ms:
+            histogram[bisect_left(LATENCY_BUCKETS_MS, lat)] += 1
+
+        requests = len(latencies_ms)
+        # Server errors and failed connections both count as errors
+        failures = stats.connection_errors + sum(
+            count for status, count in stats.statuses.items() if status >= 500
+        )
+        attempts = requests + stats.connection_errors
+        return LoadReport(
+            requests=requests,
+            duration=duration,
+            throughput=requests / duration if duration > 0 else 0.0,
+            error_rate=failures / attempts if attempts > 0 else 0.0,
+            statuses=dict(sorted(stats.statuses.items())),
+            connection_errors=stats.connection_errors,
+            connections=stats.connections,
+            p50_ms=p50,
+            p90_ms=p90,
+            p99_ms=p99,
+            max_ms=latencies_ms[-1] if latencies_ms else 0.0,
+            histogram=histogram
+        )
+
+    def format(self) -> str:
+        """Format the report as human readable text"""
+        rows = [
+            f"Requests:     {self.requests} in {self.duration:.2f}s over {self.connections} "
+            + "connections",
+            f"Throughput:   {self.throughput:,.0f} req/s",
+            f"Error rate:   {self.error_rate:.2%} ({self.connection_errors} connection errors)",
+            "Statuses:     " + ", ".join(f"{k}={v}" for k, v in self.statuses.items()),
+            f"Latency (ms): p50={self.p50_ms:.2f} p90={self.p90_ms:.2f} p99={self.p99_ms:.2f} "
+            + f"max={self.max_ms:.2f}",
+            "Histogram (ms):"
+        ]
+        peak = max(self.histogram, default=0) or 1
+        bounds = [f"<= {b:g}" for b in LATENCY_BUCKETS_MS] + [f" > {LATENCY_BUCKETS_MS[-1]:g}"]
+        for bound, count in zip(bounds, self.histogram, strict=True):
+            rows.append(f"  {bound:>8} {count:>9} " + "#" * round(40 * count / peak))
+        return "\n".join(rows)
+
+async def _read_response(reader: asyncio.StreamReader, method: str) -> tuple[int, bool]:
+    """Read one response, returning its status and whether the connection can be reused"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Connection closed by server")
+    version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+
+    headers: dict[str, str] = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        key, _, val = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = val.strip()
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if method == "HEAD":
+        pass
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        while (size := int((await reader.readline()).split(b";")[0], 16)) > 0:
+            await reader.readexactly(size + 2)
+        # Skip trailers
+        while await reader.readline() not in (b"\r\n", b"\n", b""):
+            pass
+    else:
+        await reader.read()
+        keep_alive = False
+    return int(status), keep_alive
+
+async def _client(host: str, port: int, mix: list[LoadRequest], until: float, stats: LoadStats,
+                  rng: random.Random) -> None:
+    """Send requests over a single connection until a deadline, reconnecting when needed"""
+    encoded = [req.encode(host) for req in mix]
+    weights = [req.weight for req in mix]
+    writer: asyncio.StreamWriter | None = None
+    while time.perf_counter() < until:
+        i = rng.choices(range(len(mix)), weights)[0]
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+                stats.connections += 1
+            start = time.perf_counter()
+            writer.write(encoded[i])
+            await writer.drain()
+            status, keep_alive = await _read_response(reader, mix[i].method)
+            stats.latencies.append(time.perf_counter() - start)
+            stats.statuses[status] += 1
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            stats.connection_errors += 1
+            keep_alive = False
+        if not keep_alive and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+async def _drive(host: str, port: int, mix: list[LoadRequest], concurrency: int,
+                 duration: float, seed: int) -> LoadStats:
+    stats = LoadStats()
+    until = time.perf_counter() + duration
+    await asyncio.gather(*(
+        _client(host, port, mix, until, stats, random.Random(seed + i))
+        for i in range(concurrency)
+    ))
+    return stats
+
+def run_load(host: str, port: int, mix: list[LoadRequest], concurrency: int = 16,
+             duration: float = 10, warmup: float = 1, seed: int = 0) -> LoadReport:
+    """Drive a running server with concurrent keep-alive connections and report the results"""
+    if warmup > 0:
+        asyncio.run(_drive(host, port, mix, concurrency, warmup, seed))
+    start = time.perf_counter()
+    stats = asyncio.run(_drive(host, port, mix, concurrency, duration, seed))
+    return LoadReport.of(stats, time.perf_counter() - start)
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+def serve_stdlib(app: str, host: str, port: int) -> None:
+    """Serve an app with the threaded wsgiref fallback server until interrupted"""
+    module_name, attr = app.split(":")
+    wsgi_app = getattr(importlib.import_module(module_name), attr)
+    with make_server(host, port, wsgi_app, _ThreadingWSGIServer, _QuietHandler) as server:
+        server.serve_forever()
+
+def find_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def spawn_server(app: str, port: int, workers: int = 1, threads: int = 1,
+                 server: str = "auto") -> subprocess.Popen:
+    """
+    Start an app in a subprocess on a local port, waiting until it accepts connections.
+    The server can be "gunicorn", "stdlib" or "auto" to use gunicorn when it is installed.
+    """
+    if server == "auto":
+        server = "gunicorn" if importlib.util.find_spec("gunicorn") is not None else "stdlib"
+
+    if server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-w", str(workers), "--threads", str(threads),
+               "-b", f"127.0.0.1:{port}", "--log-level", "warning", app]
+    else:
+        cmd = [sys.executable, "-m", "terminus.loadtest", "--serve", "--app", app,
+               "--port", str(port)]
+
+    # Apps are importable from the src folder regardless of where the harness is run from
+    env = dict(os.environ)
+    src_dir = str(Path(__file__).resolve().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src_dir, env.get("PYTHONPATH")]))
+    proc = subprocess.Popen(cmd, env=env)
+
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode} before accepting " +
+                               "connections")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.terminate()
+    raise RuntimeError(f"Server did not accept connections within {SERVER_START_TIMEOUT}s")
+
+def _load_mix(args: argparse.Namespace) -> list[LoadRequest]:
+    mix = [LoadRequest.parse(spec) for spec in args.request]
+    if args.mix is not None:
+        for entry in json.loads(args.mix.read_text()):
+            body = entry.get("body")
+            mix.append(LoadRequest(
+                method=entry["method"].upper(),
+                path=entry["path"],
+                body=None if body is None else json.dumps(body).encode("utf-8"),
+                weight=entry.get("weight", 1)
+            ))
+    return mix or [LoadRequest("GET", "/hello"), LoadRequest("GET", "/users/42")]
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test a Terminus app on a local server")
+    parser.add_argument("--app", default=DEFAULT_APP, help="The app to serve as module:attribute")
+    parser.add_argument("--server", choices=("auto", "gunicorn", "stdlib"), default="auto")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--port", type=int, help="Defaults to a free port")
+    parser.add_argument("--target", help="HOST:PORT of an already running server to drive " +
+                        "instead of spawning one")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--request", action="append", default=[],
+                        help="A request of the form '[WEIGHT*]METHOD PATH'. Can be repeated")
+    parser.add_argument("--mix", type=Path, help="A JSON list of requests with 'method', " +
+                        "'path' and optional 'body' and 'weight' keys")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    port = args.port if args.port is not None else find_free_port()
+    if args.serve:
+        serve_stdlib(args.app, "127.0.0.1", port)
+        return 0
+
+    mix = _load_mix(args)
+    if args.target is not None:
+        host, port_str = args.target.rsplit(":", 1)
+        report = run_load(host, int(port_str), mix, args.concurrency, args.duration,
+                          args.warmup)
+    else:
+        proc = spawn_server(args.app, port, args.workers, args.threads, args.server)
+        try:
+            report = run_load("127.0.0.1", port, mix, args.concurrency, args.duration,
+                              args.warmup)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print(report.format())
+    return 0 if report.error_rate == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
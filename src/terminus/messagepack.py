@@ -0,0 +1,185 @@
+"""
+A pure Python MessagePack encoder and decoder, used when the msgpack package is not installed.
+Only the types JSON can represent are supported, along with bytes, so extension types are
+rejected when decoding.
+"""
+import struct
+from typing import Any
+
+from terminus.structs import field_reader, is_struct
+
+_pack_double = struct.Struct(">Bd").pack
+_unpack_float = struct.Struct(">f").unpack_from
+_unpack_double = struct.Struct(">d").unpack_from
+
+# Formats of fixed size values following a type byte, which the decoder reads as a group
+_INT_FORMATS = {
+    0xcc: ">B", 0xcd: ">H", 0xce: ">I", 0xcf: ">Q",
+    0xd0: ">b", 0xd1: ">h", 0xd2: ">i", 0xd3: ">q"
+}
+_INT_STRUCTS = {code: struct.Struct(fmt) for code, fmt in _INT_FORMATS.items()}
+
+
+def packb(value: Any) -> bytes:
+    """Encode a value as MessagePack"""
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def unpackb(raw: bytes) -> Any:
+    """Decode a MessagePack value, raising a ValueError if it is invalid or has trailing data"""
+    try:
+        value, end = _unpack(raw, 0)
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"Truncated MessagePack data: {e}")
+    except RecursionError:
+        raise ValueError("MessagePack data is nested too deeply")
+    if end != len(raw):
+        raise ValueError(f"Unexpected data after MessagePack value at byte {end}")
+    return value
+
+
+def _pack(value: Any, out: bytearray) -> None:
+    value_type = type(value)
+    if value_type is str:
+        data = value.encode("utf-8")
+        _pack_length(len(data), out, 0xa0, 31, 0xd9, 0xda, 0xdb)
+        out += data
+    elif value_type is int:
+        _pack_int(value, out)
+    elif value_type is float:
+        out += _pack_double(0xcb, value)
+    elif value is None:
+        out.append(0xc0)
+    elif value_type is bool:
+        out.append(0xc3 if value else 0xc2)
+    elif value_type is list or value_type is tuple:
+        _pack_length(len(value), out, 0x90, 15, None, 0xdc, 0xdd)
+        for item in value:
+            _pack(item, out)
+    elif value_type is dict:
+        _pack_length(len(value), out, 0x80, 15, None, 0xde, 0xdf)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif value_type is bytes or value_type is bytearray:
+        _pack_length(len(value), out, None, 0, 0xc4, 0xc5, 0xc6)
+        out += value
+    elif is_struct(value_type):
+        _pack(field_reader(value_type)(value), out)
+    else:
+        raise TypeError(f"Object of type {value_type.__name__} is not MessagePack serializable")
+
+
+def _pack_int(value: int, out: bytearray) -> None:
+    if 0 <= value <= 0x7f:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif value >= 0:
+        for code, limit, fmt in ((0xcc, 0xff, ">BB"), (0xcd, 0xffff, ">BH"),
+                                 (0xce, 0xffffffff, ">BI"), (0xcf, 0xffffffffffffffff, ">BQ")):
+            if value <= limit:
+                out += struct.pack(fmt, code, value)
+                return
+        raise OverflowError("Integer is too large to encode as MessagePack")
+    else:
+        for code, limit, fmt in ((0xd0, -0x80, ">Bb"), (0xd1, -0x8000, ">Bh"),
+                                 (0xd2, -0x80000000, ">Bi"), (0xd3, -0x8000000000000000, ">Bq")):
+            if value >= limit:
+                out += struct.pack(fmt, code, value)
+                return
+        raise OverflowError("Integer is too small to encode as MessagePack")
+
+
+def _pack_length(length: int, out: bytearray, fix_code: int | None, fix_max: int,
+                 code8: int | None, code16: int, code32: int) -> None:
+    """Write the header of a sized value, using the smallest format available for the type"""
+    if fix_code is not None and length <= fix_max:
+        out.append(fix_code | length)
+    elif code8 is not None and length <= 0xff:
+        out += struct.pack(">BB", code8, length)
+    elif length <= 0xffff:
+        out += struct.pack(">BH", code16, length)
+    elif length <= 0xffffffff:
+        out += struct.pack(">BI", code32, length)
+    else:
+        raise OverflowError("Value is too large to encode as MessagePack")
+
+
+def _unpack(raw: bytes, pos: int) -> tuple[Any, int]:
+    """Decode the value starting at <pos>, returning it with the position after it"""
+    code = raw[pos]
+    pos += 1
+    if code <= 0x7f:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if 0xa0 <= code <= 0xbf:
+        return _unpack_str(raw, pos, code & 0x1f)
+    if 0x90 <= code <= 0x9f:
+        return _unpack_array(raw, pos, code & 0x0f)
+    if 0x80 <= code <= 0x8f:
+        return _unpack_map(raw, pos, code & 0x0f)
+    if code in _INT_STRUCTS:
+        fmt = _INT_STRUCTS[code]
+        return fmt.unpack_from(raw, pos)[0], pos + fmt.size
+
+    match code:
+        case 0xc0:
+            return None, pos
+        case 0xc2:
+            return False, pos
+        case 0xc3:
+            return True, pos
+        case 0xca:
+            return _unpack_float(raw, pos)[0], pos + 4
+        case 0xcb:
+            return _unpack_double(raw, pos)[0], pos + 8
+        case 0xd9 | 0xda | 0xdb:
+            length, pos = _unpack_length(raw, pos, code - 0xd9)
+            return _unpack_str(raw, pos, length)
+        case 0xc4 | 0xc5 | 0xc6:
+            length, pos = _unpack_length(raw, pos, code - 0xc4)
+            if pos + length > len(raw):
+                raise ValueError("Truncated MessagePack binary value")
+            return raw[pos:pos + length], pos + length
+        case 0xdc | 0xdd:
+            length, pos = _unpack_length(raw, pos, code - 0xdc + 1)
+            return _unpack_array(raw, pos, length)
+        case 0xde | 0xdf:
+            length, pos = _unpack_length(raw, pos, code - 0xde + 1)
+            return _unpack_map(raw, pos, length)
+    raise ValueError(f"Unsupported MessagePack type 0x{code:02x} at byte {pos - 1}")
+
+
+def _unpack_length(raw: bytes, pos: int, size_index: int) -> tuple[int, int]:
+    """Read a length of 1, 2 or 4 bytes, given by a size index of 0, 1 or 2"""
+    fmt = _INT_STRUCTS[0xcc + size_index]
+    return fmt.unpack_from(raw, pos)[0], pos + fmt.size
+
+
+def _unpack_str(raw: bytes, pos: int, length: int) -> tuple[str, int]:
+    end = pos + length
+    if end > len(raw):
+        raise ValueError("Truncated MessagePack string")
+    return raw[pos:end].decode("utf-8"), end
+
+
+def _unpack_array(raw: bytes, pos: int, length: int) -> tuple[list, int]:
+    items = []
+    for _ in range(length):
+        item, pos = _unpack(raw, pos)
+        items.append(item)
+    return items, pos
+
+
+def _unpack_map(raw: bytes, pos: int, length: int) -> tuple[dict, int]:
+    items = {}
+    for _ in range(length):
+        key, pos = _unpack(raw, pos)
+        if type(key) is not str:
+            raise ValueError("MessagePack map keys must be strings")
+        items[key], pos = _unpack(raw, pos)
+    return items, pos
@@ -0,0 +1,227 @@
+"""
+Per-route request metrics, served in the Prometheus text exposition format
+"""
+import mmap
+import os
+import struct
+import weakref
+import zlib
+from bisect import bisect_left
+from collections.abc import Callable
+from pathlib import Path
+from time import perf_counter
+
+from terminus.constants import STATUS_CODE_MAP
+from terminus.router import RouteDetails
+from terminus.types import Request, RouteError
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Status codes that get their own counter. Anything else is grouped under the "other" label so the
+# number of series per route is fixed
+TRACKED_STATUSES = tuple(STATUS_CODE_MAP)
+
+# Offsets of each value within a route's slot. Every value is stored as a float64
+IN_FLIGHT = 0
+LATENCY_SUM = 1
+HISTOGRAM = 2
+STATUSES = HISTOGRAM + len(LATENCY_BUCKETS) + 1
+OTHER_STATUS = STATUSES + len(TRACKED_STATUSES)
+SLOT_WIDTH = OTHER_STATUS + 1
+
+STATUS_OFFSETS = {code: STATUSES + i for i, code in enumerate(TRACKED_STATUSES)}
+
+# Each store starts with a fingerprint of the route table its slots were laid out for, followed by
+# the number of slots it holds
+HEADER = struct.Struct("<QQ")
+VALUE_SIZE = 8
+FILE_PREFIX = "terminus_"
+
+# Collectors are tracked so every one can drop its storage in a forked child process
+_collectors: "weakref.WeakSet[MetricsCollector]" = weakref.WeakSet()
+
+
+class MetricsCollector:
+    """
+    Records request counts, status codes, latencies and in-flight requests for each registered
+    route, keyed on the route template. Values live in a flat float array with a fixed size slot
+    per route, so recording a request is a handful of index operations and takes no locks.
+
+    If a directory is given, each worker process writes to its own memory mapped file in that
+    directory and the metrics route sums every file it finds, aggregating values across gunicorn
+    workers. Otherwise, values are only kept for the current process.
+    """
+    def __init__(self, directory: Path | None = None, path: str = "/metrics") -> None:
+        self.path = path
+        self._directory = directory
+        self._routes: list[tuple[str, str]] = []
+        self._values = memoryview(bytearray()).cast("d")
+        self._buffer: mmap.mmap | bytearray = bytearray()
+        self._capacity = 0
+        self._renderers: list[Callable[[], str]] = []
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+        _collectors.add(self)
+
+    def add_renderer(self, renderer: Callable[[], str]) -> None:
+        """Add a source of extra metrics, already in the text exposition format, to the output"""
+        self._renderers.append(renderer)
+
+    def add_route(self, details: RouteDetails) -> None:
+        """Reserve a slot for a newly registered route"""
+        if details.route_id != len(self._routes):
+            raise RouteError("A metrics collector can only be attached to a single API")
+        self._routes.append((details.method.value, details.raw_path))
+
+    def start(self, details: RouteDetails) -> float:
+        """Mark a request to a route as in flight, returning the time it started"""
+        if details.route_id >= self._capacity:
+            self._allocate()
+        self._values[details.route_id * SLOT_WIDTH + IN_FLIGHT] += 1
+        return perf_counter()
+
+    def finish(self, details: RouteDetails, status_code: int, started: float) -> None:
+        """Record the outcome of a request that was previously started"""
+        elapsed = perf_counter() - started
+        values = self._values
+        base = details.route_id * SLOT_WIDTH
+        # Updates are not synchronised between threads of a worker. Losing an update requires a
+        # thread switch midway through one of these statements, which is acceptable for metrics
+        values[base + IN_FLIGHT] -= 1
+        values[base + LATENCY_SUM] += elapsed
+        values[base + HISTOGRAM + bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        values[base + STATUS_OFFSETS.get(status_code, OTHER_STATUS)] += 1
+
+    def serve(self, req: Request) -> str:
+        """Route function for the metrics endpoint"""
+        return self.render()
+
+    def render(self) -> str:
+        """Render the current metrics in the Prometheus text exposition format"""
+        totals = self._aggregate()
+        labels = [
+            f'method="{method}",route="{_escape(route)}"' for method, route in self._routes
+        ]
+
+        lines = [
+            "# HELP terminus_requests_total Requests handled per route and status code",
+            "# TYPE terminus_requests_total counter"
+        ]
+        status_names = [str(code) for code in TRACKED_STATUSES] + ["other"]
+        for route_id, label in enumerate(labels):
+            base = route_id * SLOT_WIDTH
+            for i, name in enumerate(status_names):
+                count = totals[base + STATUSES + i]
+                if count:
+                    lines.append(f'terminus_requests_total{{{label},status="{name}"}} '
+                                 + _format(count))
+
+        lines += [
+            "# HELP terminus_request_duration_seconds Request latency per route",
+            "# TYPE terminus_request_duration_seconds histogram"
+        ]
+        bounds = [repr(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+        for route_id, label in enumerate(labels):
+            base = route_id * SLOT_WIDTH
+            cumulative = 0.0
+            for i, bound in enumerate(bounds):
+                cumulative += totals[base + HISTOGRAM + i]
+                lines.append(f'terminus_request_duration_seconds_bucket{{{label},le="{bound}"}} '
+                             + _format(cumulative))
+            lines.append(f"terminus_request_duration_seconds_sum{{{label}}} "
+                         + _format(totals[base + LATENCY_SUM]))
+            lines.append(f"terminus_request_duration_seconds_count{{{label}}} "
+                         + _format(cumulative))
+
+        lines += [
+            "# HELP terminus_requests_in_flight Requests currently being handled per route",
+            "# TYPE terminus_requests_in_flight gauge"
+        ]
+        for route_id, label in enumerate(labels):
+            in_flight = totals[route_id * SLOT_WIDTH + IN_FLIGHT]
+            lines.append(f"terminus_requests_in_flight{{{label}}} " + _format(in_flight))
+
+        return "\n".join(lines) + "\n" + "".join(renderer() for renderer in self._renderers)
+
+    def _allocate(self) -> None:
+        """Grow the store of this process so every registered route has a slot"""
+        capacity = len(self._routes)
+        size = HEADER.size + capacity * SLOT_WIDTH * VALUE_SIZE
+        # Existing views are dropped rather than released, as other threads may still be using them
+        if self._directory is None:
+            buffer: mmap.mmap | bytearray = bytearray(size)
+            buffer[:len(self._buffer)] = self._buffer
+        else:
+            file_path = self._directory / f"{FILE_PREFIX}{os.getpid()}.db"
+            # A file left behind by an earlier process with the same PID is overwritten
+            mode = "r+b" if self._capacity > 0 else "w+b"
+            with open(file_path, mode) as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+
+        HEADER.pack_into(buffer, 0, self._fingerprint(capacity), capacity)
+        self._buffer = buffer
+        self._values = memoryview(buffer)[HEADER.size:].cast("d")
+        self._capacity = capacity
+
+    def _aggregate(self) -> list[float]:
+        """Sum the values of every process sharing this collector's store"""
+        totals = [0.0] * (len(self._routes) * SLOT_WIDTH)
+        if self._directory is None:
+            totals[:len(self._values)] = self._values.tolist()
+            return totals
+
+        for file_path in self._directory.glob(f"{FILE_PREFIX}*.db"):
+            data = file_path.read_bytes()
+            if len(data) < HEADER.size:
+                continue
+            fingerprint, capacity = HEADER.unpack_from(data)
+            # Files written for a different set of routes can't be mapped onto ours
+            if capacity > len(self._routes) or fingerprint != self._fingerprint(capacity):
+                continue
+            alive = _is_alive(int(file_path.stem.removeprefix(FILE_PREFIX)))
+            values = memoryview(data)[HEADER.size:].cast("d")
+            for i, val in enumerate(values):
+                # The in-flight gauge of a dead worker is stale, but its counters still count
+                if alive or i % SLOT_WIDTH != IN_FLIGHT:
+                    totals[i] += val
+        return totals
+
+    def _fingerprint(self, capacity: int) -> int:
+        """Hash the first routes of the route table which would occupy a store of some capacity"""
+        table = "\n".join(f"{method} {route}" for method, route in self._routes[:capacity])
+        return zlib.crc32(table.encode("utf-8"))
+
+    def _detach(self) -> None:
+        """Drop the parent's store so a forked worker lazily creates its own"""
+        self._values = memoryview(bytearray()).cast("d")
+        self._buffer = bytearray()
+        self._capacity = 0
+
+
+def _escape(label: str) -> str:
+    """Escape a label value for the text exposition format"""
+    return label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(val: float) -> str:
+    """Format a sample value, leaving whole numbers without a decimal point"""
+    return str(int(val)) if val.is_integer() else repr(val)
+
+
+def _is_alive(pid: int) -> bool:
+    """Determine if a process exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _detach_all() -> None:
+    for collector in _collectors:
+        collector._detach()
+
+
+os.register_at_fork(after_in_child=_detach_all)
@@ -1,5 +1,15 @@
+from terminus.middleware.bearer import create_bearer_auth
+from terminus.middleware.cors import create_cors
 from terminus.middleware.identifier import identifier
 from terminus.middleware.ip_filter import create_restrictor
 from terminus.middleware.logger import create_logger
+from terminus.middleware.sessions import create_sessions
 
-__all__ = ["create_logger", "create_restrictor", "identifier"]
\ No newline at end of file
+__all__ = [
+    "create_bearer_auth",
+    "create_cors",
+    "create_logger",
+    "create_restrictor",
+    "create_sessions",
+    "identifier"
+]
\ No newline at end of file
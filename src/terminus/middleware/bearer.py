@@ -0,0 +1,149 @@
+"""
+Authentication of requests by a JSON Web Token in the Authorization header.
+
+Tokens are signed with a shared secret using HMAC. Clients send the same token with every request
+until it expires, so the claims of each verified token are kept in a bounded LRU cache keyed by a
+hash of the token and of the middleware's configuration, and a repeated token skips decoding,
+parsing and the signature check entirely.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Mapping
+from types import MappingProxyType
+from typing import Any
+
+from terminus.execution_pipeline import MiddlewareFn, MiddlewareFnRes
+from terminus.types import HTTPError, Request, RouteError
+
+# The JWT algorithms which can be verified, by their name in the token header
+ALGORITHMS: dict[str, Callable[..., Any]] = {
+    "HS256": hashlib.sha256,
+    "HS384": hashlib.sha384,
+    "HS512": hashlib.sha512,
+}
+# The number of verified tokens whose claims are kept
+TOKEN_CACHE_SIZE = 4096
+
+type Claims = Mapping[str, Any]
+
+
+class TokenCache:
+    """A bounded LRU cache of the claims of verified tokens, each kept until it expires"""
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE) -> None:
+        self._max_size = max_size
+        self._tokens: OrderedDict[bytes, tuple[float, Claims]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes, now: float) -> Claims | None:
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._tokens[key]
+                return None
+            self._tokens.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: bytes, expires: float, claims: Claims) -> None:
+        with self._lock:
+            self._tokens[key] = (expires, claims)
+            self._tokens.move_to_end(key)
+            if len(self._tokens) > self._max_size:
+                self._tokens.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def create_bearer_auth(secret: str | bytes, algorithms: tuple[str, ...] = ("HS256",),
+                       audience: str | None = None, issuer: str | None = None,
+                       leeway: float = 0, context_key: str = "claims",
+                       cache: TokenCache | None = None) -> MiddlewareFn:
+    """
+    Create middleware rejecting requests without a valid bearer token with a 401 error, and
+    storing the claims of valid tokens in the request context as a read only mapping
+
+    Arguments:
+     - secret - The key tokens are signed with
+     - algorithms - The HMAC algorithms tokens may be signed with, from HS256, HS384 and HS512
+     - audience - If given, the 'aud' claim must be or contain this value
+     - issuer - If given, the 'iss' claim must equal this value
+     - leeway - The number of seconds of clock difference allowed when checking 'exp' and 'nbf'
+     - context_key - The key of the request context the claims are stored under
+     - cache - Where verified tokens are kept. By default each middleware has its own cache. A
+       shared cache keeps the tokens of each configuration apart, so a token verified by one
+       middleware is never accepted by another with a different secret or checks
+    """
+    for alg in algorithms:
+        if alg not in ALGORITHMS:
+            raise RouteError(f"Unsupported token algorithm '{alg}'. Use one of "
+                             + ", ".join(ALGORITHMS))
+    key = secret.encode("utf-8") if isinstance(secret, str) else secret
+    verified = TokenCache() if cache is None else cache
+    # Cache keys start with a fingerprint of everything verification depends on
+    config = json.dumps([hashlib.sha256(key).hexdigest(), algorithms, audience, issuer, leeway])
+    key_prefix = hashlib.sha256(config.encode("utf-8")).digest()
+
+    def verify(token: str, now: float) -> tuple[float, Claims]:
+        """Verify a token, returning the time it expires and its claims"""
+        try:
+            header_seg, payload_seg, signature_seg = token.split(".")
+            header = json.loads(_b64decode(header_seg))
+            alg = header.get("alg")
+            if alg not in algorithms:
+                raise ValueError("Unsupported algorithm")
+            signed = f"{header_seg}.{payload_seg}".encode("ascii")
+            expected = hmac.new(key, signed, ALGORITHMS[alg]).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature_seg)):
+                raise ValueError("Invalid signature")
+            claims = json.loads(_b64decode(payload_seg))
+            if not isinstance(claims, dict):
+                raise TypeError("Claims are not an object")
+            expires = float(claims.get("exp", float("inf"))) + leeway
+            not_before = float(claims.get("nbf", 0)) - leeway
+        except (ValueError, TypeError, AttributeError, UnicodeError):
+            raise HTTPError("Invalid bearer token", 401)
+
+        if expires <= now:
+            raise HTTPError("Bearer token has expired", 401)
+        if not_before > now:
+            raise HTTPError("Bearer token is not yet valid", 401)
+        if issuer is not None and claims.get("iss") != issuer:
+            raise HTTPError("Bearer token has the wrong issuer", 401)
+        if audience is not None:
+            aud = claims.get("aud")
+            if aud != audience and not (isinstance(aud, list) and audience in aud):
+                raise HTTPError("Bearer token has the wrong audience", 401)
+        return expires, MappingProxyType(claims)
+
+    def bearer_auth(req: Request) -> MiddlewareFnRes:
+        scheme, _, token = (req.headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            req.add_response_header("WWW-Authenticate", "Bearer")
+            raise HTTPError("Missing bearer token", 401)
+
+        now = time.time()
+        token_key = hashlib.sha256(key_prefix + token.encode("utf-8")).digest()
+        claims = verified.get(token_key, now)
+        if claims is None:
+            try:
+                expires, claims = verify(token, now)
+            except HTTPError:
+                req.add_response_header("WWW-Authenticate", 'Bearer error="invalid_token"')
+                raise
+            verified.put(token_key, expires, claims)
+
+        req.context[context_key] = claims
+        return None
+
+    return bearer_auth
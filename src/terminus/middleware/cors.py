@@ -0,0 +1,127 @@
+"""
+Cross-origin resource sharing.
+
+The headers sent to an allowed origin are the same on every request, so they are built once per
+origin and kept in a bounded cache. Preflight requests are answered by the API before routing,
+from the same cache, with an Access-Control-Max-Age telling browsers how long to skip them for.
+"""
+import re
+from collections.abc import Iterable
+from functools import lru_cache
+from wsgiref.types import StartResponse, WSGIEnvironment
+
+from terminus.execution_pipeline import MiddlewareFnRes
+from terminus.response import EncodedResponse, Response
+from terminus.types import Request, RouteError, WSGIFormatHeaders
+
+FORBIDDEN = EncodedResponse.error("Cross-origin request not allowed", 403)
+
+# The number of distinct origins whose headers, or whose rejection, is kept
+ORIGIN_CACHE_SIZE = 1024
+
+DEFAULT_METHODS = ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE")
+DEFAULT_HEADERS = ("Accept", "Accept-Language", "Content-Language", "Content-Type",
+                   "Authorization", "X-Request-ID")
+
+
+class CORSPolicy:
+    """
+    Middleware adding CORS headers to the responses to allowed origins, which the API also uses to
+    answer preflight requests. Create one with create_cors and pass it to the API with the cors
+    option, which registers it as the first global middleware.
+    """
+    def __init__(self, origins: Iterable[str], methods: Iterable[str],
+                 allow_headers: Iterable[str], expose_headers: Iterable[str],
+                 allow_credentials: bool, max_age: int) -> None:
+        exact: set[str] = set()
+        suffixes: list[str] = []
+        self._any_origin = False
+        for origin in origins:
+            if origin == "*":
+                self._any_origin = True
+            elif "://*." in origin:
+                scheme, _, domain = origin.partition("://*.")
+                suffixes.append(f"{re.escape(scheme)}://[^/]+\\.{re.escape(domain)}")
+            else:
+                exact.add(origin)
+        if self._any_origin and allow_credentials:
+            raise RouteError("Credentials cannot be allowed for any origin. List the origins")
+        self._exact = frozenset(exact)
+        # Every wildcard origin is checked in a single pass of one pattern
+        self._suffixes = re.compile("|".join(suffixes)) if suffixes else None
+        self.methods = frozenset(method.upper() for method in methods)
+
+        shared: WSGIFormatHeaders = []
+        if allow_credentials:
+            shared.append(("Access-Control-Allow-Credentials", "true"))
+        self._actual_extra = list(shared)
+        expose = ", ".join(expose_headers)
+        if expose:
+            self._actual_extra.append(("Access-Control-Expose-Headers", expose))
+        self._preflight_extra = [
+            *shared,
+            ("Access-Control-Allow-Methods", ", ".join(sorted(self.methods))),
+            ("Access-Control-Allow-Headers", ", ".join(allow_headers)),
+            ("Access-Control-Max-Age", str(max_age)),
+        ]
+        self._headers = lru_cache(maxsize=ORIGIN_CACHE_SIZE)(self._build_headers)
+        # Unless every origin gets the same answer, every response varies by origin, even those
+        # without CORS headers, so a shared cache never gives one to an origin it does not suit.
+        # The API adds these headers to all of its responses.
+        self.vary: WSGIFormatHeaders = [] if self._any_origin else [("Vary", "Origin")]
+
+    def allows(self, origin: str) -> bool:
+        """Whether requests from an origin are allowed"""
+        if self._any_origin or origin in self._exact:
+            return True
+        return self._suffixes is not None and self._suffixes.fullmatch(origin) is not None
+
+    def _build_headers(self, origin: str
+                       ) -> tuple[WSGIFormatHeaders, WSGIFormatHeaders] | None:
+        """Build the headers of actual and preflight responses to an origin, or None if denied"""
+        if not self.allows(origin):
+            return None
+        allow_origin = [("Access-Control-Allow-Origin", "*" if self._any_origin else origin)]
+        return [*allow_origin, *self._actual_extra], [*allow_origin, *self._preflight_extra]
+
+    def __call__(self, req: Request) -> MiddlewareFnRes:
+        origin = req.headers.get("Origin")
+        if origin is not None:
+            headers = self._headers(origin)
+            if headers is not None:
+                req.response_headers.extend(headers[0])
+        return None
+
+    @staticmethod
+    def is_preflight(environ: WSGIEnvironment) -> bool:
+        """Whether an OPTIONS request is a CORS preflight request"""
+        return "HTTP_ORIGIN" in environ and "HTTP_ACCESS_CONTROL_REQUEST_METHOD" in environ
+
+    def preflight(self, environ: WSGIEnvironment,
+                  start_response: StartResponse) -> Iterable[bytes]:
+        """Answer a preflight request, without it reaching any route"""
+        headers = self._headers(environ["HTTP_ORIGIN"])
+        requested = environ["HTTP_ACCESS_CONTROL_REQUEST_METHOD"].upper()
+        if headers is None or requested not in self.methods:
+            return FORBIDDEN.send(start_response)
+        return Response.send_empty(start_response, 204, list(headers[1]))
+
+
+def create_cors(origins: Iterable[str] = ("*",), methods: Iterable[str] = DEFAULT_METHODS,
+                allow_headers: Iterable[str] = DEFAULT_HEADERS,
+                expose_headers: Iterable[str] = (), allow_credentials: bool = False,
+                max_age: int = 600) -> CORSPolicy:
+    """
+    Create a CORS policy, to be passed to the API with the cors option
+
+    Arguments:
+     - origins - The origins allowed to make requests, such as 'https://example.com'. An origin of
+       '*' allows all of them, and one such as 'https://*.example.com' allows every subdomain
+     - methods - The methods cross-origin requests may use
+     - allow_headers - The request headers cross-origin requests may send
+     - expose_headers - The response headers scripts of other origins may read
+     - allow_credentials - Whether cookies and authorization headers may be sent, which requires
+       origins to be listed
+     - max_age - The number of seconds browsers may reuse the answer to a preflight request
+    """
+    return CORSPolicy(origins, methods, allow_headers, expose_headers, allow_credentials, max_age)
@@ -0,0 +1,248 @@
+"""
+Server side sessions identified by a signed cookie.
+
+The cookie holds only a random session id and its HMAC signature, while the session data lives in
+a store. A session is loaded from its store the first time a route reads or writes it, and it is
+only written back, with its cookie only set, when it has been modified, so requests which never
+touch the session cost nothing more than a cached signature check.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterator, MutableMapping
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Protocol
+
+from terminus.execution_pipeline import AfterWareFn, MiddlewareFn, MiddlewareFnRes
+from terminus.types import Request
+
+# The key of the request context the session is stored under
+SESSION_KEY = "session"
+# The number of distinct cookie values whose verification result is kept
+VERIFY_CACHE_SIZE = 4096
+# Sessions expire after two weeks without being modified by default
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60
+
+
+class SessionStore(Protocol):
+    """Where the data of sessions is kept, by session id"""
+    def load(self, session_id: str) -> dict[str, Any] | None: ...
+
+    def save(self, session_id: str, data: dict[str, Any], max_age: int) -> None: ...
+
+    def delete(self, session_id: str) -> None: ...
+
+
+class MemorySessionStore:
+    """
+    A store keeping sessions in the memory of the worker process. Sessions are not shared between
+    workers, and once max_sessions are stored the least recently used is dropped.
+    """
+    def __init__(self, max_sessions: int = 10_000) -> None:
+        self._max_sessions = max_sessions
+        # Data is kept encoded so no request can change the session of another in place
+        self._sessions: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+        return json.loads(entry[1])
+
+    def save(self, session_id: str, data: dict[str, Any], max_age: int) -> None:
+        encoded = json.dumps(data)
+        with self._lock:
+            self._sessions[session_id] = (time.time() + max_age, encoded)
+            self._sessions.move_to_end(session_id)
+            if len(self._sessions) > self._max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """
+    A store keeping sessions in a local SQLite database, so every worker process on a machine
+    shares them. Each thread of each process uses its own connection, and the database is put in
+    WAL mode so reads are not blocked by writes.
+    """
+    def __init__(self, path: str | Path) -> None:
+        self._path = str(path)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            + "(id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self.purge()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the connection of this thread, opening a new one in a forked process"""
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self._path, timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, session_id: str) -> dict[str, Any] | None:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires > ?", (session_id, time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save(self, session_id: str, data: dict[str, Any], max_age: int) -> None:
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)",
+            (session_id, json.dumps(data), time.time() + max_age)
+        )
+
+    def delete(self, session_id: str) -> None:
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge(self) -> None:
+        """Delete every expired session"""
+        self._connection().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),))
+
+
+class Session(MutableMapping[str, Any]):
+    """
+    The session of a request, available in the request context under the [session] key. The data
+    is loaded from the store on first use, and changes are saved once the route has returned.
+    """
+    def __init__(self, session_id: str | None, store: SessionStore) -> None:
+        # None until a new session is saved for the first time
+        self.id = session_id
+        self.modified = False
+        self._store = store
+        self._data: dict[str, Any] | None = None
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the data of the session has been read from its store"""
+        return self._data is not None
+
+    @property
+    def data(self) -> dict[str, Any]:
+        if self._data is None:
+            loaded = None if self.id is None else self._store.load(self.id)
+            if loaded is None:
+                # The session expired or was deleted, so a new one is started
+                self.id = None
+            self._data = loaded or {}
+        return self._data
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def clear(self) -> None:
+        """Remove all data from the session, which deletes it from the store"""
+        self._data = {}
+        self.modified = True
+
+    def mark_modified(self) -> None:
+        """Save the session even though it was only changed in place, such as a list appended to"""
+        self.modified = True
+
+
+@dataclass(frozen=True)
+class SessionMiddleware:
+    """Middleware to register with api.pre_request and api.after_request respectively"""
+    load: MiddlewareFn
+    save: AfterWareFn
+
+
+def create_sessions(secret: str | bytes, store: SessionStore | None = None,
+                    cookie_name: str = "session", max_age: int = DEFAULT_MAX_AGE,
+                    secure: bool = True, same_site: str = "Lax") -> SessionMiddleware:
+    """
+    Create middleware giving each request a session, identified by a cookie signed with a secret
+
+    Arguments:
+     - secret - The key the session cookie is signed with. It should be long, random and kept out
+       of source control
+     - store - Where session data is kept. By default this is a MemorySessionStore, whose sessions
+       are not shared between worker processes
+     - cookie_name - The name of the session cookie
+     - max_age - The number of seconds a session lasts after it was last modified
+     - secure - Whether the cookie is only sent over HTTPS
+     - same_site - The SameSite attribute of the cookie
+    """
+    key = secret.encode("utf-8") if isinstance(secret, str) else secret
+    session_store: SessionStore = MemorySessionStore() if store is None else store
+    attributes = f"Path=/; Max-Age={max_age}; HttpOnly; SameSite={same_site}"
+    expired = f"Path=/; Max-Age=0; HttpOnly; SameSite={same_site}"
+    if secure:
+        attributes += "; Secure"
+        expired += "; Secure"
+
+    def sign(session_id: str) -> str:
+        digest = hmac.new(key, session_id.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    # A browser sends the same cookie value with every request of a session, so each value is only
+    # verified once. Forged values are cached as well, which the bounded size keeps harmless.
+    @lru_cache(maxsize=VERIFY_CACHE_SIZE)
+    def verify(cookie: str) -> str | None:
+        session_id, _, signature = cookie.partition(".")
+        # Bytes are compared since compare_digest rejects strings with non-ASCII characters, which
+        # a forged cookie can contain
+        expected = sign(session_id).encode("ascii")
+        if session_id and hmac.compare_digest(signature.encode("latin-1", "replace"), expected):
+            return session_id
+        return None
+
+    def load(req: Request) -> MiddlewareFnRes:
+        cookie = req.headers.cookies.get(cookie_name)
+        session_id = None if cookie is None else verify(cookie)
+        req.context[SESSION_KEY] = Session(session_id, session_store)
+        return None
+
+    def save(req: Request) -> None:
+        session: Session | None = req.context.get(SESSION_KEY)
+        if session is None or not session.modified:
+            return
+        if not session.data:
+            if session.id is not None:
+                session_store.delete(session.id)
+                req.add_response_header("Set-Cookie", f"{cookie_name}=; {expired}")
+            return
+        if session.id is None:
+            session.id = secrets.token_urlsafe(24)
+        session_store.save(session.id, session.data, max_age)
+        cookie = f"{cookie_name}={session.id}.{sign(session.id)}; {attributes}"
+        req.add_response_header("Set-Cookie", cookie)
+
+    return SessionMiddleware(load, save)
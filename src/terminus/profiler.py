@@ -0,0 +1,192 @@
+"""
+Opt-in profiling of selected requests, aggregated per route template
+"""
+import atexit
+import cProfile
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from types import FrameType
+from typing import Literal
+from wsgiref.types import WSGIEnvironment
+
+from terminus.router import RouteDetails
+from terminus.types import RouteError
+
+type ProfilerMode = Literal["sample", "cprofile"]
+
+DEFAULT_INTERVAL = 0.001
+
+
+class RequestProfiler:
+    """
+    Profiles a selection of requests, aggregating the results for each route template. Requests are
+    selected by any combination of:
+        - <every> Profile every Nth request
+        - <header> Profile requests carrying some header (e.g. "X-Profile")
+        - <route_pattern> Only profile routes whose template matches a regular expression
+    If neither <every> or <header> are given, every request to a matching route is profiled.
+
+    There are two profiling modes:
+        - "sample" A background thread samples the stack of each thread handling a profiled request
+          every <interval> seconds. Profiles are written as collapsed stacks, which flame graph
+          tools such as flamegraph.pl and speedscope accept.
+        - "cprofile" Requests are run under cProfile and profiles are written as pstats files.
+          Only one request is profiled at a time, and as cProfile observes every thread from
+          Python 3.12, profiles are only precise for single threaded workers.
+
+    If <output_dir> is given, profiles are written there when the process exits.
+    """
+    def __init__(self, every: int | None = None, header: str | None = None,
+                 route_pattern: str | None = None, mode: ProfilerMode = "sample",
+                 interval: float = DEFAULT_INTERVAL, output_dir: Path | None = None) -> None:
+        if every is not None and every < 1:
+            raise RouteError("Profiling every Nth request requires N to be at least 1")
+        self._every = every
+        self._header_key = None if header is None else "HTTP_" + header.upper().replace("-", "_")
+        self._route_pattern = None if route_pattern is None else re.compile(route_pattern)
+        self._mode = mode
+        self._interval = interval
+
+        self._counter = itertools.count()
+        self._routes: list[tuple[str, str]] = []
+        self._eligible: list[bool] = []
+
+        self._samples: dict[int, Counter[str]] = {}
+        self._active: dict[int, int] = {}
+        self._wake = threading.Event()
+        self._sampler: threading.Thread | None = None
+
+        self._profiles: dict[int, cProfile.Profile] = {}
+        self._cprofile_lock = threading.Lock()
+
+        if output_dir is not None:
+            atexit.register(self.dump, output_dir)
+
+    def add_route(self, details: RouteDetails) -> None:
+        """Determine if a newly registered route may be profiled"""
+        if details.route_id != len(self._routes):
+            raise RouteError("A profiler can only be attached to a single API")
+        self._routes.append((details.method.value, details.raw_path))
+        self._eligible.append(
+            self._route_pattern is None or self._route_pattern.search(details.raw_path) is not None
+        )
+
+    def should_profile(self, details: RouteDetails, environ: WSGIEnvironment) -> bool:
+        """Determine if a request to a route is selected for profiling"""
+        if not self._eligible[details.route_id]:
+            return False
+        if self._header_key is not None and self._header_key in environ:
+            return True
+        if self._every is not None:
+            return next(self._counter) % self._every == 0
+        return self._header_key is None
+
+    @contextmanager
+    def profile(self, details: RouteDetails) -> Iterator[None]:
+        """Profile the code run within the context, attributing it to a route"""
+        if self._mode == "cprofile":
+            with self._run_cprofile(details.route_id):
+                yield
+            return
+
+        if self._sampler is None or not self._sampler.is_alive():
+            self._start_sampler()
+        thread_id = threading.get_ident()
+        self._samples.setdefault(details.route_id, Counter())
+        self._active[thread_id] = details.route_id
+        self._wake.set()
+        try:
+            yield
+        finally:
+            del self._active[thread_id]
+
+    def collapsed_stacks(self, details: RouteDetails) -> Counter[str]:
+        """Get the sampled stacks of a route in collapsed form with the number of samples of each"""
+        return Counter(self._samples.get(details.route_id, {}))
+
+    def dump(self, output_dir: Path) -> list[Path]:
+        """Write the profile of each profiled route to a directory, returning the files written"""
+        output_dir.mkdir(parents=True, exist_ok=True)
+        written: list[Path] = []
+        for route_id, samples in list(self._samples.items()):
+            path = output_dir / (self._file_stem(route_id) + ".collapsed")
+            lines = [f"{stack} {count}" for stack, count in samples.most_common()]
+            path.write_text("\n".join(lines) + "\n")
+            written.append(path)
+        for route_id, profile in list(self._profiles.items()):
+            path = output_dir / (self._file_stem(route_id) + ".pstats")
+            profile.dump_stats(path)
+            written.append(path)
+        return written
+
+    @contextmanager
+    def _run_cprofile(self, route_id: int) -> Iterator[None]:
+        # Requests arriving while another is being profiled are run without profiling
+        if not self._cprofile_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            profile = self._profiles.get(route_id)
+            if profile is None:
+                profile = self._profiles[route_id] = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiling tool is already active
+                yield
+                return
+            try:
+                yield
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_lock.release()
+
+    def _start_sampler(self) -> None:
+        self._sampler = threading.Thread(target=self._sample_loop, name="terminus-profiler",
+                                         daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self) -> None:
+        """Sample the stacks of threads handling profiled requests until the process exits"""
+        while True:
+            self._wake.wait()
+            time.sleep(self._interval)
+            active = list(self._active.items())
+            if not active:
+                self._wake.clear()
+                # A request may have started between taking the snapshot and clearing
+                if self._active:
+                    self._wake.set()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, route_id in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._samples[route_id][collapse_stack(frame)] += 1
+
+    def _file_stem(self, route_id: int) -> str:
+        method, raw_path = self._routes[route_id]
+        slug = re.sub(r"[^\w\[\]-]+", "_", raw_path).strip("_") or "root"
+        return f"{method}_{slug}.{os.getpid()}"
+
+
+def collapse_stack(frame: FrameType) -> str:
+    """Format a stack as semicolon separated frames from the outermost to the innermost"""
+    names: list[str] = []
+    curr: FrameType | None = frame
+    while curr is not None:
+        code = curr.f_code
+        names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:" +
+                     f"{code.co_firstlineno})")
+        curr = curr.f_back
+    return ";".join(reversed(names))
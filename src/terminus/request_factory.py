@@ -1,9 +1,15 @@
 import json
+import math
+import time
 from io import BytesIO
+from typing import Any
 from urllib.parse import parse_qs
 from wsgiref.types import WSGIEnvironment
 
+from terminus.codecs import JSON_CODEC, get_codec
+from terminus.forms import MultipartParser, parse_header_params, parse_urlencoded
 from terminus.router import RouteDetails, Router
+from terminus.streams import JSON_SEQ_SEPARATOR, NDJSON_SEPARATOR, iter_json_records, read_body
 from terminus.types import (
     ContentType,
     Headers,
@@ -14,37 +20,78 @@ from terminus.types import (
     RequestBody,
 )
 
+# Clients may shorten the timeout of a request by giving the seconds they will wait in this header
+TIMEOUT_HEADER_KEY = "HTTP_X_REQUEST_TIMEOUT"
+
 
 class RequestFactory:
     BODY_KEYS = ("wsgi.input", "CONTENT_TYPE", "CONTENT_LENGTH")
     @staticmethod
-    def build_req(environ: WSGIEnvironment, route_details: RouteDetails) -> "Request":
+    def build_req(environ: WSGIEnvironment, route_details: RouteDetails,
+                  deadline: float | None = None) -> "Request":
         """
         Generate a structured request object from environmental variables and details about the
         route.
         """
-        included_body_keys = [k for k in RequestFactory.BODY_KEYS if k in environ]
-        if len(included_body_keys) == len(RequestFactory.BODY_KEYS):
+        # Some servers always set the content keys, leaving them empty when there is no body
+        included_body_keys = [
+            k for k in RequestFactory.BODY_KEYS if environ.get(k, "") != ""
+        ]
+        # Chunked bodies have no length, and are read until the server signals their end
+        if RequestFactory._is_chunked(environ) and "CONTENT_LENGTH" not in included_body_keys:
+            if not environ.get("wsgi.input_terminated"):
+                # Reading to the end of an unterminated input would wait for the client to close
+                # the connection, and return the raw chunk framing
+                raise HTTPError("Chunked bodies are not supported by this server, so the " +
+                                "request must have a 'Content-Length' header", 411)
+            included_body_keys.append("CONTENT_LENGTH")
+        if route_details.body_decoder is not None:
+            body = RequestFactory._decode_body(environ, route_details, included_body_keys)
+        elif len(included_body_keys) == len(RequestFactory.BODY_KEYS):
             body = RequestFactory._parse_body(
                 environ["wsgi.input"],
                 environ["CONTENT_TYPE"],
-                environ["CONTENT_LENGTH"]
+                RequestFactory._content_length(environ)
             )
         elif "wsgi.input" in environ and len(included_body_keys) == len(RequestFactory.BODY_KEYS):
             raise HTTPError("Request with body must contain 'Content-Type' and" +
                                "'Content-Length' headers")
         else:
             body = None
+        
+        params = Router.match_path_variables(route_details, environ["PATH_INFO"])
+        query = RequestFactory._build_query(environ["QUERY_STRING"])
+        if route_details.schema is not None:
+            body, params, query = route_details.schema.apply(body, params, query)
             
         return Request(
             method=HTTPMethod(environ["REQUEST_METHOD"]),
-            params=Router.match_path_variables(route_details, environ["PATH_INFO"]),
+            params=params,
             body=body,
-            query=RequestFactory._build_query(environ["QUERY_STRING"]),
+            query=query,
             protocol=environ["SERVER_PROTOCOL"],
             path=environ["PATH_INFO"],
-            headers=Headers.of(environ)
+            headers=Headers.of(environ),
+            deadline=deadline
         )
+
+    @staticmethod
+    def deadline(environ: WSGIEnvironment, timeout: float | None) -> float | None:
+        """
+        Get the deadline of a request from the timeout of its route and the timeout header, taking
+        whichever ends first. Invalid header values are ignored.
+        """
+        header = environ.get(TIMEOUT_HEADER_KEY)
+        if header is not None:
+            try:
+                requested = float(header)
+            except ValueError:
+                requested = math.nan
+            if requested >= 0 and (timeout is None or requested < timeout):
+                timeout = requested
+        if timeout is None:
+            return None
+        return time.monotonic() + timeout
     
     @staticmethod
     def _build_query(query_str: str) -> QueryVariables:
@@ -66,12 +113,74 @@ class RequestFactory:
     
 
     @staticmethod
-    def _parse_body(body: BytesIO, content_type: str, content_len: int) -> RequestBody:
-        c_type = ContentType(content_type)
+    def _decode_body(environ: WSGIEnvironment, route_details: RouteDetails,
+                     included_body_keys: list[str]) -> Any:
+        """Decode a JSON body straight into the body type declared by the route"""
+        if (len(included_body_keys) != len(RequestFactory.BODY_KEYS)
+                or ContentType.of(environ["CONTENT_TYPE"]) != ContentType.APPLICATION_JSON):
+            raise HTTPError("Route expects a JSON body")
+        assert route_details.body_decoder is not None
+        return route_details.body_decoder(
+            read_body(environ["wsgi.input"], RequestFactory._content_length(environ))
+        )
+
+    @staticmethod
+    def _is_chunked(environ: WSGIEnvironment) -> bool:
+        """
+        Determine if the body is sent with chunked transfer encoding. It can only be read when the
+        server decodes the chunks and ends the input with the body, which it signals by setting
+        wsgi.input_terminated.
+        """
+        return "chunked" in environ.get("HTTP_TRANSFER_ENCODING", "").lower()
+
+    @staticmethod
+    def _content_length(environ: WSGIEnvironment) -> int | None:
+        """Get the length of the body, which is None for a chunked body"""
+        if environ.get("CONTENT_LENGTH", "") == "":
+            return None
+        return int(environ["CONTENT_LENGTH"])
+
+    @staticmethod
+    def _parse_body(body: BytesIO, content_type: str, content_len: int | None) -> RequestBody:
+        codec = get_codec(content_type)
+        if codec is not None and codec is not JSON_CODEC:
+            try:
+                return codec.decode(read_body(body, content_len))
+            except ValueError as e:
+                raise HTTPError(f"Body is not valid {codec.media_type}: {_describe(e)}")
+
+        c_type = ContentType.of(content_type)
+        if c_type is None:
+            media_type = parse_header_params(content_type)[0]
+            raise HTTPError(f"Content type '{media_type}' is not supported", 415)
+        charset = parse_header_params(content_type)[1].get("charset", "utf-8")
         match c_type:
             case ContentType.APPLICATION_JSON:
-                return json.load(body)
+                # The input stream may not end with the body, so only the body length is read
+                try:
+                    return json.loads(read_body(body, content_len))
+                except ValueError as e:
+                    raise HTTPError(f"Body is not valid JSON: {_describe(e)}")
+            case ContentType.APPLICATION_NDJSON:
+                return iter_json_records(body, content_len, NDJSON_SEPARATOR)
+            case ContentType.APPLICATION_JSON_SEQ:
+                return iter_json_records(body, content_len, JSON_SEQ_SEPARATOR)
             case ContentType.APPLICATION_OCTET_STREAM:
-                return body.read(content_len)
+                return read_body(body, content_len)
+            case ContentType.APPLICATION_FORM_URLENCODED:
+                return parse_urlencoded(read_body(body, content_len), charset)
+            case ContentType.MULTIPART_FORM_DATA:
+                boundary = parse_header_params(content_type)[1].get("boundary")
+                if boundary is None:
+                    raise HTTPError("Multipart body has no boundary in its 'Content-Type' header")
+                return MultipartParser(boundary).parse(body, content_len, charset)
             case _:
-                return body.read(content_len).decode("utf-8")
\ No newline at end of file
+                try:
+                    return read_body(body, content_len).decode(charset)
+                except (UnicodeDecodeError, LookupError) as e:
+                    raise HTTPError(f"Body could not be decoded as '{charset}': {e}")
+
+
+def _describe(e: ValueError) -> str:
+    """Describe a decoding error, as some decoders raise errors without a message"""
+    return str(e) or type(e).__name__
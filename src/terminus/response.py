@@ -1,27 +1,68 @@
 import json
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass, field
 from typing import Any
 from wsgiref.types import StartResponse
 
+from terminus.codecs import negotiate
 from terminus.constants import STATUS_CODE_MAP
+from terminus.structs import is_struct
 from terminus.types import ContentType, Cookies, HTTPError, RouteFnRes, WSGIFormatHeaders
 
 VALID_BODY_TYPE_NAMES = [
-    "dict"
-    "list"
-    "bytes"
-    "int"
-    "str"
-    "bool"
+    "dict",
+    "list",
+    "bytes",
+    "int",
+    "str",
+    "bool",
+    "dataclass or __slots__ class"
 ]
 
 @dataclass(frozen=True)
 class ResponseFields:
     status: str
     body: bytes
-    content_type: ContentType
+    content_type: str
     extra_headers: WSGIFormatHeaders
+    # Sent as the Content-Length header, which is left out when this is None
+    content_length: int | None
+
+@dataclass(frozen=True)
+class Head:
+    """
+    A response to a HEAD request which skips building and encoding the body. Routes can return
+    this when req.method is HEAD, giving the Content-Length a GET request would receive if it is
+    cheap to find.
+    """
+    content_type: str
+    content_length: int | None = None
+    status: int = 200
     
+@dataclass(frozen=True)
+class EncodedResponse:
+    """A response encoded ahead of time, which can be sent any number of times"""
+    status: str
+    headers: WSGIFormatHeaders
+    body: bytes
+
+    @staticmethod
+    def error(err_msg: str, err_code: int,
+              headers: WSGIFormatHeaders | None = None) -> "EncodedResponse":
+        """Encode an error response in the format of Response.send_err()"""
+        body = json.dumps({"error": err_msg}).encode("utf-8")
+        return EncodedResponse(Response._build_status(err_code), [
+            ("Content-Type", ContentType.APPLICATION_JSON.value),
+            ("Content-Length", str(len(body))),
+            *(headers or [])
+        ], body)
+
+    def send(self, start_response: StartResponse) -> list[bytes]:
+        """Triggers the start response routine and returns the body"""
+        # Servers may add to the header list they are given, so each response gets its own copy
+        start_response(self.status, list(self.headers))
+        return [self.body]
+
 @dataclass(frozen=True)
 class NormalisedRouteFnRes:
     body: Any
@@ -31,53 +72,82 @@ class NormalisedRouteFnRes:
 @dataclass(frozen=True)
 class BodyTypePair:
     content: bytes
-    content_type: ContentType
+    content_type: str
+    # Whether the format was chosen from the Accept header, so caches must take it into account
+    negotiated: bool = False
 
 class Response:
-    def __init__(self, fn_res: RouteFnRes, start_response: StartResponse) -> None:
-        res_fields = Response._parse_function_res(fn_res)
+    def __init__(self, fn_res: RouteFnRes, start_response: StartResponse,
+                 accept: str | None = None,
+                 extra_headers: WSGIFormatHeaders | None = None) -> None:
+        res_fields = Response.encode(fn_res, accept)
+        self.status_code = int(res_fields.status.partition(" ")[0])
         self._body = [res_fields.body]
         headers: WSGIFormatHeaders = [
             *res_fields.extra_headers,
-            ("Content-Type", res_fields.content_type.value),
-            ("Content-Length", str(len(res_fields.body)))
-        ] 
+            *(extra_headers or []),
+            ("Content-Type", res_fields.content_type)
+        ]
+        if res_fields.content_length is not None:
+            headers.append(("Content-Length", str(res_fields.content_length)))
         
         self._response_routine = lambda: start_response(res_fields.status, headers)
             
     @staticmethod
-    def _parse_function_res(fn_res: RouteFnRes) -> ResponseFields:
+    def encode(fn_res: RouteFnRes, accept: str | None = None) -> ResponseFields:
+        """
+        Encode the return value of a route function. The encoded fields may themselves be returned
+        by a route function, and are then sent as they are.
+        """
+        if isinstance(fn_res, ResponseFields):
+            return fn_res
+        if isinstance(fn_res, Head):
+            return ResponseFields(Response._build_status(fn_res.status), b"", fn_res.content_type,
+                                  [], fn_res.content_length)
+        return Response._parse_function_res(fn_res, accept)
+
+    @staticmethod
+    def _parse_function_res(fn_res: RouteFnRes, accept: str | None = None) -> ResponseFields:
         """
         Takes the return value from a route's function and extracts the HTTP
         status, parses and encodes the body then returns relevant response
         fields
         """
         normalised = Response._normalise_route_fn_res(fn_res)
-        parsed_body = Response._parse_body(normalised.body)
+        parsed_body = Response._parse_body(normalised.body, accept)
+        extra_headers = normalised.cookies
+        if parsed_body.negotiated:
+            extra_headers = [*extra_headers, ("Vary", "Accept")]
         
         return ResponseFields(
             status=normalised.status,
             body=parsed_body.content,
             content_type=parsed_body.content_type,
-            extra_headers=normalised.cookies
+            extra_headers=extra_headers,
+            content_length=len(parsed_body.content)
         )
         
     @staticmethod
-    def _parse_body(body: Any) -> BodyTypePair:
-        """Parse the response body and determine the content type according to this"""
-        if isinstance(body, dict | list):
+    def _parse_body(body: Any, accept: str | None = None) -> BodyTypePair:
+        """
+        Parse the response body and determine the content type according to this. Containers are
+        serialised in the format the Accept header prefers, which is JSON unless another is asked
+        for.
+        """
+        if isinstance(body, dict | list) or is_struct(type(body)):
+            codec = negotiate(accept)
             try:
-                body_str = json.dumps(body)
-            except TypeError as e:
+                content = codec.encode(body)
+            except (TypeError, OverflowError) as e:
                 raise HTTPError(f"Body container type is valid (f{type(body)}), but it failed" +
                                 "to be parsed. This is likely due to an invalid inner key such" +
                                 f"as a tuple, frozenset, etc. Parsing Error:\n {e}")
-            return BodyTypePair(body_str.encode("utf8"), ContentType.APPLICATION_JSON)
+            return BodyTypePair(content, codec.media_type, negotiated=True)
         elif isinstance(body, bytes):
-            return BodyTypePair(body, ContentType.APPLICATION_OCTET_STREAM)
+            return BodyTypePair(body, ContentType.APPLICATION_OCTET_STREAM.value)
         elif isinstance(body, int | float | str | bool):
             body_str = str(body)
-            return BodyTypePair(body_str.encode("utf-8"), ContentType.TEXT_PLAIN)
+            return BodyTypePair(body_str.encode("utf-8"), ContentType.TEXT_PLAIN.value)
         else:
             wrong_type = type(body).__name__
             raise HTTPError(f"Unsupported response body type '{wrong_type}'. Accepted types" +
@@ -136,13 +206,23 @@ class Response:
         return self._body
     
     @staticmethod
-    def send_err(start_response: StartResponse, err_msg: str, err_code: int = 500) -> list[bytes]:
+    def send_err(start_response: StartResponse, err_msg: str, err_code: int = 500,
+                 headers: WSGIFormatHeaders | None = None) -> list[bytes]:
         """Triggers the start response routine and returns the body for an error"""
         err_status = Response._build_status(err_code)
         err_header = [("Content-Type", ContentType.APPLICATION_JSON.value)]
+        if headers:
+            err_header += headers
         start_response(err_status, err_header)
         return [json.dumps({"error": err_msg}).encode("utf-8")]
     
+    @staticmethod
+    def send_empty(start_response: StartResponse, status_code: int,
+                   headers: WSGIFormatHeaders) -> list[bytes]:
+        """Triggers the start response routine for a response with no body"""
+        start_response(Response._build_status(status_code), headers)
+        return []
+
     @staticmethod
     def _build_status(status_code: int) -> str:
         """
@@ -152,4 +232,20 @@ class Response:
             return str(status_code) + " " + STATUS_CODE_MAP[status_code]
         else:
             return str(status_code)
-        
\ No newline at end of file
+
+
+class EmptyBody:
+    """
+    The body of a response to a HEAD request. Nothing is sent, but the body it replaces is still
+    closed so any work waiting on it runs.
+    """
+    def __init__(self, body: Iterable[bytes]) -> None:
+        self._body = body
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(())
+
+    def close(self) -> None:
+        close = getattr(self._body, "close", None)
+        if close is not None:
+            close()
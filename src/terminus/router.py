@@ -1,8 +1,12 @@
-from bisect import bisect_left, insort_left
-from collections.abc import Callable
+import threading
+from bisect import bisect_left
+from collections.abc import Callable, Hashable
 from dataclasses import dataclass
+from typing import Any
 
 from terminus.response import RouteFnRes
+from terminus.schema import RouteSchema
+from terminus.structs import BodyDecoder
 from terminus.types import HTTPMethod, PathVariables, Request, RouteError
 
 type RouteFn = Callable[[Request], RouteFnRes]
@@ -12,11 +16,22 @@ type RouteMap = dict[HTTPMethod, dict[str, RouteFn]]
 # easily check for it at the start of the sorted child list
 WILDCARD = ""
 
+# The number of recent lookups kept by each cache of unmatched paths
+MISS_CACHE_SIZE = 4096
+_UNCACHED = object()
+
 @dataclass(frozen=True)
 class RouteDetails:
     fn: RouteFn
     path_var_indices: dict[int, str]
     raw_path: str
+    method: HTTPMethod
+    # Position of the route in registration order. This is stable across workers that register
+    # the same routes, so it can be used to index preallocated per-route storage
+    route_id: int
+    schema: RouteSchema | None = None
+    # Decodes raw JSON bodies straight into the declared body type of the route
+    body_decoder: BodyDecoder | None = None
 
 class Router:
     """
@@ -29,71 +44,205 @@ class Router:
         self._routes: dict[HTTPMethod, dict[int, RouteNode]] = {
             method: {} for method in HTTPMethod
         }
+        # Routes without path variables are also kept by their exact path, so matching them is a
+        # single dictionary lookup
+        self._static: dict[HTTPMethod, dict[str, RouteDetails]] = {
+            method: {} for method in HTTPMethod
+        }
+        # A trie of every route template regardless of method, whose terminal nodes hold the
+        # methods allowed on the template. This answers 405 and OPTIONS requests in one lookup.
+        self._allowed: dict[int, RouteNode] = {}
+        # The exact first parts of the routes of each method and part count, or None when a route
+        # starts with a path variable. Most requests for unknown paths are rejected by this alone.
+        self._first_parts: dict[HTTPMethod, dict[int, set[str] | None]] = {
+            method: {} for method in HTTPMethod
+        }
+        # Recent lookups that matched no route, which are cleared whenever a route is registered
+        self._misses: dict[tuple[HTTPMethod, str], None] = {}
+        self._allow_cache: dict[str, str | None] = {}
+        self._cache_lock = threading.Lock()
+        self._route_count = 0
 
-    def register_route(self, method: HTTPMethod, raw_path: str, fn: RouteFn) -> None:
+    def register_route(self, method: HTTPMethod, raw_path: str, fn: RouteFn,
+                       schema: RouteSchema | None = None,
+                       body_decoder: BodyDecoder | None = None) -> RouteDetails:
         """Attempts to register a route to the router"""
         parts = raw_path.split("/")
         
+        path_var_indices: dict[int, str] = {}
+        for i, p in enumerate(parts):
+            if Router.is_param(p):
+                path_var_indices[i] = p[1:-1]
+        
+        if schema is not None:
+            schema.check_route(raw_path, path_var_indices.values())
+        
         method_routes = self._routes[method]
         if len(parts) not in method_routes:
             method_routes[len(parts)] = RouteNode(None)
             
         curr = method_routes[len(parts)]
-        for i, p in enumerate(parts):
-            if Router.is_param(p):
-                if len(curr.children) == 0 or curr.children[0] != WILDCARD:
-                    new_node = RouteNode(WILDCARD)
-                    curr.children.insert(0, new_node)
-                    curr = curr.children[0]
-                else:
-                    curr = curr.children[0]
-            else:
-                new_node = RouteNode(p)
-                pos_idx = bisect_left(curr.children, new_node)
-                
-                inbound = pos_idx < len(curr.children)
-                if not inbound or curr.children[pos_idx].content != p:
-                    insort_left(curr.children, new_node)
-                elif i + 1 == len(parts):
-                    raise RouteError(f"Cannot register route '{raw_path}' that already exists")
-                
-                curr = curr.children[pos_idx]
-        
-        path_var_indices: dict[int, str] = {}
-        for i, p in enumerate(parts):
-            if Router.is_param(p):
-                path_var_indices[i] = p[1:-1]
+        for p in parts:
+            # The wildcard is the empty string, so it is ordered like any other part
+            content = WILDCARD if Router.is_param(p) else p
+            new_node = RouteNode(content)
+            pos_idx = bisect_left(curr.children, new_node)
+            if pos_idx == len(curr.children) or curr.children[pos_idx].content != content:
+                curr.children.insert(pos_idx, new_node)
+            curr = curr.children[pos_idx]
         
-        curr.details = RouteDetails(fn, path_var_indices, raw_path)
+        # Routes differing only in the names of their path variables can never be told apart
+        if curr.details is not None:
+            raise RouteError(f"Cannot register route '{raw_path}' as it matches the same paths " +
+                             f"as '{curr.details.raw_path}'")
+        curr.details = RouteDetails(
+            fn, path_var_indices, raw_path, method, self._route_count, schema, body_decoder
+        )
+        self._route_count += 1
+        if not path_var_indices:
+            self._static[method][raw_path] = curr.details
+        self._index_first_part(parts, method)
+        self._index_allowed(parts, method)
+        with self._cache_lock:
+            self._misses.clear()
+            self._allow_cache.clear()
+        return curr.details
+
+    def allowed_methods(self, raw_path: str) -> str | None:
+        """
+        Get the Allow header of a request path, listing the methods of every route it matches. If
+        no route matches, None will be returned
+        """
+        cached = self._allow_cache.get(raw_path, _UNCACHED)
+        if cached is not _UNCACHED:
+            return cached
+
+        parts = raw_path.split("/")
+        root = self._allowed.get(len(parts))
+        matches: list[RouteNode] = []
+        if root is not None:
+            Router._collect_allowed(root, parts, 0, matches)
+        if len(matches) <= 1:
+            allow = matches[0].allow if matches else None
+        else:
+            # Overlapping templates, such as /users/me and /users/[id], are rare enough to
+            # combine here
+            allow = Router._build_allow(set().union(*(node.methods for node in matches)))
+        self._remember(self._allow_cache, raw_path, allow)
+        return allow
+
+    def _index_first_part(self, parts: list[str], method: HTTPMethod) -> None:
+        """Add the first part of a newly registered route to the first parts of its method"""
+        method_parts = self._first_parts[method]
+        if len(parts) < 2 or Router.is_param(parts[1]):
+            method_parts[len(parts)] = None
+            return
+        first_parts = method_parts.setdefault(len(parts), set())
+        if first_parts is not None:
+            first_parts.add(parts[1])
+
+    def _remember(self, cache: dict[Any, Any], key: Hashable, value: Any) -> None:
+        """Add an entry to a bounded cache, dropping the oldest entry when it is full"""
+        with self._cache_lock:
+            if len(cache) >= MISS_CACHE_SIZE:
+                # Dictionaries keep insertion order, so the first key is the oldest
+                del cache[next(iter(cache))]
+            cache[key] = value
+
+    def _index_allowed(self, parts: list[str], method: HTTPMethod) -> None:
+        """Add the method of a newly registered route to the method agnostic trie"""
+        if len(parts) not in self._allowed:
+            self._allowed[len(parts)] = RouteNode(None)
+
+        curr = self._allowed[len(parts)]
+        for p in parts:
+            # The wildcard is the empty string, so it is ordered like any other part
+            content = WILDCARD if Router.is_param(p) else p
+            new_node = RouteNode(content)
+            pos_idx = bisect_left(curr.children, new_node)
+            if pos_idx == len(curr.children) or curr.children[pos_idx].content != content:
+                curr.children.insert(pos_idx, new_node)
+            curr = curr.children[pos_idx]
+
+        curr.methods.add(method)
+        curr.allow = Router._build_allow(curr.methods)
+
+    @staticmethod
+    def _collect_allowed(curr: "RouteNode", parts: list[str], i: int,
+                         matches: list["RouteNode"]) -> None:
+        """Collect every terminal node of the method agnostic trie matching a path"""
+        if i == len(parts):
+            if curr.allow is not None:
+                matches.append(curr)
+            return
+
+        p = parts[i]
+        pos_idx = bisect_left(curr.children, RouteNode(p))
+        exact_match = pos_idx < len(curr.children) and curr.children[pos_idx].content == p
+        if exact_match:
+            Router._collect_allowed(curr.children[pos_idx], parts, i + 1, matches)
+        # An empty part matches the wildcard exactly, which has already been followed
+        if curr.children and curr.children[0].content == WILDCARD and not (
+            exact_match and pos_idx == 0
+        ):
+            Router._collect_allowed(curr.children[0], parts, i + 1, matches)
+
+    @staticmethod
+    def _build_allow(methods: set[HTTPMethod]) -> str:
+        # GET routes also answer HEAD requests, and OPTIONS is answered for every route
+        allowed = methods | {HTTPMethod.OPTIONS}
+        if HTTPMethod.GET in allowed:
+            allowed.add(HTTPMethod.HEAD)
+        return ", ".join(m.value for m in HTTPMethod if m in allowed)
         
     def match_route(self, method: HTTPMethod, raw_path: str) -> RouteDetails | None:
         """
         Takes a request path and method and returns the associated function. If
-        a route is not found, None will be returned
+        a route is not found, None will be returned.
+
+        Parts are compared from left to right, and at each part an exact match is tried before a
+        path variable, backtracking to the path variable if the exact match leads to no route. The
+        most specific route therefore wins. Each node of the trie is entered at most once, so a
+        match never costs more than a walk of the routes with the same number of parts.
         """
+        static_details = self._static[method].get(raw_path)
+        if static_details is not None:
+            return static_details
+
         parts = raw_path.split("/")
-        
-        method_routes = self._routes[method]
-        if len(parts) not in method_routes:
+        root = self._routes[method].get(len(parts))
+        if root is None:
+            return None
+        first_parts = self._first_parts[method][len(parts)]
+        if first_parts is not None and parts[1] not in first_parts:
             return None
-    
-        curr = method_routes[len(parts)]
-        for p in parts:
-            new_node = RouteNode(p)
-            pos_idx = bisect_left(curr.children, new_node)
 
-            inbound = pos_idx < len(curr.children)
-            exact_match = inbound and curr.children[pos_idx].content == p
-            # If there is no exact match but a wildcard/path variable exists we follow that
-            if not exact_match:
-                if len(curr.children) >= 1 and curr.children[0].content == WILDCARD:
-                    curr = curr.children[0]
-                else:
-                    return None
-            else:
-                curr = curr.children[pos_idx]
-        
-        return curr.details
+        key = (method, raw_path)
+        if key in self._misses:
+            return None
+        details = Router._match(root, parts, 0)
+        if details is None:
+            self._remember(self._misses, key, None)
+        return details
+
+    @staticmethod
+    def _match(curr: "RouteNode", parts: list[str], i: int) -> RouteDetails | None:
+        """Find the most specific route below a node matching the parts of a path from <i>"""
+        if i == len(parts):
+            return curr.details
+
+        p = parts[i]
+        children = curr.children
+        pos_idx = bisect_left(children, RouteNode(p))
+        exact_match = pos_idx < len(children) and children[pos_idx].content == p
+        if exact_match:
+            details = Router._match(children[pos_idx], parts, i + 1)
+            if details is not None:
+                return details
+        # An empty part matches the wildcard exactly, which has already been followed
+        if children and children[0].content == WILDCARD and not (exact_match and pos_idx == 0):
+            return Router._match(children[0], parts, i + 1)
+        return None
     
     @staticmethod
     def match_path_variables(route_details: RouteDetails, req_path: str) -> PathVariables:
@@ -126,6 +275,9 @@ class RouteNode:
         self.children: list[RouteNode] = []
         # The existence of route details indicates if the node is terminal
         self.details: RouteDetails | None = None
+        # Only used in the method agnostic trie, where the Allow header indicates if it is terminal
+        self.methods: set[HTTPMethod] = set()
+        self.allow: str | None = None
     
     def __lt__(self, other: "RouteNode") -> bool:
         if self.content is None or other.content is None:
@@ -0,0 +1,436 @@
+"""
+Declarative validation and parsing of request bodies, query parameters and path parameters.
+
+Schemas are compiled into validator closures once, when a route is registered. Validators never
+build error locations on the happy path. When a value is invalid, each enclosing container adds
+its segment to the error as it propagates, producing paths such as 'body.items[2].price'.
+"""
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from terminus.types import HTTPError, PathVariables, QueryVariables, RequestBody, RouteError
+
+type Validator = Callable[[Any], Any]
+type Predicate = Callable[[Any], bool]
+type SchemaLike = Schema | dict[str, SchemaLike]
+
+# Marks a key missing from an object, as None is a valid JSON value
+MISSING = object()
+
+TRUE_STRINGS = ("true", "1", "yes")
+FALSE_STRINGS = ("false", "0", "no")
+
+
+class SchemaError(HTTPError):
+    """A request value that does not conform to the schema of a route"""
+    def __init__(self, msg: str) -> None:
+        super().__init__(msg)
+        self.msg = msg
+        # Location of the invalid value, from the outermost container inwards
+        self.segments: list[str] = []
+
+    def prepend(self, segment: str) -> None:
+        self.segments.insert(0, segment)
+
+    @property
+    def path(self) -> str:
+        return "".join(
+            s if i == 0 or s.startswith("[") else "." + s for i, s in enumerate(self.segments)
+        )
+
+    def __str__(self) -> str:
+        return f"Invalid value at '{self.path}': {self.msg}"
+
+
+class Schema(ABC):
+    """
+    A node of a schema. Combining a schema with None using | allows null values, and allows the
+    key to be missing when used as a field. Combining schemas with | accepts any of them.
+    """
+    def __init__(self, validate: Predicate | None = None) -> None:
+        self.predicate = validate
+
+    def compile(self, coerce: bool) -> Validator:
+        """
+        Compile the schema into a validator function. If <coerce> is set, values may be parsed from
+        strings (e.g. for query and path parameters)
+        """
+        validator = self._compile(coerce)
+        predicate = self.predicate
+        if predicate is None:
+            return validator
+
+        def validate_predicate(value: Any) -> Any:
+            value = validator(value)
+            if not predicate(value):
+                raise SchemaError("failed validation")
+            return value
+        return validate_predicate
+
+    @abstractmethod
+    def _compile(self, coerce: bool) -> Validator:
+        """Compile the validator of this kind of schema, without its predicate"""
+
+    @property
+    def optional(self) -> bool:
+        return False
+
+    def __or__(self, other: "Schema | None") -> "Schema":
+        if other is None:
+            return NullableSchema(self)
+        return UnionSchema(self, other)
+
+    def __ror__(self, other: "Schema | None") -> "Schema":
+        if other is None:
+            return NullableSchema(self)
+        return UnionSchema(other, self)
+
+
+class AnySchema(Schema):
+    def _compile(self, coerce: bool) -> Validator:
+        return lambda value: value
+
+
+class IntSchema(Schema):
+    def __init__(self, min: int | None = None, max: int | None = None,
+                 validate: Predicate | None = None) -> None:
+        super().__init__(validate)
+        self.min = min
+        self.max = max
+
+    def _compile(self, coerce: bool) -> Validator:
+        lo, hi = self.min, self.max
+
+        def validate_int(value: Any) -> Any:
+            # Booleans are a subclass of int, so the type is compared exactly
+            if type(value) is not int:
+                if not (coerce and isinstance(value, str)):
+                    raise SchemaError("expected an integer")
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise SchemaError("expected an integer") from None
+            if lo is not None and value < lo:
+                raise SchemaError(f"must be at least {lo}")
+            if hi is not None and value > hi:
+                raise SchemaError(f"must be at most {hi}")
+            return value
+        return validate_int
+
+
+class FloatSchema(Schema):
+    def __init__(self, min: float | None = None, max: float | None = None,
+                 validate: Predicate | None = None) -> None:
+        super().__init__(validate)
+        self.min = min
+        self.max = max
+
+    def _compile(self, coerce: bool) -> Validator:
+        lo, hi = self.min, self.max
+
+        def validate_float(value: Any) -> Any:
+            value_type = type(value)
+            if value_type is int:
+                value = float(value)
+            elif value_type is not float:
+                if not (coerce and isinstance(value, str)):
+                    raise SchemaError("expected a number")
+                try:
+                    value = float(value)
+                except ValueError:
+                    raise SchemaError("expected a number") from None
+            if lo is not None and value < lo:
+                raise SchemaError(f"must be at least {lo}")
+            if hi is not None and value > hi:
+                raise SchemaError(f"must be at most {hi}")
+            return value
+        return validate_float
+
+
+class BoolSchema(Schema):
+    def _compile(self, coerce: bool) -> Validator:
+        def validate_bool(value: Any) -> Any:
+            if type(value) is bool:
+                return value
+            if coerce and isinstance(value, str):
+                lowered = value.lower()
+                if lowered in TRUE_STRINGS:
+                    return True
+                if lowered in FALSE_STRINGS:
+                    return False
+            raise SchemaError("expected a boolean")
+        return validate_bool
+
+
+class StringSchema(Schema):
+    def __init__(self, pattern: str | re.Pattern[str] | None = None,
+                 min_length: int | None = None, max_length: int | None = None,
+                 validate: Predicate | None = None) -> None:
+        super().__init__(validate)
+        self.pattern = None if pattern is None else re.compile(pattern)
+        self.min_length = min_length
+        self.max_length = max_length
+
+    def _compile(self, coerce: bool) -> Validator:
+        lo, hi = self.min_length, self.max_length
+        match = None if self.pattern is None else self.pattern.fullmatch
+        pattern_str = None if self.pattern is None else self.pattern.pattern
+
+        def validate_string(value: Any) -> Any:
+            if type(value) is not str:
+                raise SchemaError("expected a string")
+            if lo is not None and len(value) < lo:
+                raise SchemaError(f"must have a length of at least {lo}")
+            if hi is not None and len(value) > hi:
+                raise SchemaError(f"must have a length of at most {hi}")
+            if match is not None and match(value) is None:
+                raise SchemaError(f"must match the pattern '{pattern_str}'")
+            return value
+        return validate_string
+
+
+class LiteralSchema(Schema):
+    def __init__(self, *values: Any) -> None:
+        super().__init__()
+        self.values = values
+
+    def _compile(self, coerce: bool) -> Validator:
+        allowed = frozenset(self.values)
+        # When coercing from strings, the string form of each value is accepted too
+        from_str = {str(v): v for v in self.values} if coerce else {}
+        description = ", ".join(repr(v) for v in self.values)
+
+        def validate_literal(value: Any) -> Any:
+            try:
+                if value in allowed:
+                    return value
+                if value in from_str:
+                    return from_str[value]
+            except TypeError:
+                # Unhashable values can't be one of the literals
+                pass
+            raise SchemaError(f"must be one of {description}")
+        return validate_literal
+
+
+class ListSchema(Schema):
+    def __init__(self, elements: SchemaLike | None = None, length: int | None = None,
+                 min_length: int | None = None, max_length: int | None = None,
+                 validate: Predicate | None = None) -> None:
+        super().__init__(validate)
+        self.elements = None if elements is None else to_schema(elements)
+        self.min_length = length if length is not None else min_length
+        self.max_length = length if length is not None else max_length
+
+    def _compile(self, coerce: bool) -> Validator:
+        lo, hi = self.min_length, self.max_length
+        element = None if self.elements is None else self.elements.compile(coerce)
+
+        def validate_list(value: Any) -> Any:
+            if type(value) is not list:
+                # Query parameters only become lists when they are repeated
+                if not (coerce and isinstance(value, str)):
+                    raise SchemaError("expected a list")
+                value = [value]
+            if lo is not None and len(value) < lo:
+                raise SchemaError(f"must have at least {lo} elements")
+            if hi is not None and len(value) > hi:
+                raise SchemaError(f"must have at most {hi} elements")
+            if element is None:
+                return value
+
+            # Converted values are written to a copy, so the original is never mutated. The copy is
+            # only made once an element is converted, so valid bodies are not copied.
+            out = None
+            i = 0
+            try:
+                for item in value:
+                    converted = element(item)
+                    if out is not None:
+                        out.append(converted)
+                    elif converted is not item:
+                        out = value[:i]
+                        out.append(converted)
+                    i += 1
+            except SchemaError as e:
+                e.prepend(f"[{i}]")
+                raise
+            return value if out is None else out
+        return validate_list
+
+
+class DictSchema(Schema):
+    def __init__(self, fields: dict[str, SchemaLike], allow_extra: bool = True,
+                 validate: Predicate | None = None) -> None:
+        super().__init__(validate)
+        self.fields = {name: to_schema(field) for name, field in fields.items()}
+        self.allow_extra = allow_extra
+
+    def _compile(self, coerce: bool) -> Validator:
+        fields = [
+            (name, field.compile(coerce), field.optional) for name, field in self.fields.items()
+        ]
+        known = frozenset(self.fields)
+        allow_extra = self.allow_extra
+
+        def validate_dict(value: Any) -> Any:
+            if type(value) is not dict:
+                raise SchemaError("expected an object")
+            if not allow_extra and len(value) > len(known):
+                for key in value:
+                    if key not in known:
+                        error = SchemaError("is not an allowed key")
+                        error.prepend(str(key))
+                        raise error
+            # Converted values are written to a copy, so the original is never mutated
+            out = value
+            name = ""
+            try:
+                for name, validator, optional in fields:
+                    item = value.get(name, MISSING)
+                    if item is not MISSING:
+                        converted = validator(item)
+                        if converted is not item:
+                            if out is value:
+                                out = dict(value)
+                            out[name] = converted
+                    elif not optional:
+                        raise SchemaError("is required")
+            except SchemaError as e:
+                e.prepend(name)
+                raise
+            return out
+        return validate_dict
+
+
+class NullableSchema(Schema):
+    def __init__(self, inner: Schema) -> None:
+        super().__init__()
+        self.inner = inner
+
+    @property
+    def optional(self) -> bool:
+        return True
+
+    def _compile(self, coerce: bool) -> Validator:
+        inner = self.inner.compile(coerce)
+        return lambda value: None if value is None else inner(value)
+
+
+class UnionSchema(Schema):
+    def __init__(self, *options: Schema) -> None:
+        super().__init__()
+        self.options = options
+
+    def _compile(self, coerce: bool) -> Validator:
+        validators = [option.compile(coerce) for option in self.options]
+
+        def validate_union(value: Any) -> Any:
+            for validator in validators:
+                try:
+                    return validator(value)
+                except SchemaError:
+                    pass
+            raise SchemaError("does not match any of the allowed schemas")
+        return validate_union
+
+
+class SchemaBuilders:
+    """Shorthands for building schema nodes, intended to be used through the `s` instance"""
+    # Annotations are evaluated in the class namespace, so methods shadowing a builtin are
+    # declared after every method annotated with that builtin
+    @staticmethod
+    def string(pattern: str | re.Pattern[str] | None = None, min_length: int | None = None,
+               max_length: int | None = None, validate: Predicate | None = None) -> Schema:
+        return StringSchema(pattern, min_length, max_length, validate)
+
+    @staticmethod
+    def list(elements: SchemaLike | None = None, length: int | None = None,
+             min_length: int | None = None, max_length: int | None = None,
+             validate: Predicate | None = None) -> Schema:
+        return ListSchema(elements, length, min_length, max_length, validate)
+
+    @staticmethod
+    def dict(fields: dict[str, SchemaLike], allow_extra: bool = True,
+             validate: Predicate | None = None) -> Schema:
+        return DictSchema(fields, allow_extra, validate)
+
+    @staticmethod
+    def literal(*values: Any) -> Schema:
+        return LiteralSchema(*values)
+
+    @staticmethod
+    def any(validate: Predicate | None = None) -> Schema:
+        return AnySchema(validate)
+
+    @staticmethod
+    def int(min: int | None = None, max: int | None = None,
+            validate: Predicate | None = None) -> Schema:
+        return IntSchema(min, max, validate)
+
+    @staticmethod
+    def float(min: float | None = None, max: float | None = None,
+              validate: Predicate | None = None) -> Schema:
+        return FloatSchema(min, max, validate)
+
+    @staticmethod
+    def bool() -> Schema:
+        return BoolSchema()
+
+s = SchemaBuilders()
+
+
+def to_schema(schema: SchemaLike) -> Schema:
+    """Convert a plain dictionary of fields into a schema"""
+    if isinstance(schema, dict):
+        return DictSchema(schema)
+    if not isinstance(schema, Schema):
+        raise RouteError(f"'{schema}' is not a valid schema")
+    return schema
+
+
+class RouteSchema:
+    """
+    The schemas a request to a route must conform to. The body is validated as is, while query and
+    path parameters are parsed from their string form, so s.int() produces an integer. Query
+    parameters without a schema are passed through unchanged.
+    """
+    def __init__(self, body: SchemaLike | None = None,
+                 query: dict[str, SchemaLike] | None = None,
+                 path: dict[str, SchemaLike] | None = None) -> None:
+        self.path_variables = frozenset(path or {})
+        self._body = None if body is None else to_schema(body).compile(coerce=False)
+        self._query = None if query is None else DictSchema(query).compile(coerce=True)
+        self._path = None if path is None else DictSchema(path).compile(coerce=True)
+
+    @property
+    def has_body(self) -> bool:
+        return self._body is not None
+
+    def check_route(self, raw_path: str, path_variables: Iterable[str]) -> None:
+        """Make sure every path parameter with a schema exists in the route"""
+        missing = self.path_variables - set(path_variables)
+        if missing:
+            raise RouteError(f"Route '{raw_path}' has no path variables named " +
+                             ", ".join(sorted(missing)))
+
+    def apply(self, body: RequestBody | None, params: PathVariables, query: QueryVariables
+              ) -> tuple[Any, PathVariables, QueryVariables]:
+        """Validate the parts of a request, returning the parsed body, params and query"""
+        return (
+            RouteSchema._run(self._body, body, "body"),
+            RouteSchema._run(self._path, params, "path"),
+            RouteSchema._run(self._query, query, "query")
+        )
+
+    @staticmethod
+    def _run(validator: Validator | None, value: Any, root: str) -> Any:
+        if validator is None:
+            return value
+        try:
+            return validator(value)
+        except SchemaError as e:
+            e.prepend(root)
+            raise
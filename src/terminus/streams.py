@@ -0,0 +1,66 @@
+"""
+Incremental reading of request bodies, including bodies sent with chunked transfer encoding which
+have no known length
+"""
+import json
+from collections.abc import Iterator
+from typing import IO, Any
+
+from terminus.types import HTTPError
+
+READ_CHUNK_SIZE = 64 * 1024
+# A single streamed record is held in memory while it is decoded, so its size is limited
+MAX_RECORD_SIZE = 1024 * 1024
+
+NDJSON_SEPARATOR = b"\n"
+JSON_SEQ_SEPARATOR = b"\x1e"
+
+
+def read_body(stream: IO[bytes], content_len: int | None) -> bytes:
+    """Read a whole body, where a body with no length is read until the server signals its end"""
+    if content_len is None:
+        return stream.read()
+    return stream.read(content_len)
+
+
+def iter_chunks(stream: IO[bytes], content_len: int | None,
+                chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read a body in chunks of at most <chunk_size> bytes"""
+    remaining = content_len
+    while remaining is None or remaining > 0:
+        chunk = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+
+
+def iter_json_records(stream: IO[bytes], content_len: int | None, separator: bytes,
+                      max_record_size: int = MAX_RECORD_SIZE) -> Iterator[Any]:
+    """
+    Lazily decode a body of JSON records split by a separator, which is a line feed for NDJSON and
+    a record separator character for JSON text sequences. Records are only read from the stream as
+    they are consumed, so memory use does not grow with the size of the body. Blank records are
+    skipped and are not counted when numbering records in errors.
+    """
+    buffer = b""
+    number = 0
+    for chunk in iter_chunks(stream, content_len):
+        records = (buffer + chunk).split(separator)
+        buffer = records.pop()
+        for raw in records:
+            if raw.strip():
+                number += 1
+                yield _decode_record(raw, number)
+        if len(buffer) > max_record_size:
+            raise HTTPError(f"Record {number + 1} is larger than {max_record_size} bytes", 413)
+    if buffer.strip():
+        yield _decode_record(buffer, number + 1)
+
+
+def _decode_record(raw: bytes, number: int) -> Any:
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        raise HTTPError(f"Record {number} is not valid JSON: {e}")
@@ -0,0 +1,380 @@
+"""
+Decoding of JSON bodies directly into typed structs, which are either dataclasses or classes with
+__slots__ whose __init__ parameters are annotated, and encoding of structs returned from routes.
+
+Bodies are parsed by the C accelerated JSON decoder, and converters compiled from the declared type
+then build each struct with a single constructor call. When an object has exactly the fields of its
+struct with the expected JSON types, as almost every valid body does, the fields are read in one
+step with no per field checks in Python. Other objects take a slower path which fills in defaults
+and finds the field at fault for the error.
+
+Encoding goes through the C accelerated JSON encoder, which calls back for each struct it meets.
+The callback is chosen once per class and gives the encoder the fields as a flat dictionary, which
+for most dataclasses is the __dict__ of the object itself. Unlike dataclasses.asdict() nothing is
+deep copied and the object graph is only walked once.
+"""
+import inspect
+import json
+import types
+import typing
+from collections.abc import Callable
+from dataclasses import MISSING as DATACLASS_MISSING
+from dataclasses import fields, is_dataclass
+from operator import itemgetter
+from typing import Any
+
+from terminus.schema import SchemaError
+from terminus.types import HTTPError, RouteError
+
+type Converter = Callable[[Any], Any]
+type BodyDecoder = Callable[[bytes], Any]
+type FieldReader = Callable[[Any], dict[str, Any]]
+
+# Marks a field missing from an object, as None is a valid JSON value
+MISSING = object()
+
+_decoder = json.JSONDecoder()
+# Builders are cached per class, which also allows structs to refer to themselves
+_builders: dict[type, Converter] = {}
+_field_readers: dict[type, FieldReader] = {}
+_is_struct: dict[type, bool] = {}
+
+
+def compile_decoder(tp: Any) -> BodyDecoder:
+    """
+    Compile a decoder which parses a raw JSON body into some type. Struct fields and elements of
+    typed containers are checked as they are converted, so the body is rejected with a 400 response
+    on unknown, missing or mistyped fields.
+    """
+    converter = _compile_type(tp)
+    decode = _decoder.decode
+
+    def decode_body(raw: bytes) -> Any:
+        try:
+            value = decode(raw.decode("utf-8"))
+        except ValueError as e:
+            raise HTTPError(f"Body is not valid JSON: {e}")
+        try:
+            return converter(value)
+        except SchemaError as e:
+            e.prepend("body")
+            raise
+    return decode_body
+
+
+def encode_json(value: Any) -> str:
+    """
+    Encode a value as JSON, where structs may appear anywhere within it. The output is the same as
+    json.dumps() for values that contain no structs.
+    """
+    return _encoder(value)
+
+
+def field_reader(cls: type) -> FieldReader:
+    """Get the function which reads the fields of a struct into a dictionary, compiling it once"""
+    reader = _field_readers.get(cls)
+    if reader is None:
+        if not is_struct(cls):
+            raise TypeError(f"Object of type {cls.__name__} is not JSON serializable")
+        names = encoded_fields(cls)
+        if not names:
+            raise TypeError(f"Object of type {cls.__name__} has no public fields to serialize")
+        reader = _field_readers[cls] = _compile_reader(cls, names)
+    return reader
+
+
+def _compile_reader(cls: type, names: list[str]) -> FieldReader:
+    def read_slots(value: Any) -> dict[str, Any]:
+        return {name: getattr(value, name) for name in names}
+
+    if all("__slots__" in vars(base) for base in cls.__mro__[:-1]):
+        return read_slots
+    field_names = frozenset(names)
+
+    def read_dict(value: Any) -> dict[str, Any]:
+        # The attributes of a dataclass are usually exactly its fields, in which case they are
+        # handed to the encoder as they are rather than copied
+        attributes = value.__dict__
+        if attributes.keys() == field_names:
+            return attributes
+        return read_slots(value)
+    return read_dict
+
+
+def encoded_fields(cls: type) -> list[str]:
+    """Get the names of the fields of a struct which are included when it is encoded"""
+    if is_dataclass(cls):
+        return [f.name for f in fields(cls)]
+    names: list[str] = []
+    for base in reversed(cls.__mro__):
+        slots = vars(base).get("__slots__", ())
+        for name in [slots] if isinstance(slots, str) else slots:
+            if not name.startswith("_") and name not in names:
+                names.append(name)
+    return names
+
+
+def read_fields(value: Any) -> dict[str, Any]:
+    """
+    Read the fields of a struct into a dictionary, raising a TypeError for other values. The
+    dictionary may be the __dict__ of the struct, so it must not be modified.
+    """
+    # The encoder calls this for every struct, so the cached reader is looked up directly
+    reader = _field_readers.get(type(value))
+    if reader is None:
+        reader = field_reader(type(value))
+    return reader(value)
+
+
+_encoder = json.JSONEncoder(default=read_fields).encode
+
+
+def is_struct(tp: Any) -> bool:
+    """
+    Determine if a type can be decoded as a struct. Classes with __slots__ are only structs if they
+    have a public field, so library classes keeping private state in slots, such as IPv4Address or
+    Path, are not mistaken for empty structs.
+    """
+    if not isinstance(tp, type):
+        return False
+    found = _is_struct.get(tp)
+    if found is None:
+        found = _is_struct[tp] = is_dataclass(tp) or (
+            "__slots__" in vars(tp) and bool(encoded_fields(tp))
+        )
+    return found
+
+
+def struct_fields(cls: type) -> list[tuple[str, Any, Callable[[], Any] | None]]:
+    """
+    Get the name, type and default factory of each field of a struct, in the order its __init__
+    accepts them
+    """
+    if is_dataclass(cls):
+        hints = typing.get_type_hints(cls)
+        struct = []
+        for f in fields(cls):
+            if not f.init:
+                continue
+            if f.kw_only:
+                raise RouteError(f"Keyword only field '{f.name}' of '{cls.__name__}' is not " +
+                                 "supported in a struct")
+            if f.default is not DATACLASS_MISSING:
+                default = f.default
+                struct.append((f.name, hints[f.name], lambda default=default: default))
+            elif f.default_factory is not DATACLASS_MISSING:
+                struct.append((f.name, hints[f.name], f.default_factory))
+            else:
+                struct.append((f.name, hints[f.name], None))
+        return struct
+
+    hints = typing.get_type_hints(cls.__init__)
+    struct = []
+    for name, param in list(inspect.signature(cls.__init__).parameters.items())[1:]:
+        if param.kind is not inspect.Parameter.POSITIONAL_OR_KEYWORD:
+            raise RouteError(f"Parameter '{name}' of '{cls.__name__}.__init__' must be " +
+                             "positional to be used in a struct")
+        if name not in hints:
+            raise RouteError(f"Parameter '{name}' of '{cls.__name__}.__init__' has no type " +
+                             "annotation")
+        if param.default is inspect.Parameter.empty:
+            struct.append((name, hints[name], None))
+        else:
+            default = param.default
+            struct.append((name, hints[name], lambda default=default: default))
+    return struct
+
+
+def _compile_type(tp: Any) -> Converter:
+    """Compile a converter from a decoded JSON value into some type"""
+    if tp is Any or tp is object:
+        return _untyped
+    if tp is bool:
+        return _scalar_checker(bool, "a boolean")
+    if tp is int:
+        return _scalar_checker(int, "an integer")
+    if tp is str:
+        return _scalar_checker(str, "a string")
+    if tp is float:
+        return _convert_float
+    if tp is types.NoneType or tp is None:
+        return _scalar_checker(types.NoneType, "null")
+
+    origin = typing.get_origin(tp)
+    args = typing.get_args(tp)
+    if origin is list:
+        return _list_converter(_compile_type(args[0]) if args else _untyped)
+    if origin is dict:
+        if args and args[0] is not str:
+            raise RouteError(f"Only dictionaries with string keys can be decoded, not '{tp}'")
+        return _dict_converter(_compile_type(args[1]) if args else _untyped)
+    if tp is list:
+        return _list_converter(_untyped)
+    if tp is dict:
+        return _dict_converter(_untyped)
+    if origin in (types.UnionType, typing.Union):
+        non_null = [arg for arg in args if arg is not types.NoneType]
+        if len(non_null) == 1 and len(args) == 2:
+            inner = _compile_type(non_null[0])
+            return lambda value: None if value is None else inner(value)
+        raise RouteError(f"Only unions with None can be decoded, not '{tp}'")
+    if is_struct(tp):
+        return _struct_builder(tp)
+    raise RouteError(f"Type '{tp}' cannot be decoded from JSON")
+
+
+def _struct_builder(cls: type) -> Converter:
+    if cls in _builders:
+        return _builders[cls]
+
+    names: list[str] = []
+    converters: list[Converter] = []
+    defaults: list[Callable[[], Any] | None] = []
+    index: dict[str, int] = {}
+    # The JSON type of each field, if every field has one that needs no conversion when matched
+    expected: tuple[type, ...] | None = None
+    # The fields still converted once their JSON type has matched, such as lists and structs
+    nested: list[tuple[int, Converter]] = []
+    read_values: Callable[[dict], tuple] = tuple
+    count = 0
+
+    def build_struct(value: Any) -> Any:
+        if type(value) is dict and len(value) == count:
+            try:
+                values = read_values(value)
+                if expected is None:
+                    return cls(*[convert(item) for convert, item in zip(converters, values, strict=True)])
+                if tuple(map(type, values)) == expected:
+                    if nested:
+                        values = list(values)
+                        for i, convert in nested:
+                            values[i] = convert(values[i])
+                    return cls(*values)
+            except (KeyError, SchemaError):
+                # Unknown keys and invalid values are reported by the full check below
+                pass
+        return check_struct(value)
+
+    def check_struct(value: Any) -> Any:
+        if type(value) is not dict:
+            raise SchemaError("expected an object")
+        values = [MISSING] * count
+        key = ""
+        try:
+            for key, item in value.items():
+                i = index.get(key)
+                if i is None:
+                    raise SchemaError("is not an allowed key")
+                values[i] = converters[i](item)
+        except SchemaError as e:
+            e.prepend(key)
+            raise
+
+        for i in range(count):
+            if values[i] is MISSING:
+                default = defaults[i]
+                if default is None:
+                    error = SchemaError("is required")
+                    error.prepend(names[i])
+                    raise error
+                values[i] = default()
+        return cls(*values)
+
+    # Registered before the fields are compiled, so a struct can contain itself
+    _builders[cls] = build_struct
+    json_types: list[type | None] = []
+    try:
+        for name, field_type, default in struct_fields(cls):
+            index[name] = len(names)
+            names.append(name)
+            defaults.append(default)
+            converters.append(_compile_type(field_type))
+            json_types.append(_json_type(field_type))
+    except RouteError:
+        del _builders[cls]
+        raise
+    count = len(names)
+    # Every field is read in one call, which gives a tuple only when there are at least two
+    if count > 1:
+        read_values = itemgetter(*names)
+    else:
+        read_values = lambda value: tuple(value[name] for name in names)
+    if None not in json_types:
+        expected = tuple(typing.cast(list[type], json_types))
+        nested = [(i, converters[i]) for i, tp in enumerate(json_types) if tp in (list, dict)]
+    return build_struct
+
+
+def _json_type(tp: Any) -> type | None:
+    """
+    Get the type a JSON value must have to be converted into some type, or None if values of
+    several types are accepted
+    """
+    if tp in (bool, int, str, list, dict):
+        return tp
+    origin = typing.get_origin(tp)
+    if origin in (list, dict):
+        return origin
+    if is_struct(tp):
+        return dict
+    # Floats also accept integers, and unions and untyped values accept several types
+    return None
+
+
+def _scalar_checker(tp: type, description: str) -> Converter:
+    def check_scalar(value: Any) -> Any:
+        # Types are compared exactly as booleans are a subclass of integers
+        if type(value) is not tp:
+            raise SchemaError(f"expected {description}")
+        return value
+    return check_scalar
+
+
+def _convert_float(value: Any) -> Any:
+    value_type = type(value)
+    if value_type is float:
+        return value
+    if value_type is int:
+        return float(value)
+    raise SchemaError("expected a number")
+
+
+def _list_converter(element: Converter) -> Converter:
+    def convert_list(value: Any) -> Any:
+        if type(value) is not list:
+            raise SchemaError("expected a list")
+        try:
+            return list(map(element, value))
+        except SchemaError:
+            pass
+        # The elements are converted again one at a time to find the index of the invalid one
+        out = []
+        try:
+            for item in value:
+                out.append(element(item))
+        except SchemaError as e:
+            e.prepend(f"[{len(out)}]")
+            raise
+        return out
+    return convert_list
+
+
+def _dict_converter(element: Converter) -> Converter:
+    def convert_dict(value: Any) -> Any:
+        if type(value) is not dict:
+            raise SchemaError("expected an object")
+        out = {}
+        key = ""
+        try:
+            for key, item in value.items():
+                out[key] = element(item)
+        except SchemaError as e:
+            e.prepend(key)
+            raise
+        return out
+    return convert_dict
+
+
+def _untyped(value: Any) -> Any:
+    """Untyped values are kept as they were decoded"""
+    return value
@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.middleware import create_bearer_auth
+from terminus.middleware.bearer import TokenCache
+from terminus.tests.utils import build_environ, call
+from terminus.types import Request, RouteError
+
+SECRET = "secret"
+
+
+def encode(segment: dict[str, Any] | bytes) -> str:
+    raw = segment if isinstance(segment, bytes) else json.dumps(segment).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def make_token(claims: dict[str, Any], secret: str = SECRET, alg: str = "HS256") -> str:
+    signed = f"{encode({'alg': alg, 'typ': 'JWT'})}.{encode(claims)}"
+    digest = {"HS256": hashlib.sha256, "HS512": hashlib.sha512}[alg]
+    signature = hmac.new(secret.encode("utf-8"), signed.encode("ascii"), digest).digest()
+    return f"{signed}.{encode(signature)}"
+
+def me_environ(auth: str | None = None) -> dict:
+    return build_environ("/me", custom_fields={} if auth is None else {"HTTP_AUTHORIZATION": auth})
+
+def test_valid_token() -> None:
+    api = API()
+
+    @api.get("/me", pre=[create_bearer_auth(SECRET)])
+    def me(req: Request):
+        return {"sub": req.context["claims"]["sub"]}
+
+    token = make_token({"sub": "ada", "exp": time.time() + 60})
+    status, _, body = call(api, me_environ(f"Bearer {token}"))
+
+    assert (status, body) == ("200 OK", b'{"sub": "ada"}')
+
+@pytest.mark.parametrize("auth", [
+    None,
+    "Basic abc",
+    "Bearer not.a.token",
+    "Bearer " + make_token({"sub": "ada"}, secret="wrong"),
+    "Bearer " + make_token({"sub": "ada", "exp": time.time() - 1}),
+    "Bearer " + make_token({"sub": "ada", "nbf": time.time() + 60}),
+    "Bearer " + make_token({"sub": "ada"}, alg="HS512"),
+])
+def test_rejected_tokens(auth: str | None) -> None:
+    api = API()
+    api.get("/me", pre=[create_bearer_auth(SECRET)])(lambda req: "ok")
+    status, headers, _ = call(api, me_environ(auth))
+
+    assert status == "401 Unauthorized"
+    assert headers["WWW-Authenticate"].startswith("Bearer")
+
+def test_audience_and_issuer() -> None:
+    api = API()
+    api.get("/me", pre=[create_bearer_auth(SECRET, audience="api", issuer="auth")])(
+        lambda req: "ok"
+    )
+    good = make_token({"sub": "ada", "aud": ["web", "api"], "iss": "auth"})
+    wrong_aud = make_token({"sub": "ada", "aud": "web", "iss": "auth"})
+    wrong_iss = make_token({"sub": "ada", "aud": "api", "iss": "other"})
+
+    assert call(api, me_environ(f"Bearer {good}"))[0] == "200 OK"
+    assert call(api, me_environ(f"Bearer {wrong_aud}"))[0] == "401 Unauthorized"
+    assert call(api, me_environ(f"Bearer {wrong_iss}"))[0] == "401 Unauthorized"
+
+def test_verified_tokens_are_cached(mocker: MockerFixture) -> None:
+    api = API()
+    api.get("/me", pre=[create_bearer_auth(SECRET)])(lambda req: "ok")
+    token = make_token({"sub": "ada", "exp": time.time() + 60})
+    digest = mocker.spy(hmac, "new")
+    loads = mocker.spy(json, "loads")
+    for _ in range(5):
+        assert call(api, me_environ(f"Bearer {token}"))[0] == "200 OK"
+
+    assert digest.call_count == 1
+    assert loads.call_count == 2
+
+def test_cached_tokens_expire(mocker: MockerFixture) -> None:
+    cache = TokenCache()
+    api = API()
+    api.get("/me", pre=[create_bearer_auth(SECRET, cache=cache)])(lambda req: "ok")
+    token = make_token({"sub": "ada", "exp": time.time() + 60})
+    assert call(api, me_environ(f"Bearer {token}"))[0] == "200 OK"
+
+    mocker.patch("terminus.middleware.bearer.time.time", return_value=time.time() + 120)
+    assert call(api, me_environ(f"Bearer {token}"))[0] == "401 Unauthorized"
+    assert len(cache) == 0
+
+def test_shared_cache_keeps_configurations_apart() -> None:
+    cache = TokenCache()
+    api = API()
+    api.get("/me", pre=[create_bearer_auth(SECRET, cache=cache)])(lambda req: "ok")
+    api.get("/other", pre=[create_bearer_auth("other secret", cache=cache)])(lambda req: "ok")
+    api.get("/admin", pre=[create_bearer_auth(SECRET, audience="admin", cache=cache)])(
+        lambda req: "ok"
+    )
+    token = make_token({"sub": "ada", "exp": time.time() + 60})
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    assert call(api, build_environ("/me", custom_fields=auth))[0] == "200 OK"
+    # The token is cached, but not for middleware with another secret or audience
+    assert call(api, build_environ("/other", custom_fields=auth))[0] == "401 Unauthorized"
+    assert call(api, build_environ("/admin", custom_fields=auth))[0] == "401 Unauthorized"
+    assert len(cache) == 1
+
+def test_cache_is_bounded() -> None:
+    cache = TokenCache(max_size=2)
+    for key in (b"a", b"b", b"c"):
+        cache.put(key, float("inf"), {})
+
+    assert len(cache) == 2
+    assert cache.get(b"a", 0) is None
+
+def test_unsupported_algorithm() -> None:
+    with pytest.raises(RouteError):
+        create_bearer_auth(SECRET, algorithms=("none",))
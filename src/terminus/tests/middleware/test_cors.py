@@ -0,0 +1,118 @@
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.middleware import create_cors
+from terminus.tests.utils import build_environ, call
+from terminus.types import HTTPError, HTTPMethod, Request, RouteError
+
+
+def preflight(origin: str, method: str = "PUT") -> dict:
+    return build_environ("/users/1", HTTPMethod.OPTIONS, custom_fields={
+        "HTTP_ORIGIN": origin, "HTTP_ACCESS_CONTROL_REQUEST_METHOD": method
+    })
+
+def test_allowed_origin() -> None:
+    api = API(cors=create_cors(["https://app.example.com"], allow_credentials=True,
+                               expose_headers=["X-Total"]))
+    api.get("/users/[id]")(lambda req: {"id": req.params["id"]})
+    status, headers, _ = call(api, build_environ(
+        "/users/1", custom_fields={"HTTP_ORIGIN": "https://app.example.com"}
+    ))
+
+    assert status == "200 OK"
+    assert headers["Access-Control-Allow-Origin"] == "https://app.example.com"
+    assert headers["Access-Control-Allow-Credentials"] == "true"
+    assert headers["Access-Control-Expose-Headers"] == "X-Total"
+    assert headers["Vary"] == "Origin"
+
+def test_headers_on_errors(mocker: MockerFixture) -> None:
+    api = API(cors=create_cors())
+
+    @api.get("/users/[id]")
+    def user(req: Request):
+        raise HTTPError("User not found", 404)
+
+    start_response = mocker.Mock()
+    api(build_environ("/users/0", custom_fields={"HTTP_ORIGIN": "https://a.com"}),
+        start_response)
+    status, headers = start_response.call_args[0]
+
+    assert status == "404 Not Found"
+    assert ("Access-Control-Allow-Origin", "*") in headers
+
+def test_disallowed_origin() -> None:
+    api = API(cors=create_cors(["https://app.example.com"]))
+    api.get("/users/[id]")(lambda req: {"id": req.params["id"]})
+    status, headers, _ = call(api, build_environ(
+        "/users/1", custom_fields={"HTTP_ORIGIN": "https://evil.com"}
+    ))
+
+    assert status == "200 OK"
+    assert "Access-Control-Allow-Origin" not in headers
+    # Caches must not reuse the response for an allowed origin
+    assert headers["Vary"] == "Origin"
+    assert call(api, build_environ("/users/1"))[1]["Vary"] == "Origin"
+    status, headers, _ = call(api, preflight("https://evil.com"))
+    assert (status, headers["Vary"]) == ("403 Forbidden", "Origin")
+    # Including responses sent before any middleware runs
+    status, headers, _ = call(api, build_environ(
+        "/missing", custom_fields={"HTTP_ORIGIN": "https://evil.com"}
+    ))
+    assert (status, headers["Vary"]) == ("404 Not Found", "Origin")
+
+def test_any_origin_does_not_vary(mocker: MockerFixture) -> None:
+    api = API(cors=create_cors())
+    api.get("/users/[id]")(lambda req: {"id": req.params["id"]})
+    for fields in ({}, {"HTTP_ORIGIN": "https://a.com"}):
+        start_response = mocker.Mock()
+        api(build_environ("/users/1", custom_fields=fields), start_response)
+
+        assert ("Vary", "Origin") not in start_response.call_args[0][1]
+
+def test_preflight_skips_routing(mocker: MockerFixture) -> None:
+    api = API(cors=create_cors(["https://app.example.com"], max_age=3600))
+    api.put("/users/[id]")(lambda req: {"id": req.params["id"]})
+    match_route = mocker.spy(api._router, "match_route")
+    status, headers, _ = call(api, preflight("https://app.example.com"))
+
+    assert status == "204 No Content"
+    assert match_route.call_count == 0
+    assert headers["Access-Control-Max-Age"] == "3600"
+    assert "PUT" in headers["Access-Control-Allow-Methods"]
+    assert call(api, preflight("https://app.example.com", "TRACE"))[0] == "403 Forbidden"
+
+def test_plain_options_still_routed() -> None:
+    api = API(cors=create_cors())
+    api.get("/users/[id]")(lambda req: {"id": req.params["id"]})
+    status, headers, _ = call(api, build_environ("/users/1", HTTPMethod.OPTIONS))
+
+    assert status == "204 No Content"
+    assert "GET" in headers["Allow"]
+
+def test_wildcard_subdomains(mocker: MockerFixture) -> None:
+    cors = create_cors(["https://*.example.com", "https://*.example.org", "http://localhost"])
+
+    assert cors.allows("https://app.example.com")
+    assert cors.allows("https://a.b.example.org")
+    assert cors.allows("http://localhost")
+    assert not cors.allows("https://example.com")
+    assert not cors.allows("https://evil-example.com")
+    assert not cors.allows("http://app.example.com")
+    assert not cors.allows("https://example.com.evil.com")
+
+def test_origin_headers_are_cached(mocker: MockerFixture) -> None:
+    cors = create_cors(["https://*.example.com"])
+    api = API(cors=cors)
+    api.get("/users/[id]")(lambda req: {"id": req.params["id"]})
+    allows = mocker.spy(cors, "allows")
+    for _ in range(3):
+        call(api, build_environ("/users/1",
+                                custom_fields={"HTTP_ORIGIN": "https://app.example.com"}))
+        call(api, preflight("https://app.example.com"))
+
+    assert allows.call_count == 1
+
+def test_credentials_need_listed_origins() -> None:
+    with pytest.raises(RouteError):
+        create_cors(allow_credentials=True)
@@ -0,0 +1,194 @@
+import hmac
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.middleware import create_sessions
+from terminus.middleware.sessions import MemorySessionStore, SQLiteSessionStore
+from terminus.tests.utils import build_environ, call
+from terminus.types import Request
+
+
+def with_cookie(path: str, cookie: str | None = None) -> dict:
+    return build_environ(path, custom_fields={} if cookie is None else {"HTTP_COOKIE": cookie})
+
+def test_session_round_trip() -> None:
+    api = API()
+    sessions = create_sessions("secret", MemorySessionStore())
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.get("/login/[user]")
+    def login(req: Request):
+        req.context["session"]["user"] = req.params["user"]
+        return "ok"
+
+    @api.get("/me")
+    def me(req: Request):
+        return {"user": req.context["session"].get("user")}
+
+    set_cookie = call(api, with_cookie("/login/ada"))[1]["Set-Cookie"]
+    cookie = set_cookie.partition(";")[0]
+
+    assert cookie.startswith("session=")
+    assert "HttpOnly" in set_cookie and "Secure" in set_cookie
+    _, headers, body = call(api, with_cookie("/me", cookie))
+    assert (body, "Set-Cookie" in headers) == (b'{"user": "ada"}', False)
+    _, headers, body = call(api, with_cookie("/me"))
+    assert (body, "Set-Cookie" in headers) == (b'{"user": null}', False)
+
+def test_untouched_session_is_never_loaded(mocker: MockerFixture) -> None:
+    store = MemorySessionStore()
+    api = API()
+    sessions = create_sessions("secret", store)
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.get("/login/[user]")
+    def login(req: Request):
+        req.context["session"]["user"] = req.params["user"]
+        return "ok"
+
+    @api.get("/me")
+    def me(req: Request):
+        return {"user": req.context["session"].get("user")}
+
+    @api.get("/health")
+    def health(req: Request):
+        return "ok"
+
+    cookie = call(api, with_cookie("/login/ada"))[1]["Set-Cookie"].partition(";")[0]
+    load, save = mocker.spy(store, "load"), mocker.spy(store, "save")
+
+    _, headers, body = call(api, with_cookie("/health", cookie))
+    assert (body, "Set-Cookie" in headers) == (b"ok", False)
+    assert load.call_count == 0
+    call(api, with_cookie("/me", cookie))
+    assert (load.call_count, save.call_count) == (1, 0)
+
+def test_tampered_cookie_starts_new_session() -> None:
+    api = API()
+    sessions = create_sessions("secret", MemorySessionStore())
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.get("/login/[user]")
+    def login(req: Request):
+        req.context["session"]["user"] = req.params["user"]
+        return "ok"
+
+    @api.get("/me")
+    def me(req: Request):
+        return {"user": req.context["session"].get("user")}
+
+    cookie = call(api, with_cookie("/login/ada"))[1]["Set-Cookie"].partition(";")[0]
+    session_id, _, signature = cookie.partition(".")
+
+    forged = f"{session_id}.{signature[::-1]}"
+    for sent in (forged, "session=unsigned", f"{session_id}.{signature[:-1]}\xe9",
+                 "session=abc.d\xe9f"):
+        _, headers, body = call(api, with_cookie("/me", sent))
+        assert (body, "Set-Cookie" in headers) == (b'{"user": null}', False)
+
+def test_verification_is_cached(mocker: MockerFixture) -> None:
+    api = API()
+    sessions = create_sessions("secret", MemorySessionStore())
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.get("/login/[user]")
+    def login(req: Request):
+        req.context["session"]["user"] = req.params["user"]
+        return "ok"
+
+    @api.get("/me")
+    def me(req: Request):
+        return {"user": req.context["session"].get("user")}
+
+    cookie = call(api, with_cookie("/login/ada"))[1]["Set-Cookie"].partition(";")[0]
+    digest = mocker.spy(hmac, "new")
+    for _ in range(5):
+        call(api, with_cookie("/me", cookie))
+
+    assert digest.call_count == 1
+
+def test_clear_deletes_session() -> None:
+    store = MemorySessionStore()
+    api = API()
+    sessions = create_sessions("secret", store)
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.get("/login/[user]")
+    def login(req: Request):
+        req.context["session"]["user"] = req.params["user"]
+        return "ok"
+
+    @api.get("/me")
+    def me(req: Request):
+        return {"user": req.context["session"].get("user")}
+
+    @api.get("/logout")
+    def logout(req: Request):
+        req.context["session"].clear()
+        return "ok"
+
+    cookie = call(api, with_cookie("/login/ada"))[1]["Set-Cookie"].partition(";")[0]
+    set_cookie = call(api, with_cookie("/logout", cookie))[1]["Set-Cookie"]
+
+    assert set_cookie.startswith("session=; Path=/; Max-Age=0")
+    assert store.load(cookie.partition("=")[2].partition(".")[0]) is None
+    _, headers, body = call(api, with_cookie("/me", cookie))
+    assert (body, "Set-Cookie" in headers) == (b'{"user": null}', False)
+
+def test_memory_store_evicts_least_recently_used() -> None:
+    store = MemorySessionStore(max_sessions=2)
+    store.save("a", {"n": 1}, 60)
+    store.save("b", {"n": 2}, 60)
+    store.load("a")
+    store.save("c", {"n": 3}, 60)
+
+    assert store.load("a") == {"n": 1}
+    assert store.load("b") is None
+    store.save("d", {"n": 4}, 0)
+    assert store.load("d") is None
+
+def test_sqlite_store_is_shared(tmp_path: Path) -> None:
+    path = tmp_path / "sessions.db"
+    # Two stores on one file stand in for two worker processes
+    first, second = API(), API()
+    for api in (first, second):
+        sessions = create_sessions("secret", SQLiteSessionStore(path))
+        api.pre_request(sessions.load)
+        api.after_request(sessions.save)
+
+        @api.get("/login/[user]")
+        def login(req: Request):
+            req.context["session"]["user"] = req.params["user"]
+            return "ok"
+
+        @api.get("/me")
+        def me(req: Request):
+            return {"user": req.context["session"].get("user")}
+
+        @api.get("/logout")
+        def logout(req: Request):
+            req.context["session"].clear()
+            return "ok"
+
+    cookie = call(first, with_cookie("/login/ada"))[1]["Set-Cookie"].partition(";")[0]
+
+    _, headers, body = call(second, with_cookie("/me", cookie))
+    assert (body, "Set-Cookie" in headers) == (b'{"user": "ada"}', False)
+    call(second, with_cookie("/logout", cookie))
+    _, headers, body = call(first, with_cookie("/me", cookie))
+    assert (body, "Set-Cookie" in headers) == (b'{"user": null}', False)
+
+def test_sqlite_store_expiry(tmp_path: Path) -> None:
+    store = SQLiteSessionStore(tmp_path / "sessions.db")
+    store.save("live", {"n": 1}, 60)
+    store.save("expired", {"n": 2}, 0)
+
+    assert store.load("live") == {"n": 1}
+    assert store.load("expired") is None
@@ -0,0 +1,126 @@
+import threading
+
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.background import BackgroundTaskRunner
+from terminus.tests.utils import build_environ
+from terminus.types import HTTPError, HTTPMethod, Request
+
+
+def test_tasks_run_after_body_is_closed(mocker: MockerFixture) -> None:
+    runner = BackgroundTaskRunner(workers=2)
+    done: list = []
+    api = API(background_tasks=runner)
+
+    def record(req: Request, status: int) -> None:
+        done.append((req.path, status, threading.current_thread().name))
+
+    @api.after_request
+    def audit(req: Request) -> None:
+        req.add_background_task(record)
+
+    @api.get("/users/[id]")
+    def fn(req: Request):
+        req.add_background_task(record)
+        return {"id": req.params["id"]}
+
+    body = api(build_environ("/users/1"), mocker.Mock())
+
+    assert list(body) == [b'{"id": "1"}']
+    assert done == []
+    body.close()
+    assert runner.shutdown(5)
+    assert [(path, status) for path, status, _ in done] == [("/users/1", 200)] * 2
+    assert all(name.startswith("terminus-background") for _, _, name in done)
+
+def test_no_tasks_leaves_body_unwrapped(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.get("/")
+    def fn(req: Request):
+        return "hello"
+
+    assert api(build_environ("/"), mocker.Mock()) == [b"hello"]
+
+def test_error_status_is_given(mocker: MockerFixture) -> None:
+    runner = BackgroundTaskRunner(workers=1)
+    done: list = []
+    api = API(background_tasks=runner)
+
+    @api.post("/")
+    def fn(req: Request):
+        req.add_background_task(lambda req, status: done.append(status))
+        raise HTTPError("Conflict", 409)
+
+    api(build_environ("/", HTTPMethod.POST), mocker.Mock()).close()
+    runner.shutdown(5)
+    assert done == [409]
+
+def test_overflow_policies(mocker: MockerFixture) -> None:
+    for overflow in ("drop", "inline"):
+        started, release = threading.Event(), threading.Event()
+        done: list = []
+        runner = BackgroundTaskRunner(workers=1, max_queue=1, overflow=overflow)
+        api = API(background_tasks=runner)
+
+        # The first task blocks the only worker until it is released
+        def task(req: Request, status: int, started=started, release=release,
+                 done=done) -> None:
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            done.append(threading.current_thread().name)
+
+        @api.get("/")
+        def fn(req: Request, task=task):
+            req.add_background_task(task)
+            return "ok"
+
+        api(build_environ("/"), mocker.Mock()).close()
+        assert started.wait(5)
+        # The only worker is busy, so one task fills the queue and the next overflows
+        api(build_environ("/"), mocker.Mock()).close()
+        api(build_environ("/"), mocker.Mock()).close()
+        release.set()
+        runner.shutdown(5)
+
+        if overflow == "drop":
+            assert len(done) == 2
+            assert runner.dropped == 1
+        else:
+            assert len(done) == 3
+            assert done[0] == threading.current_thread().name
+
+def test_failing_task_does_not_stop_worker(mocker: MockerFixture, capsys) -> None:
+    runner = BackgroundTaskRunner(workers=1)
+    done: list = []
+    api = API(background_tasks=runner)
+
+    def fail(req: Request, status: int) -> None:
+        raise ValueError("boom")
+
+    @api.get("/")
+    def fn(req: Request):
+        req.add_background_task(fail)
+        req.add_background_task(lambda req, status: done.append(status))
+        return "ok"
+
+    api(build_environ("/"), mocker.Mock()).close()
+    runner.shutdown(5)
+    assert done == [200]
+    assert "ValueError: boom" in capsys.readouterr().err
+
+def test_tasks_run_inline_after_shutdown(mocker: MockerFixture) -> None:
+    runner = BackgroundTaskRunner(workers=1)
+    runner.shutdown(1)
+    done: list = []
+    api = API(background_tasks=runner)
+
+    @api.get("/")
+    def fn(req: Request):
+        req.add_background_task(lambda req, status: done.append(threading.current_thread().name))
+        return "ok"
+
+    api(build_environ("/"), mocker.Mock()).close()
+    assert done == [threading.current_thread().name]
@@ -0,0 +1,36 @@
+"""Sanity checks for the benchmark suite. These do not measure anything meaningful"""
+from pathlib import Path
+
+from terminus.benchmark import (
+    SCENARIOS,
+    Result,
+    find_regressions,
+    load_results,
+    run_scenario,
+    save_results,
+)
+
+
+def test_scenarios_respond() -> None:
+    """Every scenario should be able to run end to end"""
+    for scenario in SCENARIOS:
+        if "10000" in scenario.name:
+            continue
+        res = run_scenario(scenario, iterations=3)
+        assert res.requests_per_sec > 0
+        assert res.p50_us <= res.p99_us
+        assert res.alloc_peak_bytes > 0
+
+def test_baseline_round_trip(tmp_path: Path) -> None:
+    results = {"a": Result(1000, 1, 2, 3, 4)}
+    path = tmp_path / "baseline.json"
+    save_results(results, path)
+    
+    assert load_results(path) == results
+
+def test_find_regressions() -> None:
+    baseline = {"fast": Result(1000, 1, 1, 1, 1), "slow": Result(1000, 1, 1, 1, 1)}
+    current = {"fast": Result(950, 1, 1, 1, 1), "slow": Result(800, 1, 1, 1, 1),
+               "new": Result(1, 1, 1, 1, 1)}
+    
+    assert find_regressions(baseline, current, threshold=0.1) == ["slow"]
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.coalesce import SingleFlight
+from terminus.tests.utils import build_environ, call
+from terminus.types import HTTPError, Request, RouteError
+
+
+def run_concurrently(api: API, uris: list[str], flight: SingleFlight, release: threading.Event,
+                     mocker: MockerFixture) -> list:
+    """Start a request for each uri, releasing the route function once all but one are waiting"""
+    follow = mocker.spy(flight, "_follow")
+    results: list = []
+    threads = [threading.Thread(target=lambda environ: results.append(call(api, environ)),
+                                args=(build_environ(uri),)) for uri in uris]
+    for thread in threads:
+        thread.start()
+    while follow.call_count < len(uris) - 1:
+        time.sleep(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return [(status, body) for status, _, body in results]
+
+def test_identical_requests_share_response(mocker: MockerFixture) -> None:
+    flight, calls, release = SingleFlight(), [], threading.Event()
+    api = API()
+
+    @api.get("/report", coalesce=flight)
+    def report(req: Request):
+        calls.append(req.query.get("id"))
+        release.wait(5)
+        return {"id": req.query.get("id"), "calls": len(calls)}
+
+    results = run_concurrently(api, ["/report?id=1"] * 8, flight, release, mocker)
+
+    assert calls == ["1"]
+    assert results == [("200 OK", b'{"id": "1", "calls": 1}')] * 8
+    # Each request object received the very same encoded body
+    assert len({id(body) for _, body in results}) == 1
+    assert flight.in_flight() == 0
+
+def test_different_keys_run_separately() -> None:
+    calls: list = []
+    api = API()
+
+    @api.get("/report", coalesce=SingleFlight(query=["id"]))
+    def report(req: Request):
+        calls.append(req.query.get("id"))
+        return "ok"
+
+    for uri in ("/report?id=1", "/report?id=2", "/report?id=1&page=2"):
+        call(api, build_environ(uri))
+
+    assert calls == ["1", "2", "1"]
+
+def test_errors_propagate(mocker: MockerFixture) -> None:
+    flight, calls, release = SingleFlight(), [], threading.Event()
+    api = API()
+
+    @api.get("/report", coalesce=flight)
+    def report(req: Request):
+        calls.append(req.query.get("id"))
+        release.wait(5)
+        raise HTTPError("Report not found", 404)
+
+    results = run_concurrently(api, ["/report"] * 3, flight, release, mocker)
+
+    assert len(calls) == 1
+    assert results == [("404 Not Found", b'{"error": "Report not found"}')] * 3
+
+def test_wait_timeout() -> None:
+    calls: list = []
+    release = threading.Event()
+    api = API()
+
+    @api.get("/report", coalesce=SingleFlight(timeout=0.01))
+    def report(req: Request):
+        calls.append(req.query.get("id"))
+        release.wait(5)
+        return "ok"
+
+    results: list = []
+    leader = threading.Thread(target=lambda: results.append(call(api, build_environ("/report"))))
+    leader.start()
+    while not calls:
+        time.sleep(0.005)
+    results.append(call(api, build_environ("/report")))
+    release.set()
+    leader.join(5)
+
+    assert results[0][::2] == ("504 Gateway Timeout",
+                               b'{"error": "Timed out waiting for an identical request"}')
+    assert results[1][0] == "200 OK"
+
+def test_only_get_routes_coalesce() -> None:
+    with pytest.raises(RouteError):
+        API().post("/", coalesce=SingleFlight())(lambda req: "ok")
@@ -0,0 +1,192 @@
+import json
+from dataclasses import dataclass
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus import messagepack
+from terminus.api import API
+from terminus.codecs import JSON_CODEC, MSGPACK_CODEC, Codec, negotiate, register_codec
+from terminus.tests.types import BodyDTO
+from terminus.tests.utils import build_environ, call
+from terminus.types import HTTPError, HTTPMethod, Request
+
+VALUES = [
+    None, True, False, 0, 127, 128, -32, -33, 255, 256, 65536, 2**32, 2**63 + 1, -2**63, 1.5, "",
+    "é" * 40, "x" * 300, "y" * 70000, b"\x00\x01", [], list(range(20)), {"a": [1, {"b": None}]},
+    {str(i): i for i in range(20)}
+]
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+def post_echo(content: bytes, content_type: str, accept: str) -> dict:
+    return build_environ("/echo", HTTPMethod.POST, BodyDTO(content),
+                         {"CONTENT_TYPE": content_type, "HTTP_ACCEPT": accept})
+
+@pytest.mark.parametrize("value", VALUES)
+def test_messagepack_round_trip(value) -> None:
+    assert messagepack.unpackb(messagepack.packb(value)) == value
+
+@pytest.mark.parametrize("value", VALUES)
+def test_messagepack_matches_package(value) -> None:
+    msgpack = pytest.importorskip("msgpack")
+
+    assert messagepack.packb(value) == msgpack.packb(value)
+    assert messagepack.unpackb(msgpack.packb(value, use_single_float=True)) == value
+
+@pytest.mark.parametrize("raw", [b"\x92\x01", b"\xd9\x05ab", b"\xc1", b"\x01\x02", b"\x81\x01\x02"])
+def test_invalid_messagepack(raw: bytes) -> None:
+    with pytest.raises(ValueError):
+        messagepack.unpackb(raw)
+
+NEGOTIATIONS = [
+    (None, JSON_CODEC),
+    ("", JSON_CODEC),
+    ("application/msgpack", MSGPACK_CODEC),
+    ("application/x-msgpack", MSGPACK_CODEC),
+    ("application/json;q=0.5, application/msgpack", MSGPACK_CODEC),
+    ("application/msgpack;q=0.4, application/json;q=0.5", JSON_CODEC),
+    ("application/msgpack;q=0, */*;q=0.1", JSON_CODEC),
+    ("text/html, application/xml;q=0.9", JSON_CODEC),
+]
+
+@pytest.mark.parametrize("accept,codec", NEGOTIATIONS)
+def test_negotiation(accept: str | None, codec: Codec) -> None:
+    assert negotiate(accept) is codec
+
+def test_msgpack_request_and_response() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    body = messagepack.packb({"a": [1, 2], "b": b"bytes"})
+    status, headers, res = call(api, post_echo(body, "application/msgpack", "application/msgpack"))
+
+    assert status == "200 OK"
+    assert headers["Content-Type"] == "application/msgpack"
+    assert headers["Vary"] == "Accept"
+    assert messagepack.unpackb(res) == {
+        "received": {"a": [1, 2], "b": b"bytes"}, "point": {"x": 1, "y": 2}
+    }
+
+def test_json_fallback() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    body = messagepack.packb([1])
+    status, headers, res = call(api, post_echo(body, "application/msgpack", "text/html"))
+
+    assert status == "200 OK"
+    assert headers["Content-Type"] == "application/json"
+    assert json.loads(res) == {"received": [1], "point": {"x": 1, "y": 2}}
+
+def test_invalid_msgpack_body() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    status, _, res = call(api, post_echo(b"\x92\x01", "application/msgpack", "application/json"))
+
+    assert status == "400 Bad Request"
+    assert "application/msgpack" in json.loads(res)["error"]
+
+def test_decode_errors_are_described() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    # The msgpack package raises an error with no message for this reserved byte
+    status, _, res = call(api, post_echo(b"\xc1", "application/msgpack", "application/json"))
+    error = json.loads(res)["error"]
+
+    assert status == "400 Bad Request"
+    assert error.startswith("Body is not valid application/msgpack: ")
+    assert not error.endswith(": ")
+
+def test_invalid_json_body() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    @api.post("/points", body_type=Point)
+    def points(req: Request):
+        return req.body
+
+    for path in ("/echo", "/points"):
+        status, _, res = call(api, build_environ(path, HTTPMethod.POST, BodyDTO(b'{"x": 1,'),
+                                                 {"CONTENT_TYPE": "application/json"}))
+
+        # Routes with and without a typed body reject malformed JSON the same way
+        assert status == "400 Bad Request"
+        assert json.loads(res)["error"].startswith("Body is not valid JSON: ")
+
+def test_invalid_cbor_body() -> None:
+    pytest.importorskip("cbor2")
+    api = API()
+    api.post("/echo")(lambda req: {"received": req.body})
+
+    for raw in (b"\xff", b"\x82\x01"):
+        status, _, res = call(api, post_echo(raw, "application/cbor", "application/json"))
+
+        assert status == "400 Bad Request"
+        assert json.loads(res)["error"].startswith("Body is not valid application/cbor: ")
+
+def test_integer_too_large_to_encode(mocker: MockerFixture) -> None:
+    # The pure Python implementation raises an OverflowError, like the msgpack package without a
+    # default function
+    mocker.patch.dict("terminus.codecs._codecs")
+    register_codec(Codec("application/x-pure-msgpack", messagepack.packb, messagepack.unpackb))
+    api = API()
+    api.get("/big")(lambda req: {"n": 2**64})
+
+    # As for other values the format cannot represent, the body is rejected
+    with pytest.raises(HTTPError):
+        api(build_environ("/big", custom_fields={"HTTP_ACCEPT": "application/x-pure-msgpack"}),
+            mocker.Mock())
+
+def test_cbor() -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    cbor2 = pytest.importorskip("cbor2")
+    status, headers, res = call(api, post_echo(cbor2.dumps({"a": 1}),
+                                               "application/cbor", "application/cbor"))
+
+    assert status == "200 OK"
+    assert headers["Content-Type"] == "application/cbor"
+    assert cbor2.loads(res) == {"received": {"a": 1}, "point": {"x": 1, "y": 2}}
+
+def test_registered_codec(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.post("/echo")
+    def fn(req: Request):
+        return {"received": req.body, "point": Point(1, 2)}
+
+    # The registry is restored afterwards so the codec does not leak into other tests
+    mocker.patch.dict("terminus.codecs._codecs")
+    register_codec(Codec(
+        "application/x-test", lambda value: repr(value).encode(), lambda raw: raw.decode()
+    ))
+    status, headers, res = call(api, post_echo(b"raw", "application/x-test", "application/x-test"))
+
+    assert status == "200 OK"
+    assert headers["Content-Type"] == "application/x-test"
+    assert res == repr({"received": "raw", "point": Point(1, 2)}).encode()
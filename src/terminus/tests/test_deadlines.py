@@ -0,0 +1,92 @@
+import threading
+import time
+
+from terminus.api import API
+from terminus.limits import ConcurrencyLimiter
+from terminus.tests.utils import build_environ, call
+from terminus.types import Request
+
+
+def with_timeout(path: str, timeout: str | None = None) -> dict:
+    return build_environ(path, custom_fields={} if timeout is None
+                         else {"HTTP_X_REQUEST_TIMEOUT": timeout})
+
+def test_no_deadline() -> None:
+    api = API()
+
+    @api.get("/")
+    def fn(req: Request):
+        return str(req.remaining())
+
+    assert call(api, with_timeout("/"))[2] == b"None"
+    assert call(api, with_timeout("/", "soon"))[2] == b"None"
+
+def test_deadline_from_header_and_timeouts() -> None:
+    api, untimed = API(timeout=10), API()
+    for app in (api, untimed):
+        app.get("/")(lambda req: str(req.remaining()))
+
+    @api.get("/short", timeout=0.5)
+    def short(req: Request):
+        return str(req.remaining())
+
+    assert 9 < float(call(api, with_timeout("/"))[2]) <= 10
+    assert 1 < float(call(api, with_timeout("/", "2"))[2]) <= 2
+    # The header can only shorten the timeout of a route
+    assert 0 < float(call(api, with_timeout("/short", "30"))[2]) <= 0.5
+    assert 0 < float(call(untimed, with_timeout("/", "3"))[2]) <= 3
+
+def test_expired_deadline_stops_pipeline() -> None:
+    api = API()
+    called = []
+
+    @api.pre_request
+    def slow(req: Request) -> None:
+        time.sleep(0.05)
+
+    @api.after_request
+    def after(req: Request) -> None:
+        called.append("after")
+
+    @api.get("/")
+    def fn(req: Request):
+        called.append("fn")
+        return "ok"
+
+    status, _, body = call(api, with_timeout("/", "0.01"))
+    assert (status, body) == ("504 Gateway Timeout", b'{"error": "Request deadline exceeded"}')
+    assert called == []
+    assert call(api, with_timeout("/", "1"))[0] == "200 OK"
+    assert called == ["fn", "after"]
+
+def test_handler_checks_deadline() -> None:
+    api = API()
+
+    @api.get("/", timeout=0.01)
+    def fn(req: Request):
+        time.sleep(0.02)
+        req.check_deadline()
+        return "unreachable"
+
+    assert call(api, with_timeout("/"))[0] == "504 Gateway Timeout"
+
+def test_limiter_queue_respects_deadline() -> None:
+    started, release = threading.Event(), threading.Event()
+    api = API(limiter=ConcurrencyLimiter(queue_size=1, queue_timeout=5))
+
+    @api.get("/", max_in_flight=1)
+    def fn(req: Request):
+        started.set()
+        release.wait(5)
+        return "ok"
+
+    thread = threading.Thread(target=call, args=(api, with_timeout("/")))
+    thread.start()
+    assert started.wait(5)
+    begin = time.monotonic()
+    status = call(api, with_timeout("/", "0.05"))[0]
+    release.set()
+    thread.join(5)
+
+    assert status == "504 Gateway Timeout"
+    assert time.monotonic() - begin < 1
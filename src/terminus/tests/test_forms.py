@@ -0,0 +1,183 @@
+import json
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.forms import MultipartParser, UploadedFile, parse_header_params
+from terminus.tests.types import BodyDTO
+from terminus.tests.utils import build_environ, call
+from terminus.types import ContentType, HTTPError, HTTPMethod, Request
+
+BOUNDARY = "----terminus1234"
+
+def multipart(*parts: tuple[str, bytes, str | None]) -> bytes:
+    """Build a multipart body from (name, content, filename) parts"""
+    body = b"preamble to ignore\r\n"
+    for name, content, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"\r\nContent-Type: text/csv'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode()
+        body += content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+def upload(content: bytes, content_type: str) -> dict:
+    return build_environ("/upload", HTTPMethod.POST, BodyDTO(content),
+                         {"CONTENT_TYPE": content_type})
+
+def test_header_params() -> None:
+    assert parse_header_params('Multipart/Form-Data; Boundary="a;b\\"c"; charset=utf-8') == (
+        "multipart/form-data", {"boundary": 'a;b"c', "charset": "utf-8"}
+    )
+    assert parse_header_params("text/plain") == ("text/plain", {})
+
+def test_multipart_body() -> None:
+    api = API()
+
+    @api.post("/upload")
+    def fn(req: Request):
+        assert isinstance(req.body, dict)
+        return {
+            key: {"filename": val.filename, "size": val.size, "content": val.read().decode()}
+            if isinstance(val, UploadedFile) else val
+            for key, val in req.body.items()
+        }
+
+    body = multipart(
+        ("title", "Café".encode(), None),
+        ("tag", b"a", None),
+        ("tag", b"b", None),
+        ("data", b"x,y\r\n1,2\r\n--not-the-boundary", "data.csv"),
+    )
+    status, _, res = call(api, upload(body, f"multipart/form-data; boundary={BOUNDARY}"))
+
+    assert status == "200 OK"
+    assert json.loads(res) == {
+        "title": "Café",
+        "tag": ["a", "b"],
+        "data": {"filename": "data.csv", "size": 28, "content": "x,y\r\n1,2\r\n--not-the-boundary"}
+    }
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_boundary_split_across_chunks(chunk_size: int, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("terminus.forms.READ_CHUNK_SIZE", chunk_size)
+    body = multipart(("a", b"1" * 100, None), ("f", b"\r\n-" * 50, "f.bin"))
+
+    form = MultipartParser(BOUNDARY).parse(BytesIO(body), len(body))
+
+    assert form["a"] == "1" * 100
+    assert form["f"].read() == b"\r\n-" * 50
+
+def test_large_files_spool_to_disk() -> None:
+    content = b"z" * 5000
+    body = multipart(("f", content, "big.bin"), ("g", b"small", "small.bin"))
+
+    form = MultipartParser(BOUNDARY, spool_max_memory=1000).parse(BytesIO(body), len(body))
+
+    assert form["f"].file._rolled and form["f"].read() == content
+    assert not form["g"].file._rolled and form["g"].read() == b"small"
+
+INVALID_BODIES = [
+    (multipart(("a", b"1", None))[:-10], "missing closing boundary"),
+    (f"--{BOUNDARY}\r\nContent-Type: text/plain\r\n\r\nx\r\n--{BOUNDARY}--".encode(),
+     "disposition"),
+    (f"--{BOUNDARY}\r\nbad header\r\n\r\nx\r\n--{BOUNDARY}--".encode(), "invalid part header"),
+]
+
+@pytest.mark.parametrize("body,error", INVALID_BODIES)
+def test_malformed_multipart(body: bytes, error: str) -> None:
+    with pytest.raises(HTTPError) as e:
+        MultipartParser(BOUNDARY).parse(BytesIO(body), len(body))
+    assert error in str(e.value)
+
+def test_field_size_limit() -> None:
+    body = multipart(("a", b"1" * 100, None))
+
+    with pytest.raises(HTTPError) as e:
+        MultipartParser(BOUNDARY, max_field_size=10).parse(BytesIO(body), len(body))
+    assert e.value.status == 413
+
+def test_part_count_limit() -> None:
+    body = multipart(*[(f"f{i}", b"x", f"{i}.txt") for i in range(6)])
+
+    with pytest.raises(HTTPError) as e:
+        MultipartParser(BOUNDARY, max_parts=5).parse(BytesIO(body), len(body))
+    assert e.value.status == 413
+
+def spool_files(mocker: MockerFixture) -> list[SpooledTemporaryFile]:
+    """Record each file created to spool an upload"""
+    created: list[SpooledTemporaryFile] = []
+
+    def create(max_size: int) -> SpooledTemporaryFile:
+        created.append(SpooledTemporaryFile(max_size=max_size))  # noqa: SIM115
+        return created[-1]
+    mocker.patch("terminus.forms.SpooledTemporaryFile", side_effect=create)
+    return created
+
+def test_memory_limit(mocker: MockerFixture) -> None:
+    created = spool_files(mocker)
+    # Every file stays below the spool size, but together they exceed the memory budget of the body
+    body = multipart(*[(f"f{i}", b"x" * 100, f"{i}.txt") for i in range(5)])
+    parser = MultipartParser(BOUNDARY, spool_max_memory=1000, max_memory=350)
+
+    with pytest.raises(HTTPError) as e:
+        parser.parse(BytesIO(body), len(body))
+    assert e.value.status == 413
+    assert len(created) == 4
+    assert all(file.closed for file in created)
+
+def test_files_on_disk_do_not_count_to_memory_limit() -> None:
+    body = multipart(*[(f"f{i}", b"x" * 2000, f"{i}.bin") for i in range(5)])
+    form = MultipartParser(BOUNDARY, spool_max_memory=1000, max_memory=1500).parse(
+        BytesIO(body), len(body)
+    )
+
+    assert len(form) == 5
+
+def test_files_are_closed_on_error(mocker: MockerFixture) -> None:
+    created = spool_files(mocker)
+    body = multipart(("f", b"x", "a.txt"), ("f", b"y" * 2000, "b.bin"), ("a", b"1" * 100, None))
+
+    with pytest.raises(HTTPError):
+        MultipartParser(BOUNDARY, spool_max_memory=1000, max_field_size=10).parse(
+            BytesIO(body), len(body)
+        )
+    assert len(created) == 2
+    assert all(file.closed for file in created)
+
+def test_urlencoded_body() -> None:
+    api = API()
+    api.post("/upload")(lambda req: req.body)
+    status, _, res = call(api, upload(b"a=1&b=x+y&b=%C3%A9&c=",
+                                      "application/x-www-form-urlencoded; charset=UTF-8"))
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"a": "1", "b": ["x y", "é"], "c": ""}
+
+def test_content_type_params() -> None:
+    api = API()
+
+    @api.post("/upload")
+    def fn(req: Request):
+        assert req.headers.content_type in (ContentType.TEXT_PLAIN, ContentType.APPLICATION_JSON)
+        return req.body
+
+    status, _, res = call(api, upload("é".encode("latin-1"), "text/plain; charset=latin-1"))
+    assert status == "200 OK"
+    assert res == "é".encode()
+
+    status = call(api, upload(b'{"a": 1}', "application/json; charset=utf-8"))[0]
+    assert status == "200 OK"
+
+def test_unsupported_content_type() -> None:
+    api = API()
+    api.post("/upload")(lambda req: req.body)
+
+    status = call(api, upload(b"<a/>", "application/xml"))[0]
+    assert status == "415 Unsupported Media Type"
+
+    status = call(api, upload(b"", "multipart/form-data"))[0]
+    assert status == "400 Bad Request"
@@ -0,0 +1,59 @@
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.response import Head, Response
+from terminus.tests.utils import build_environ, call
+from terminus.types import HTTPMethod, Request
+
+
+def test_head_served_by_get_route() -> None:
+    api = API()
+
+    @api.get("/users/[id]")
+    def user(req: Request):
+        return {"id": req.params["id"]}, 200, {"session": "abc"}
+
+    get_status, get_headers, get_body = call(api, build_environ("/users/1"))
+    status, headers, body = call(api, build_environ("/users/1", HTTPMethod.HEAD))
+
+    assert body == b""
+    assert status == get_status == "200 OK"
+    assert headers == get_headers
+    assert headers["Content-Length"] == str(len(get_body))
+
+def test_cheap_head_skips_encoding(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.get("/files/[name]")
+    def file(req: Request):
+        if req.method == HTTPMethod.HEAD:
+            return Head("application/octet-stream", content_length=1024)
+        return b"\x00" * 1024
+
+    parse_body = mocker.spy(Response, "_parse_body")
+    status, headers, body = call(api, build_environ("/files/a.bin", HTTPMethod.HEAD))
+
+    assert parse_body.call_count == 0
+    assert (status, body) == ("200 OK", b"")
+    assert headers == {"Content-Type": "application/octet-stream", "Content-Length": "1024"}
+
+def test_head_route_takes_precedence() -> None:
+    api = API()
+
+    @api.head("/status")
+    def status_head(req: Request):
+        return Head("text/plain", status=204)
+
+    @api.get("/status")
+    def status(req: Request):
+        return "ok"
+
+    assert call(api, build_environ("/status", HTTPMethod.HEAD)) == (
+        "204 No Content", {"Content-Type": "text/plain"}, b""
+    )
+    assert call(api, build_environ("/status"))[2] == b"ok"
+
+def test_head_errors_have_no_body() -> None:
+    status, _, body = call(API(), build_environ("/missing", HTTPMethod.HEAD))
+
+    assert (status, body) == ("404 Not Found", b"")
@@ -0,0 +1,207 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.idempotency import Idempotency, IdempotencyStore
+from terminus.middleware import create_cors, create_sessions
+from terminus.tests.utils import build_environ, call
+from terminus.types import HTTPError, HTTPMethod, Request, RouteError
+
+
+def payment(key: str | None = "abc", auth: str = "Bearer a") -> dict:
+    fields = {"HTTP_AUTHORIZATION": auth}
+    if key is not None:
+        fields["HTTP_IDEMPOTENCY_KEY"] = key
+    return build_environ("/payments", HTTPMethod.POST, custom_fields=fields)
+
+def test_retry_replays_response(tmp_path: Path) -> None:
+    calls: list = []
+    api = API()
+
+    @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        return {"payment": len(calls)}, 201, {"receipt": str(len(calls))}
+
+    first_status, first_headers, first_body = call(api, payment())
+    status, headers, body = call(api, payment())
+
+    assert calls == ["abc"]
+    assert (status, body) == (first_status, first_body) == ("201 Created", b'{"payment": 1}')
+    assert headers["Set-Cookie"] == first_headers["Set-Cookie"]
+    assert headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first_headers
+
+def test_headers_from_route_and_middleware(tmp_path: Path, mocker: MockerFixture) -> None:
+    api = API(cors=create_cors(["https://app.example.com"]))
+    sessions = create_sessions("secret", secure=False)
+    api.pre_request(sessions.load)
+    api.after_request(sessions.save)
+
+    @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+    def pay(req: Request):
+        req.add_response_header("X-Payment-ID", "p1")
+        req.context["session"]["paid"] = True
+        return "ok", 201
+
+    def post() -> list[tuple[str, str]]:
+        start_response = mocker.Mock()
+        environ = build_environ("/payments", HTTPMethod.POST, custom_fields={
+            "HTTP_IDEMPOTENCY_KEY": "abc", "HTTP_ORIGIN": "https://app.example.com"
+        })
+        api(environ, start_response)
+        return [(name, val) for name, val in start_response.call_args[0][1]
+                if name in ("X-Payment-ID", "Access-Control-Allow-Origin", "Set-Cookie")]
+
+    first, retry = post(), post()
+    # Headers added by the route function are replayed and middleware runs again, but the
+    # cookie afterware set for the first request is not replayed
+    assert [name for name, _ in first] == ["X-Payment-ID", "Access-Control-Allow-Origin",
+                                           "Set-Cookie"]
+    assert retry == first[:2]
+
+def test_keys_are_scoped(tmp_path: Path) -> None:
+    calls: list = []
+    api = API()
+
+    @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        return "ok", 201
+
+    call(api, payment())
+    call(api, payment(key="other"))
+    call(api, payment(auth="Bearer b"))
+    call(api, payment(key=None))
+    call(api, payment(key=None))
+
+    assert len(calls) == 5
+
+def test_store_shared_between_workers(tmp_path: Path) -> None:
+    calls: list = []
+    # Two stores on one file stand in for two worker processes
+    first, second = API(), API()
+    for api in (first, second):
+        @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+        def pay(req: Request):
+            calls.append(req.headers.get("Idempotency-Key"))
+            return {"payment": len(calls)}, 201
+
+    assert call(first, payment())[2] == call(second, payment())[2]
+    assert len(calls) == 1
+
+def test_concurrent_duplicates_wait(tmp_path: Path) -> None:
+    calls: list = []
+    release = threading.Event()
+    api = API()
+
+    @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        release.wait(5)
+        return {"payment": len(calls)}, 201
+
+    results: list = []
+    threads = [threading.Thread(target=lambda: results.append(call(api, payment())))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while not calls:
+        time.sleep(0.005)
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert {body for _, _, body in results} == {b'{"payment": 1}'}
+
+def test_duplicate_times_out(tmp_path: Path) -> None:
+    calls: list = []
+    release = threading.Event()
+    api = API()
+
+    @api.post("/payments",
+              idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db"), timeout=0.05))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        release.wait(5)
+        return {"payment": len(calls)}, 201
+
+    leader = threading.Thread(target=call, args=(api, payment()))
+    leader.start()
+    while not calls:
+        time.sleep(0.005)
+    status = call(api, payment())[0]
+    release.set()
+    leader.join(5)
+
+    assert status == "409 Conflict"
+
+def test_running_request_keeps_claim(tmp_path: Path) -> None:
+    calls: list = []
+    release = threading.Event()
+    api = API()
+    store = IdempotencyStore(tmp_path / "keys.db", lock_timeout=0.01)
+
+    @api.post("/payments", idempotency=Idempotency(store, timeout=0.1))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        release.wait(5)
+        return {"payment": len(calls)}, 201
+
+    leader = threading.Thread(target=call, args=(api, payment()))
+    leader.start()
+    while not calls:
+        time.sleep(0.005)
+    # The claim has expired, but its request is still running
+    time.sleep(0.05)
+    status = call(api, payment())[0]
+    release.set()
+    leader.join(5)
+
+    assert status == "409 Conflict"
+    assert call(api, payment())[2] == b'{"payment": 1}'
+    assert len(calls) == 1
+
+def test_abandoned_claim_is_taken_over(tmp_path: Path, mocker: MockerFixture) -> None:
+    store = IdempotencyStore(tmp_path / "keys.db", lock_timeout=0)
+    assert store.claim("abc") == (True, None)
+
+    assert store.claim("abc") == (False, None)
+    # Once the worker holding the claim has exited, another request can claim the key
+    mocker.patch("terminus.idempotency._is_running", return_value=False)
+    assert store.claim("abc") == (True, None)
+
+def test_errors_are_not_stored(tmp_path: Path) -> None:
+    calls: list = []
+    api = API()
+
+    @api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))
+    def pay(req: Request):
+        calls.append(req.headers.get("Idempotency-Key"))
+        if len(calls) == 1:
+            raise HTTPError("Payment provider unavailable", 503)
+        return {"payment": len(calls)}, 201
+
+    assert call(api, payment())[0] == "503 Service Unavailable"
+    assert call(api, payment())[0] == "201 Created"
+    assert call(api, payment())[2] == b'{"payment": 2}'
+    assert len(calls) == 2
+
+def test_invalid_key(tmp_path: Path) -> None:
+    api = API()
+    api.post("/payments", idempotency=Idempotency(IdempotencyStore(tmp_path / "keys.db")))(
+        lambda req: "ok"
+    )
+
+    assert call(api, payment(key="k" * 256))[0] == "400 Bad Request"
+
+def test_safe_methods_rejected(tmp_path: Path) -> None:
+    idempotency = Idempotency(IdempotencyStore(tmp_path / "keys.db"))
+    with pytest.raises(RouteError):
+        API().get("/", idempotency=idempotency)(lambda req: "ok")
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import pytest
+
+from terminus.api import API
+from terminus.limits import ConcurrencyLimiter
+from terminus.metrics import MetricsCollector
+from terminus.tests.utils import build_environ, call
+from terminus.types import Request, RouteError
+
+
+def in_background(api: API, path: str) -> threading.Thread:
+    thread = threading.Thread(target=call, args=(api, build_environ(path)))
+    thread.start()
+    return thread
+
+def test_route_limit_sheds() -> None:
+    started, release = threading.Event(), threading.Event()
+    api = API(limiter=ConcurrencyLimiter(retry_after=3))
+
+    @api.get("/slow", max_in_flight=1)
+    def slow(req: Request):
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    @api.get("/fast")
+    def fast(req: Request):
+        return "fast"
+
+    thread = in_background(api, "/slow")
+    assert started.wait(5)
+    status, headers, _ = call(api, build_environ("/slow"))
+    # Other routes are unaffected by the limit of /slow
+    fast_status = call(api, build_environ("/fast"))[0]
+    release.set()
+    thread.join(5)
+
+    assert status == "503 Service Unavailable"
+    assert headers["Retry-After"] == "3"
+    assert fast_status == "200 OK"
+    assert call(api, build_environ("/slow"))[0] == "200 OK"
+
+def test_queued_request_is_admitted() -> None:
+    started, release = threading.Event(), threading.Event()
+    limiter = ConcurrencyLimiter(queue_size=1, queue_timeout=5)
+    api = API(limiter=limiter)
+
+    @api.get("/slow", max_in_flight=1)
+    def slow(req: Request):
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    thread = in_background(api, "/slow")
+    assert started.wait(5)
+    queued = in_background(api, "/slow")
+    # A full queue sheds immediately rather than waiting
+    while limiter.stats()[1].queued == 0:
+        time.sleep(0.01)
+    assert call(api, build_environ("/slow"))[0] == "503 Service Unavailable"
+    release.set()
+    thread.join(5)
+    queued.join(5)
+
+    stats = limiter.stats()[1]
+    assert (stats.in_flight, stats.queued, stats.shed) == (0, 0, 1)
+
+def test_queue_timeout_sheds() -> None:
+    started, release = threading.Event(), threading.Event()
+    limiter = ConcurrencyLimiter(queue_size=1, queue_timeout=0.05)
+    api = API(limiter=limiter)
+
+    @api.get("/slow", max_in_flight=1)
+    def slow(req: Request):
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    thread = in_background(api, "/slow")
+    assert started.wait(5)
+    status = call(api, build_environ("/slow"))[0]
+    release.set()
+    thread.join(5)
+
+    assert status == "503 Service Unavailable"
+    assert limiter.stats()[1].shed == 1
+
+def test_global_limit() -> None:
+    started, release = threading.Event(), threading.Event()
+    api = API(metrics=MetricsCollector(), limiter=ConcurrencyLimiter(max_in_flight=1))
+
+    @api.get("/slow", max_in_flight=1)
+    def slow(req: Request):
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    @api.get("/fast")
+    def fast(req: Request):
+        return "fast"
+
+    thread = in_background(api, "/slow")
+    assert started.wait(5)
+    fast_status = call(api, build_environ("/fast"))[0]
+    # The metrics route does not count towards the global limit
+    metrics_status, _, out = call(api, build_environ("/metrics"))
+    release.set()
+    thread.join(5)
+
+    assert fast_status == "503 Service Unavailable"
+    assert metrics_status == "200 OK"
+    assert b'terminus_limit_shed_total{method="*",route="*",pid=' in out
+    assert b'terminus_limit_queued{method="GET",route="/slow",pid=' in out
+    assert b'terminus_requests_total{method="GET",route="/fast",status="503"} 1' in out
+
+def test_invalid_limits() -> None:
+    with pytest.raises(RouteError):
+        ConcurrencyLimiter(max_in_flight=0)
+
+    api = API(limiter=ConcurrencyLimiter())
+    with pytest.raises(RouteError):
+        api.get("/", max_in_flight=0)(lambda req: "ok")
+
+    with pytest.raises(RouteError):
+        API().get("/", max_in_flight=1)(lambda req: "ok")
@@ -0,0 +1,37 @@
+import threading
+from wsgiref.simple_server import make_server
+
+from terminus.loadtest import (
+    LoadRequest,
+    _QuietHandler,
+    _ThreadingWSGIServer,
+    demo_api,
+    run_load,
+)
+
+
+def test_parse_request_spec() -> None:
+    assert LoadRequest.parse("GET /users/1") == LoadRequest("GET", "/users/1")
+    assert LoadRequest.parse("3*post /echo") == LoadRequest("POST", "/echo", weight=3)
+
+def test_run_load_against_stdlib_server() -> None:
+    """Drive the demo app on a real socket and make sure every request is accounted for"""
+    with make_server("127.0.0.1", 0, demo_api, _ThreadingWSGIServer, _QuietHandler) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            mix = [
+                LoadRequest("GET", "/hello"),
+                LoadRequest("POST", "/echo", body=b'{"a": 1}'),
+                LoadRequest("GET", "/missing")
+            ]
+            report = run_load("127.0.0.1", server.server_port, mix, concurrency=4,
+                              duration=0.3, warmup=0)
+        finally:
+            server.shutdown()
+
+    assert report.requests > 0
+    assert report.connection_errors == 0
+    assert report.error_rate == 0
+    assert set(report.statuses) == {200, 404}
+    assert sum(report.histogram) == report.requests
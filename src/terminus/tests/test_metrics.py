@@ -0,0 +1,84 @@
+import os
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.metrics import MetricsCollector
+from terminus.tests.utils import build_environ
+from terminus.types import HTTPMethod, Request
+
+
+def scrape(api: API, mocker: MockerFixture) -> str:
+    start_response = mocker.Mock()
+    res = api(build_environ("/metrics"), start_response)
+    assert start_response.call_args[0][0] == "200 OK"
+    return next(iter(res)).decode("utf-8")
+
+def test_counts_keyed_on_route_template(mocker: MockerFixture) -> None:
+    """Requests to different concrete paths of one route should share its series"""
+    api = API(metrics=MetricsCollector())
+
+    @api.get("/users/[id]")
+    def user(req: Request):
+        return req.params["id"]
+
+    for user_id in ("1", "2", "3"):
+        api(build_environ(f"/users/{user_id}"), mocker.Mock())
+
+    out = scrape(api, mocker)
+    assert 'terminus_requests_total{method="GET",route="/users/[id]",status="200"} 3' in out
+    assert 'route="/users/1"' not in out
+    label = 'method="GET",route="/users/[id]"'
+    assert f"terminus_request_duration_seconds_count{{{label}}} 3" in out
+    assert f'terminus_request_duration_seconds_bucket{{{label},le="+Inf"}} 3' in out
+
+def test_status_codes_and_errors(mocker: MockerFixture) -> None:
+    api = API(metrics=MetricsCollector())
+
+    @api.post("/a")
+    def a(req: Request):
+        return "Teapot", 418
+
+    @api.post("/b")
+    def b(req: Request):
+        return "Missing", 404
+
+    api(build_environ("/a", HTTPMethod.POST), mocker.Mock())
+    api(build_environ("/b", HTTPMethod.POST), mocker.Mock())
+
+    out = scrape(api, mocker)
+    assert 'terminus_requests_total{method="POST",route="/a",status="other"} 1' in out
+    assert 'terminus_requests_total{method="POST",route="/b",status="404"} 1' in out
+
+def test_in_flight_gauge(mocker: MockerFixture) -> None:
+    collector = MetricsCollector()
+    api = API(metrics=collector)
+
+    @api.get("/slow")
+    def slow(req: Request):
+        return collector.render()
+
+    res = api(build_environ("/slow"), mocker.Mock())
+    during = next(iter(res)).decode("utf-8")
+    assert 'terminus_requests_in_flight{method="GET",route="/slow"} 1' in during
+
+    after = scrape(api, mocker)
+    assert 'terminus_requests_in_flight{method="GET",route="/slow"} 0' in after
+
+def test_aggregates_worker_files(mocker: MockerFixture, tmp_path: Path) -> None:
+    """Values written by other workers sharing the directory should be included"""
+    api = API(metrics=MetricsCollector(directory=tmp_path))
+
+    @api.get("/")
+    def fn(req: Request):
+        return "Body"
+
+    api(build_environ("/"), mocker.Mock())
+
+    # Simulate a second worker by copying this worker's file under a different live PID
+    own_file = tmp_path / f"terminus_{os.getpid()}.db"
+    (tmp_path / f"terminus_{os.getppid()}.db").write_bytes(own_file.read_bytes())
+
+    out = scrape(api, mocker)
+    assert 'terminus_requests_total{method="GET",route="/",status="200"} 2' in out
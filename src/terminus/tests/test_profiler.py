@@ -0,0 +1,84 @@
+import pstats
+import time
+from pathlib import Path
+
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.profiler import RequestProfiler
+from terminus.tests.utils import build_environ
+from terminus.types import Request
+
+
+def test_every_nth_request(mocker: MockerFixture) -> None:
+    profiler = RequestProfiler(every=3)
+    api = API(profiler=profiler)
+    profile_spy = mocker.spy(profiler, "profile")
+
+    @api.get("/")
+    def fn(req: Request):
+        return "Body"
+
+    for _ in range(6):
+        api(build_environ("/"), mocker.Mock())
+
+    assert profile_spy.call_count == 2
+
+def test_header_and_route_pattern(mocker: MockerFixture) -> None:
+    """Only requests with the header to routes matching the pattern should be profiled"""
+    profiler = RequestProfiler(header="X-Profile", route_pattern=r"^/users")
+    api = API(profiler=profiler)
+    profile_spy = mocker.spy(profiler, "profile")
+
+    @api.get("/users/[id]")
+    def user(req: Request):
+        return "User"
+
+    @api.get("/health")
+    def health(req: Request):
+        return "OK"
+
+    api(build_environ("/users/1"), mocker.Mock())
+    assert profile_spy.call_count == 0
+
+    environ = build_environ("/users/1") | {"HTTP_X_PROFILE": "1"}
+    api(environ, mocker.Mock())
+    assert profile_spy.call_count == 1
+
+    environ = build_environ("/health") | {"HTTP_X_PROFILE": "1"}
+    api(environ, mocker.Mock())
+    assert profile_spy.call_count == 1
+
+def test_sampled_stacks_per_route(mocker: MockerFixture, tmp_path: Path) -> None:
+    profiler = RequestProfiler()
+    api = API(profiler=profiler)
+
+    @api.get("/slow/[id]")
+    def slow_handler(req: Request):
+        time.sleep(0.05)
+        return "Done"
+
+    api(build_environ("/slow/1"), mocker.Mock())
+    api(build_environ("/slow/2"), mocker.Mock())
+
+    written = profiler.dump(tmp_path)
+    assert [p.name.split(".")[0] for p in written] == ["GET_slow_[id]"]
+    lines = written[0].read_text().splitlines()
+    assert any("slow_handler" in line for line in lines)
+    # Each line is a collapsed stack followed by its sample count
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+def test_cprofile_mode(mocker: MockerFixture, tmp_path: Path) -> None:
+    profiler = RequestProfiler(mode="cprofile")
+    api = API(profiler=profiler)
+
+    @api.get("/")
+    def profiled_handler(req: Request):
+        return "Body"
+
+    api(build_environ("/"), mocker.Mock())
+
+    written = profiler.dump(tmp_path)
+    assert len(written) == 1
+    stats = pstats.Stats(str(written[0]))
+    assert any(func[2] == "profiled_handler" for func in stats.stats)  # type: ignore[attr-defined]
@@ -8,10 +8,12 @@ import json
 import pytest
 from pytest_mock import MockerFixture
 
+import terminus.types as terminus_types
+from terminus.accept import parse_accept
 from terminus.api import API
 from terminus.tests.types import BodyDTO
 from terminus.tests.utils import build_environ
-from terminus.types import ContentType, HTTPMethod, Request
+from terminus.types import ContentType, Headers, HTTPMethod, Request
 
 
 def test_req_headers(mocker: MockerFixture) -> None:
@@ -40,14 +42,19 @@ def test_req_headers(mocker: MockerFixture) -> None:
     exp_environ = build_environ("/", HTTPMethod.POST, BodyDTO(body_content))
      
     start_response = mocker.Mock()
-    res = api(build_environ("/", HTTPMethod.POST) , start_response)
+    res = api(build_environ("/", HTTPMethod.POST, BodyDTO(body_content)) , start_response)
     
     body_dict = json.loads(next(iter(res)))
     # assert body_dict == 1
     assert body_dict["host"] == exp_environ["HTTP_HOST"]
-    assert body_dict["accept"] == exp_environ["HTTP_ACCEPT"].split(",")
-    assert body_dict["accept_language"] == exp_environ["HTTP_ACCEPT_LANGUAGE"].split(",")
-    assert body_dict["accept_encoding"] == exp_environ["HTTP_ACCEPT_ENCODING"].split(", ")
+    # Accept headers are parsed into (range, quality) pairs, ordered by quality
+    assert body_dict["accept"] == [
+        ["text/html", 1], ["application/xhtml+xml", 1], ["image/avif", 1], ["image/webp", 1],
+        ["image/apng", 1], ["application/xml", 0.9], ["*/*", 0.8],
+        ["application/signed-exchange", 0.7]
+    ]
+    assert body_dict["accept_language"] == [["en-us", 1], ["en", 0.9]]
+    assert body_dict["accept_encoding"] == [["gzip", 1], ["deflate", 1], ["br", 1], ["zstd", 1]]
     assert body_dict["connection"] == exp_environ["HTTP_CONNECTION"]
     assert body_dict["remote_address"] == exp_environ["REMOTE_ADDR"]
     assert body_dict["content_type"] == exp_environ["CONTENT_TYPE"]
@@ -127,4 +134,84 @@ def test_server_protocol_set(mocker: MockerFixture):
 
     body = next(iter(res)).decode("utf-8")
     exp_environ = build_environ("/")
-    assert body == exp_environ["SERVER_PROTOCOL"] 
\ No newline at end of file
+    assert body == exp_environ["SERVER_PROTOCOL"]
+
+NEGOTIATIONS = [
+    ("application/json", ["application/json", "text/plain"], "application/json"),
+    ("text/*;q=0.5, application/json;q=0.4", ["application/json", "text/plain"], "text/plain"),
+    # The most specific range decides the quality of a type
+    ("text/*, text/plain;q=0", ["text/plain", "text/html"], "text/html"),
+    ("*/*;q=0.1, image/png", ["text/plain", "image/png"], "image/png"),
+    ("image/png", ["text/plain"], None),
+    ("", ["text/plain", "image/png"], "text/plain"),
+]
+
+@pytest.mark.parametrize("accept,offered,exp", NEGOTIATIONS)
+def test_best_match(mocker: MockerFixture, accept: str, offered: list[str],
+                    exp: str | None) -> None:
+    api = API()
+
+    @api.get("/")
+    def a(req: Request):
+        return {"match": req.headers.best_match(offered)}
+
+    res = api(build_environ("/", custom_fields={"HTTP_ACCEPT": accept}), mocker.Mock())
+    assert json.loads(next(iter(res))) == {"match": exp}
+
+def test_best_language(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.get("/")
+    def a(req: Request):
+        return [
+            req.headers.best_language(["fr", "en-GB"]),
+            req.headers.best_language(["de"]),
+            req.headers.best_language(["de", "en-US"])
+        ]
+
+    environ = build_environ("/", custom_fields={"HTTP_ACCEPT_LANGUAGE": "en;q=0.8, en-us"})
+    assert json.loads(next(iter(api(environ, mocker.Mock())))) == ["en-GB", None, "en-US"]
+
+def test_accept_parsing_is_cached() -> None:
+    header = "text/html;level=1;q=0.5, application/json"
+    assert parse_accept(header) is parse_accept(header)
+    assert parse_accept(header) == (("application/json", 1.0), ("text/html", 0.5))
+    assert parse_accept("a/b;q=x, c/d;q=2, e/f;q=0") == (("e/f", 0.0),)
+
+
+def test_raw_header_names(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.get("/")
+    def a(req: Request):
+        return {
+            "raw": sorted(req.headers.raw),
+            "request_id": req.headers.get("x-REQUEST-id"),
+            "missing": req.headers.get("X-Missing", "default")
+        }
+
+    environ = build_environ("/", custom_fields={
+        "HTTP_X_REQUEST_ID": "abc", "HTTP_X_CUSTOM_HEADER": "1", "HTTPS": "on"
+    })
+    body = json.loads(next(iter(api(environ, mocker.Mock()))))
+    # Well known headers keep their canonical casing, and keys that are not headers are left out
+    assert "X-Request-ID" in body["raw"]
+    assert "X-Custom-Header" in body["raw"]
+    assert "" not in body["raw"]
+    assert body["request_id"] == "abc"
+    assert body["missing"] == "default"
+
+def test_header_name_table_is_bounded(mocker: MockerFixture) -> None:
+    names = mocker.patch.dict("terminus.types._header_names")
+    mocker.patch.dict("terminus.types._lowered_names")
+    mocker.patch("terminus.types.MAX_HEADER_NAMES", len(names) + 1)
+    environ = build_environ("/", custom_fields={"HTTP_X_FLOOD_1": "1", "HTTP_X_FLOOD_2": "2"})
+    Headers.of(environ)
+    headers = Headers.of(environ)
+
+    assert len(names) == terminus_types.MAX_HEADER_NAMES
+    assert headers.raw["X-Flood-1"] == "1"
+    assert headers.raw["X-Flood-2"] == "2"
+    # Names missing from the table are still found regardless of casing
+    assert headers.get("x-flood-1") == "1"
+    assert headers.get("x-flood-2") == "2"
@@ -6,7 +6,8 @@ import pytest
 from pytest_mock import MockerFixture
 
 from terminus.api import API
-from terminus.tests.utils import build_environ
+from terminus.router import Router
+from terminus.tests.utils import build_environ, call
 from terminus.types import HTTPMethod, Request, RouteError
 
 
@@ -27,7 +28,7 @@ def test_unknown_route(mocker: MockerFixture) -> None:
 def test_wrong_method(mocker: MockerFixture) -> None:
     """
     Make sure that if a route is declared for method A and a request comes in with method B, the
-    request will not wrongly match the the route
+    request will not wrongly match the the route, and is told which methods are allowed
     """
     api = API()
     
@@ -39,10 +40,58 @@ def test_wrong_method(mocker: MockerFixture) -> None:
     res = api(build_environ("/a", HTTPMethod.DELETE), start_response)
     
     status_args, headers_arg = start_response.call_args[0]
-    assert "404" in status_args 
+    assert "405" in status_args 
     assert ("Content-Type", "application/json") in headers_arg
+    assert ("Allow", "GET, HEAD, OPTIONS") in headers_arg
     
     assert "error" in json.loads(next(iter(res)))
+
+def test_allow_index() -> None:
+    """The allowed methods of a path should combine every route template matching it"""
+    api = API()
+
+    @api.post("/users/[id]")
+    def update(req: Request):
+        return "update"
+
+    @api.delete("/users/[user_id]")
+    def delete(req: Request):
+        return "delete"
+
+    @api.put("/users/me/settings")
+    def settings(req: Request):
+        return "settings"
+
+    @api.get("/[section]/[id]/settings")
+    def section(req: Request):
+        return "section"
+
+    status, headers, _ = call(api, build_environ("/users/1", HTTPMethod.GET))
+    assert status == "405 Method Not Allowed"
+    assert headers["Allow"] == "POST, DELETE, OPTIONS"
+    assert call(api, build_environ("/users/1", HTTPMethod.OPTIONS)) == (
+        "204 No Content", {"Allow": "POST, DELETE, OPTIONS"}, b""
+    )
+    # The exact part 'me' leads to a dead end for 'other', so the path variable is tried instead
+    _, headers, _ = call(api, build_environ("/users/other/settings", HTTPMethod.POST))
+    assert headers["Allow"] == "GET, HEAD, OPTIONS"
+    _, headers, _ = call(api, build_environ("/users/me/settings", HTTPMethod.POST))
+    assert headers["Allow"] == "GET, HEAD, PUT, OPTIONS"
+    assert call(api, build_environ("/users", HTTPMethod.OPTIONS))[0] == "404 Not Found"
+
+def test_explicit_options_route(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.get("/a")
+    def a(req: Request):
+        return "a"
+
+    @api.options("/a")
+    def a_options(req: Request):
+        return "custom"
+
+    start_response = mocker.Mock()
+    assert list(api(build_environ("/a", HTTPMethod.OPTIONS), start_response)) == [b"custom"]
     
 
 def test_sub_route(mocker: MockerFixture) -> None:
@@ -147,4 +196,95 @@ def test_register_duplicate_route(mocker: MockerFixture) -> None:
             return req.query["q"]
         
         start_response = mocker.Mock()
-        api(build_environ("/"), start_response)
\ No newline at end of file
+        api(build_environ("/"), start_response)
+
+    with pytest.raises(RouteError):
+        @api.get("/users/[id]")
+        def user(req: Request):
+            return req.params["id"]
+
+        @api.get("/users/[user_id]")
+        def user_dup(req: Request):
+            return req.params["user_id"]
+
+def test_backtracking(mocker: MockerFixture) -> None:
+    """A path variable should be tried when an exact match leads to no route"""
+    api = API()
+
+    @api.get("/a/[x]/c")
+    def a_x_c(req: Request):
+        return "a_x_c " + req.params["x"]
+
+    @api.get("/a/b/d")
+    def a_b_d(req: Request):
+        return "a_b_d"
+
+    @api.get("/[y]/b/c")
+    def y_b_c(req: Request):
+        return "y_b_c"
+
+    def get(path: str) -> bytes:
+        return next(iter(api(build_environ(path), mocker.Mock())))
+
+    assert get("/a/b/c") == b"a_x_c b"
+    assert get("/a/b/d") == b"a_b_d"
+    assert get("/z/b/c") == b"y_b_c"
+
+    # Earlier exact parts take precedence over later ones
+    @api.get("/a/b/[z]")
+    def a_b_z(req: Request):
+        return "a_b_z"
+
+    assert get("/a/b/c") == b"a_b_z"
+
+def test_matching_cost_is_bounded(mocker: MockerFixture) -> None:
+    """Every node of the trie should be entered at most once, however the routes overlap"""
+    router = Router()
+    depth = 12
+    for i in range(depth):
+        # Routes with a single exact part and routes with a single path variable
+        for literal, param in (("a", "[p]"), ("[p]", "a")):
+            parts = [literal if j == i else param for j in range(depth)]
+            router.register_route(HTTPMethod.GET, "/" + "/".join(parts) + "/end", lambda req: "")
+
+    match = mocker.spy(Router, "_match")
+    assert router.match_route(HTTPMethod.GET, "/" + "/".join(["a"] * depth) + "/miss") is None
+    # Each route adds at most one node per part
+    assert match.call_count <= 2 * depth * (depth + 2) + 1
+
+def test_unmatched_lookups_are_cheap(mocker: MockerFixture) -> None:
+    """Unknown first parts and repeated misses should not walk the route trie"""
+    api = API()
+
+    @api.get("/users/[id]/posts")
+    def posts(req: Request):
+        return "posts"
+
+    match = mocker.spy(Router, "_match")
+    for _ in range(3):
+        start_response = mocker.Mock()
+        assert list(api(build_environ("/wp-admin/setup/php"), start_response)) == [
+            b'{"error": "Route not found"}'
+        ]
+        assert ("Content-Length", "28") in start_response.call_args[0][1]
+    assert match.call_count == 0
+
+    api(build_environ("/users/1/comments"), mocker.Mock())
+    walked = match.call_count
+    for _ in range(3):
+        api(build_environ("/users/1/comments"), mocker.Mock())
+    assert walked > 0
+    assert match.call_count == walked
+
+def test_miss_cache_is_cleared_and_bounded(mocker: MockerFixture) -> None:
+    mocker.patch("terminus.router.MISS_CACHE_SIZE", 2)
+    router = Router()
+    router.register_route(HTTPMethod.GET, "/users/[id]/posts", lambda req: "")
+
+    for path in ("/users/1/a", "/users/2/b", "/users/3/c"):
+        assert router.match_route(HTTPMethod.GET, path) is None
+    assert list(router._misses) == [(HTTPMethod.GET, "/users/2/b"), (HTTPMethod.GET, "/users/3/c")]
+
+    # A route registered after a miss must be matched by later requests
+    router.register_route(HTTPMethod.GET, "/users/[id]/[part]", lambda req: "")
+    assert router.match_route(HTTPMethod.GET, "/users/3/c") is not None
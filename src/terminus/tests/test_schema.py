@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.schema import RouteSchema, SchemaError, s
+from terminus.tests.types import BodyDTO
+from terminus.tests.utils import build_environ, call
+from terminus.types import ContentType, HTTPMethod, Request, RouteError
+
+PEOPLE = ("ada", "alan")
+
+USER_SCHEMA = RouteSchema(
+    body={
+        "a": s.list(elements=(s.int() | s.string()), length=2),
+        "b": s.string(pattern=r"[a-z]+") | None,
+        "owner": s.string(validate=lambda x: x in PEOPLE)
+    },
+    path={
+        "id": s.int(min=0, max=6)
+    },
+    query={
+        "tags": s.list(elements=s.string()),
+        "verbose": s.bool() | None
+    }
+)
+
+def post_json(uri: str, body) -> dict:
+    content = json.dumps(body).encode("utf-8")
+    return build_environ(uri, HTTPMethod.POST, BodyDTO(content, ContentType.APPLICATION_JSON))
+
+def test_valid_request_is_parsed() -> None:
+    """Path and query parameters should be parsed from strings into their schema types"""
+    api = API()
+
+    @api.post("/users/[id]", schema=USER_SCHEMA)
+    def fn(req: Request):
+        return {"id": req.params["id"], "query": req.query, "body": req.body}
+
+    body = {"a": [1, "x"], "owner": "ada"}
+    status, _, res = call(api, post_json("/users/3?tags=red&verbose=true", body))
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"id": 3, "query": {"tags": ["red"], "verbose": True}, "body": body}
+
+INVALID_REQUESTS = [
+    ("/users/3?tags=a", {"a": [1, 2.5], "owner": "ada"}, "body.a[1]"),
+    ("/users/3?tags=a", {"a": [1], "owner": "ada"}, "body.a"),
+    ("/users/3?tags=a", {"a": [1, 2], "b": "B", "owner": "ada"}, "body.b"),
+    ("/users/3?tags=a", {"a": [1, 2], "owner": "bob"}, "body.owner"),
+    ("/users/3?tags=a", {"a": [1, 2]}, "body.owner"),
+    ("/users/9?tags=a", {"a": [1, 2], "owner": "ada"}, "path.id"),
+    ("/users/3", {"a": [1, 2], "owner": "ada"}, "query.tags"),
+    ("/users/3?tags=a&verbose=maybe", {"a": [1, 2], "owner": "ada"}, "query.verbose"),
+]
+
+@pytest.mark.parametrize("uri, body, err_path", INVALID_REQUESTS)
+def test_invalid_request_rejected(uri: str, body, err_path: str) -> None:
+    api = API()
+
+    @api.post("/users/[id]", schema=USER_SCHEMA)
+    def fn(req: Request):
+        return {"id": req.params["id"], "query": req.query, "body": req.body}
+
+    status, _, res = call(api, post_json(uri, body))
+
+    assert "400" in status
+    assert f"'{err_path}'" in json.loads(res)["error"]
+
+def test_handler_not_called_on_invalid_request(mocker: MockerFixture) -> None:
+    api = API()
+    handler = mocker.Mock(return_value="Called")
+
+    @api.post("/", schema=RouteSchema(body=s.dict({"a": s.int()}, allow_extra=False)))
+    def fn(req: Request):
+        return handler(req)
+
+    status, _, res = call(api, post_json("/", {"a": 1, "extra": 2}))
+    assert "400" in status
+    assert "'body.extra'" in json.loads(res)["error"]
+    handler.assert_not_called()
+
+def test_body_conversions_are_kept() -> None:
+    schema = RouteSchema(body=s.list(elements={"price": s.float(), "tags": s.list()}))
+    body = [{"price": 1.5, "tags": []}, {"price": 2, "tags": ["a"]}]
+    parsed = schema.apply(body, {}, {})[0]
+
+    assert parsed == [{"price": 1.5, "tags": []}, {"price": 2.0, "tags": ["a"]}]
+    assert type(parsed[1]["price"]) is float
+    # The body itself is left as it was, and only copied where a value was converted
+    assert type(body[1]["price"]) is int
+    assert parsed[0] is body[0]
+    valid = [{"price": 1.5, "tags": []}]
+    assert schema.apply(valid, {}, {})[0] is valid
+
+def test_error_path_in_nested_lists() -> None:
+    schema = RouteSchema(body=s.list(elements={"items": s.list(elements={"price": s.float()})}))
+    body = [{"items": [{"price": 1}]}, {"items": [{"price": 2.0}, {"price": "free"}]}]
+
+    with pytest.raises(SchemaError) as e:
+        schema.apply(body, {}, {})
+    assert e.value.path == "body[1].items[1].price"
+
+def test_schema_for_unknown_path_variable() -> None:
+    api = API()
+    with pytest.raises(RouteError):
+        @api.get("/users/[id]", schema=RouteSchema(path={"name": s.string()}))
+        def fn(req: Request):
+            return "Body"
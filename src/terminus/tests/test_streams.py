@@ -0,0 +1,148 @@
+import json
+import tracemalloc
+from io import BytesIO, RawIOBase
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.streams import JSON_SEQ_SEPARATOR, NDJSON_SEPARATOR, iter_json_records
+from terminus.tests.types import BodyDTO
+from terminus.tests.utils import build_environ, call
+from terminus.types import ContentType, HTTPError, HTTPMethod, Request
+
+
+class RecordStream(RawIOBase):
+    """An input stream which generates NDJSON records as they are read, to avoid holding a body"""
+    def __init__(self, records: int) -> None:
+        self._records = iter(range(records))
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int | None = -1) -> bytes:
+        while size is None or size < 0 or len(self._pending) < size:
+            i = next(self._records, None)
+            if i is None:
+                break
+            self._pending += json.dumps({"id": i, "name": f"user{i}"}).encode() + b"\n"
+        if size is None or size < 0:
+            size = len(self._pending)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+def test_ndjson_body() -> None:
+    api = API()
+
+    @api.post("/ingest")
+    def fn(req: Request):
+        assert not isinstance(req.body, list | dict)
+        return {"records": list(req.body)}
+
+    content = b'{"a": 1}\n\n[1, 2]\r\n"x"'
+    environ = build_environ("/ingest", HTTPMethod.POST, BodyDTO(content),
+                            {"CONTENT_TYPE": ContentType.APPLICATION_NDJSON.value})
+    status, _, res = call(api, environ)
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"records": [{"a": 1}, [1, 2], "x"]}
+
+def test_json_seq_body() -> None:
+    api = API()
+
+    @api.post("/ingest")
+    def fn(req: Request):
+        assert not isinstance(req.body, list | dict)
+        return {"records": list(req.body)}
+
+    content = b'\x1e{"a": 1}\n\x1e{"a": 2}\n'
+    environ = build_environ("/ingest", HTTPMethod.POST, BodyDTO(content),
+                            {"CONTENT_TYPE": ContentType.APPLICATION_JSON_SEQ.value})
+    status, _, res = call(api, environ)
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"records": [{"a": 1}, {"a": 2}]}
+
+def chunked_environ(content: bytes, terminated: bool) -> dict:
+    environ = build_environ("/ingest", HTTPMethod.POST, BodyDTO(content), {
+        "CONTENT_TYPE": ContentType.APPLICATION_NDJSON.value,
+        "HTTP_TRANSFER_ENCODING": "chunked",
+        "wsgi.input_terminated": terminated
+    })
+    del environ["CONTENT_LENGTH"]
+    return environ
+
+def test_chunked_body_is_read_to_end() -> None:
+    api = API()
+
+    @api.post("/ingest")
+    def fn(req: Request):
+        assert not isinstance(req.body, list | dict)
+        return {"records": list(req.body)}
+
+    environ = chunked_environ(b'{"a": 1}\n{"a": 2}\n', terminated=True)
+    status, _, res = call(api, environ)
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"records": [{"a": 1}, {"a": 2}]}
+
+def test_unterminated_chunked_body_needs_length(mocker: MockerFixture) -> None:
+    api = API()
+
+    @api.post("/ingest")
+    def fn(req: Request):
+        assert not isinstance(req.body, list | dict)
+        return {"records": list(req.body)}
+
+    # Without wsgi.input_terminated the server passes the raw chunk framing through
+    stream = mocker.Mock(wraps=BytesIO(b'8\r\n{"a": 1}\r\n0\r\n\r\n'))
+    environ = chunked_environ(b"", terminated=False)
+    environ["wsgi.input"] = stream
+    status = call(api, environ)[0]
+
+    assert status == "411 Length Required"
+    assert stream.read.call_count == 0
+
+def test_invalid_record() -> None:
+    api = API()
+
+    @api.post("/ingest")
+    def fn(req: Request):
+        assert not isinstance(req.body, list | dict)
+        return {"records": list(req.body)}
+
+    environ = build_environ("/ingest", HTTPMethod.POST, BodyDTO(b'{"a": 1}\n\n{"a": \n'),
+                            {"CONTENT_TYPE": ContentType.APPLICATION_NDJSON.value})
+    status, _, res = call(api, environ)
+
+    assert status == "400 Bad Request"
+    assert json.loads(res)["error"].startswith("Record 2 is not valid JSON")
+
+def test_record_size_limit() -> None:
+    records = iter_json_records(BytesIO(b"1\n" + b"2" * 100), None, NDJSON_SEPARATOR,
+                                max_record_size=10)
+
+    assert next(records) == 1
+    with pytest.raises(HTTPError) as e:
+        next(records)
+    assert e.value.status == 413
+
+def test_records_are_read_lazily() -> None:
+    stream = BytesIO(JSON_SEQ_SEPARATOR.join(b"%d" % i for i in range(100_000)))
+    records = iter_json_records(stream, None, JSON_SEQ_SEPARATOR)
+
+    assert next(records) == 0
+    assert stream.tell() < len(stream.getvalue())
+
+def test_memory_is_constant() -> None:
+    tracemalloc.start()
+    try:
+        count = sum(1 for _ in iter_json_records(RecordStream(50_000), None, NDJSON_SEPARATOR))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert count == 50_000
+    # The body is around 1.5MB, while only a few chunks should ever be held at once
+    assert peak < 512 * 1024
@@ -0,0 +1,229 @@
+import json
+from dataclasses import dataclass, field
+from ipaddress import IPv4Address
+from pathlib import PurePosixPath
+
+import pytest
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.schema import RouteSchema, SchemaError, s
+from terminus.structs import compile_decoder, encode_json, is_struct
+from terminus.tests.types import BodyDTO
+from terminus.tests.utils import build_environ, call
+from terminus.types import ContentType, HTTPError, HTTPMethod, Request, RouteError
+
+
+@dataclass
+class Item:
+    name: str
+    price: float
+    tags: list[str] = field(default_factory=list)
+
+@dataclass
+class Order:
+    id: int
+    items: list[Item]
+    note: str | None = None
+
+class Point:
+    __slots__ = ("x", "y")
+
+    def __init__(self, x: int, y: int = 0) -> None:
+        self.x = x
+        self.y = y
+
+@dataclass
+class Tree:
+    value: int
+    children: list["Tree"]
+
+def post_json(uri: str, body) -> dict:
+    content = json.dumps(body).encode("utf-8")
+    return build_environ(uri, HTTPMethod.POST, BodyDTO(content, ContentType.APPLICATION_JSON))
+
+def test_dataclass_body_is_decoded() -> None:
+    api = API()
+
+    @api.post("/orders", body_type=Order)
+    def fn(req: Request):
+        assert isinstance(req.body, Order)
+        return {"total": sum(item.price for item in req.body.items), "note": req.body.note}
+
+    body = {"id": 1, "items": [{"name": "a", "price": 2}, {"name": "b", "price": 0.5}]}
+    status, _, res = call(api, post_json("/orders", body))
+
+    assert status == "200 OK"
+    assert json.loads(res) == {"total": 2.5, "note": None}
+
+def test_nested_structs_and_defaults() -> None:
+    decode = compile_decoder(Order)
+    order = decode(b'{"note": "hi", "items": [{"price": 1.5, "name": "a", "tags": ["x"]}], ' +
+                   b'"id": 3}')
+
+    assert order == Order(3, [Item("a", 1.5, ["x"])], "hi")
+    # Default factories give each struct its own value
+    first, second = decode(b'{"id": 1, "items": [{"name": "a", "price": 1}, ' +
+                           b'{"name": "b", "price": 2}]}').items
+    assert first.tags == [] and first.tags is not second.tags
+
+def test_slots_class_body() -> None:
+    point = compile_decoder(Point)(b'{"x": 4}')
+
+    assert isinstance(point, Point)
+    assert (point.x, point.y) == (4, 0)
+
+def test_recursive_struct() -> None:
+    tree = compile_decoder(Tree)(b'{"value": 1, "children": [{"value": 2, "children": []}]}')
+
+    assert tree == Tree(1, [Tree(2, [])])
+
+@dataclass
+class Name:
+    value: str
+
+def test_single_field_struct() -> None:
+    decode = compile_decoder(list[Name])
+
+    assert decode(b'[{"value": "a"}, {"value": "b"}]') == [Name("a"), Name("b")]
+    with pytest.raises(SchemaError) as e:
+        decode(b'[{"value": "a"}, {"other": "b"}]')
+    assert e.value.path == "body[1].other"
+
+def test_untyped_values_are_plain() -> None:
+    decode = compile_decoder(dict[str, list])
+
+    assert decode(b'{"a": [{"b": {"c": 1}}]}') == {"a": [{"b": {"c": 1}}]}
+
+INVALID_BODIES = [
+    ({"id": 1, "items": [], "extra": 1}, "body.extra"),
+    ({"items": []}, "body.id"),
+    ({"id": "1", "items": []}, "body.id"),
+    ({"id": True, "items": []}, "body.id"),
+    ({"id": 1, "items": [{"name": "a", "price": 1}, {"name": "b"}]}, "body.items[1].price"),
+    ({"id": 1, "items": [{"name": "a", "price": 1, "tags": ["x", 2]}]}, "body.items[0].tags[1]"),
+    ({"id": 1, "items": {}}, "body.items"),
+    ([], "body"),
+]
+
+@pytest.mark.parametrize("body,path", INVALID_BODIES)
+def test_invalid_body_is_rejected(body, path: str) -> None:
+    api = API()
+
+    @api.post("/orders", body_type=Order)
+    def fn(req: Request):
+        assert isinstance(req.body, Order)
+        return {"total": sum(item.price for item in req.body.items), "note": req.body.note}
+
+    status, _, res = call(api, post_json("/orders", body))
+
+    assert status == "400 Bad Request"
+    assert json.loads(res)["error"].startswith(f"Invalid value at '{path}'")
+
+def test_decoder_errors() -> None:
+    decode = compile_decoder(Order)
+
+    with pytest.raises(SchemaError) as e:
+        decode(b'{"id": 1}')
+    assert e.value.path == "body.items"
+    with pytest.raises(HTTPError):
+        decode(b'{"id": 1')
+
+def test_non_json_body_is_rejected() -> None:
+    api = API()
+    api.post("/orders", body_type=Order)(lambda req: "ok")
+    environ = build_environ("/orders", HTTPMethod.POST, BodyDTO(b"id=1", ContentType.TEXT_PLAIN))
+
+    assert call(api, environ)[0] == "400 Bad Request"
+    assert call(api, build_environ("/orders", HTTPMethod.POST))[0] == "400 Bad Request"
+
+def test_unsupported_types_are_rejected() -> None:
+    @dataclass(kw_only=True)
+    class KeywordOnly:
+        a: int
+
+    for tp in (dict[int, str], int | str, set[int], KeywordOnly):
+        with pytest.raises(RouteError):
+            compile_decoder(tp)
+
+    api = API()
+    with pytest.raises(RouteError):
+        api.post("/orders", body_type=Order, schema=RouteSchema(body=s.dict({})))(lambda req: {})
+
+class Tagged(Point):
+    __slots__ = ("_cache", "tag")
+
+    def __init__(self, x: int, y: int, tag: str) -> None:
+        super().__init__(x, y)
+        self.tag = tag
+        self._cache = None
+
+def test_structs_are_encoded() -> None:
+    order = Order(1, [Item("a", 1.5, ["x"]), Item("b", 2)])
+    expected = {
+        "id": 1, "note": None,
+        "items": [{"name": "a", "price": 1.5, "tags": ["x"]}, {"name": "b", "price": 2, "tags": []}]
+    }
+
+    assert json.loads(encode_json(order)) == expected
+    assert json.loads(encode_json({"orders": [order]})) == {"orders": [expected]}
+    # Slots are gathered from every class in the hierarchy, skipping private ones
+    assert json.loads(encode_json(Tagged(1, 2, "t"))) == {"x": 1, "y": 2, "tag": "t"}
+    assert encode_json({"a": [1, "b", None]}) == json.dumps({"a": [1, "b", None]})
+
+@dataclass(slots=True)
+class SlotsItem:
+    name: str
+    price: float
+
+def test_only_fields_are_encoded() -> None:
+    item = Item("a", 1.5)
+    item.cached = True  # type: ignore[attr-defined]
+
+    # Attributes which are not fields are left out, as they are for slots dataclasses
+    assert json.loads(encode_json(item)) == {"name": "a", "price": 1.5, "tags": []}
+    assert json.loads(encode_json(SlotsItem("b", 2))) == {"name": "b", "price": 2}
+    assert json.loads(encode_json([Item("c", 3)])) == [{"name": "c", "price": 3, "tags": []}]
+
+def test_struct_response() -> None:
+    api = API()
+
+    @api.get("/points")
+    def fn(req: Request):
+        return [Point(1, 2), Point(3, 4)], 201
+
+    status, headers, res = call(api, build_environ("/points"))
+
+    assert status == "201 Created"
+    assert headers["Content-Type"] == ContentType.APPLICATION_JSON.value
+    assert json.loads(res) == [{"x": 1, "y": 2}, {"x": 3, "y": 4}]
+
+def test_unencodable_values_are_rejected() -> None:
+    class Plain:
+        pass
+
+    with pytest.raises(TypeError):
+        encode_json([Plain()])
+
+@dataclass
+class Empty:
+    pass
+
+def test_classes_without_public_fields_are_rejected(mocker: MockerFixture) -> None:
+    assert not is_struct(IPv4Address) and not is_struct(PurePosixPath)
+    with pytest.raises(TypeError):
+        encode_json(Empty())
+
+    api = API()
+
+    @api.get("/values/[kind]")
+    def fn(req: Request):
+        values = {"ip": IPv4Address("10.0.0.1"), "path": PurePosixPath("/tmp")}
+        if req.query.get("nested"):
+            return {"value": values[req.params["kind"]]}
+        return values[req.params["kind"]]
+
+    # As for other unsupported bodies, these are rejected rather than sent as an empty object
+    for uri in ("/values/ip", "/values/path", "/values/ip?nested=1", "/values/path?nested=1"):
+        with pytest.raises(HTTPError):
+            api(build_environ(uri), mocker.Mock())
@@ -0,0 +1,56 @@
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from pytest import CaptureFixture
+from pytest_mock import MockerFixture
+
+from terminus.api import API
+from terminus.middleware import identifier
+from terminus.tests.utils import build_environ
+from terminus.types import Request, RouteError
+from terminus.watchdog import SlowRequestWatchdog
+
+
+def test_reports_slow_request_stack(mocker: MockerFixture, capsys: CaptureFixture,
+                                    tmp_path: Path) -> None:
+    out_file = tmp_path / "slow.txt"
+    api = API(watchdog=SlowRequestWatchdog(threshold=0.02, interval=0.005, write_to=out_file))
+
+    @api.get("/users/[id]", pre=[identifier])
+    def blocking_handler(req: Request):
+        time.sleep(0.2)
+        return "Done"
+
+    environ = build_environ("/users/42") | {"HTTP_X_REQUEST_ID": "slow-req-id"}
+    api(environ, mocker.Mock())
+
+    out = capsys.readouterr().out
+    assert "Slow request: GET /users/[id] (/users/42)" in out
+    assert "Request ID: slow-req-id" in out
+    # The stack should show where the handler was blocked
+    assert "blocking_handler" in out
+    assert "time.sleep(0.2)" in out
+    assert out.count("Slow request") == 1
+    assert "blocking_handler" in out_file.read_text()
+
+def test_fast_request_not_reported(mocker: MockerFixture) -> None:
+    watchdog = SlowRequestWatchdog(threshold=10)
+    api = API(watchdog=watchdog)
+    seen = threading.Event()
+
+    @api.get("/")
+    def fn(req: Request):
+        assert watchdog.check() == []
+        seen.set()
+        return "Fast"
+
+    api(build_environ("/"), mocker.Mock())
+
+    assert seen.is_set()
+    assert watchdog.check() == []
+
+def test_threshold_must_be_positive() -> None:
+    with pytest.raises(RouteError):
+        SlowRequestWatchdog(threshold=0)
@@ -1,5 +1,7 @@
 
+from collections.abc import Callable
 from io import BytesIO
+from unittest.mock import Mock
 from wsgiref.types import WSGIEnvironment
 from wsgiref.util import setup_testing_defaults
 
@@ -24,7 +26,8 @@ def build_environ(uri: str, method: HTTPMethod | str = HTTPMethod.GET,
     Create a dictionary of WSGI endpoint environmental variables using a set of defaults as well
     as a provided raw URI (path + query parameters concatenated) and an HTTP method 
     """
-    environ: WSGIEnvironment = EXTRA_ENVIRON_DEFAULTS
+    # Defaults are copied so fields set for one request never leak into another
+    environ: WSGIEnvironment = dict(EXTRA_ENVIRON_DEFAULTS)
     
     setup_testing_defaults(environ)
     
@@ -48,4 +51,14 @@ def build_environ(uri: str, method: HTTPMethod | str = HTTPMethod.GET,
     
     environ["REQUEST_METHOD"] = method if isinstance(method, str) else method.value
 
-    return environ
\ No newline at end of file
+    return environ
+
+def call(app: Callable, environ: dict) -> tuple[str, dict[str, str], bytes]:
+    """
+    Send a request to a WSGI app such as an API, returning the status, headers and whole body of the
+    response
+    """
+    start_response = Mock()
+    body = b"".join(app(environ, start_response))
+    status, headers = start_response.call_args[0]
+    return status, dict(headers), body
@@ -1,16 +1,20 @@
 """
 General types not specific to any of the other modules
 """
+import time
+from collections.abc import Callable, Iterator, Sequence
 from dataclasses import dataclass, field
 from enum import Enum
 from typing import Any
 from wsgiref.types import WSGIEnvironment
 
+from terminus.accept import AcceptList, best_match, language_range_matches, parse_accept
+
 type WSGIFormatHeaders = list[tuple[str, str]]
 
 type PathVariables = dict[str, str]
 type QueryVariables = dict[str, str | list[str]]
-type RequestBody = dict | list | str | bytes
+type RequestBody = dict | list | str | bytes | Iterator[Any]
 
 type Cookies = dict[str, str]
 
@@ -18,9 +22,12 @@ type GenericBody = Any
 type BodyStatusPair = tuple[Any, int]
 type BodyStatusCookiesTriplet = tuple[Any, int, Cookies]
 type RouteFnRes = GenericBody | BodyStatusPair | BodyStatusCookiesTriplet
+# Called with the finished request and the status code of its response
+type BackgroundTask = Callable[["Request", int], None]
 
 class HTTPMethod(Enum):
     GET = "GET"
+    HEAD = "HEAD"
     POST = "POST"
     PUT = "PUT"
     DELETE = "DELETE"
@@ -33,13 +40,66 @@ class ContentType(Enum):
     TEXT_PLAIN = "text/plain"
     APPLICATION_JSON = "application/json"
     APPLICATION_OCTET_STREAM = "application/octet-stream"
+    APPLICATION_FORM_URLENCODED = "application/x-www-form-urlencoded"
+    MULTIPART_FORM_DATA = "multipart/form-data"
+    APPLICATION_NDJSON = "application/x-ndjson"
+    APPLICATION_JSON_SEQ = "application/json-seq"
+
+    @staticmethod
+    def of(header: str) -> "ContentType | None":
+        """
+        Get the content type of a Content-Type header, ignoring parameters such as charset. None is
+        returned for content types with no member, such as those of codecs.
+        """
+        media_type = header.partition(";")[0].strip().lower()
+        try:
+            return ContentType(media_type)
+        except ValueError:
+            return None
+
+# Headers whose canonical casing is not the title case of their name
+WELL_KNOWN_HEADERS = (
+    "Content-MD5", "DNT", "ETag", "Sec-CH-UA", "Sec-CH-UA-Mobile", "Sec-CH-UA-Platform", "TE",
+    "WWW-Authenticate", "X-ATT-DeviceId", "X-Correlation-ID", "X-CSRF-Token", "X-Request-ID",
+    "X-UA-Compatible", "X-XSS-Protection"
+)
+# The number of WSGI environ keys whose translation is kept, so flooding a worker with distinct
+# header names cannot grow the table without limit
+MAX_HEADER_NAMES = 1024
+
+# WSGI environ keys mapped to the canonical names of their headers, or to the empty string for keys
+# that are not headers. Both tables are shared by every request of the process.
+_header_names: dict[str, str] = {
+    "CONTENT_TYPE": "Content-Type",
+    "CONTENT_LENGTH": "Content-Length",
+    **{"HTTP_" + name.upper().replace("-", "_"): name for name in WELL_KNOWN_HEADERS}
+}
+# Lowercased header names mapped to their canonical names, for case insensitive lookups
+_lowered_names: dict[str, str] = {name.lower(): name for name in _header_names.values()}
+
+
+def header_name(key: str) -> str:
+    """
+    Get the canonical name of a header from its WSGI environ key, such as 'X-Request-ID' for
+    'HTTP_X_REQUEST_ID'. The empty string is returned for keys that are not headers.
+    """
+    name = _header_names.get(key)
+    if name is not None:
+        return name
+    name = key[5:].replace("_", "-").title() if key.startswith("HTTP_") else ""
+    if len(_header_names) < MAX_HEADER_NAMES:
+        _header_names[key] = name
+        if name:
+            _lowered_names[name.lower()] = name
+    return name
+
 
 @dataclass(frozen=True)
 class Headers:
     host: str
-    accept: list[str]
-    accept_language: list[str]
-    accept_encoding: list[str]
+    accept: AcceptList
+    accept_language: AcceptList
+    accept_encoding: AcceptList
     connection: str
     remote_address: str
     content_type: ContentType | None
@@ -49,32 +109,53 @@ class Headers:
     @staticmethod
     def of(environ: WSGIEnvironment) -> "Headers":
         raw: dict[str, str] = {}
+        names = _header_names
         for key, val in environ.items():
-            if key.startswith("HTTP"):
-                parsed_key = key[5:].replace("_", "-").title()
-                raw[parsed_key] = val
-            elif key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
-                parsed_key = key.replace("_", "-").title()
-                raw[parsed_key] = val
+            name = names.get(key)
+            if name is None:
+                name = header_name(key)
+            if name:
+                raw[name] = val
                 
         cookies: dict[str, str] = {}
         if "HTTP_COOKIE" in environ:
             for cookie in environ["HTTP_COOKIE"].split("; "):
-                key, val = cookie.split("=")
-                cookies[key] = val
+                key, sep, val = cookie.partition("=")
+                if sep:
+                    cookies[key] = val
              
         c_type = environ.get("CONTENT_TYPE", None)
         return Headers(
             host=environ["HTTP_HOST"],
-            accept=environ["HTTP_ACCEPT"].split(","),
-            accept_language = environ["HTTP_ACCEPT_LANGUAGE"].split(","),
-            accept_encoding = environ["HTTP_ACCEPT_ENCODING"].split(", "),
+            accept=parse_accept(environ.get("HTTP_ACCEPT", "")),
+            accept_language = parse_accept(environ.get("HTTP_ACCEPT_LANGUAGE", "")),
+            accept_encoding = parse_accept(environ.get("HTTP_ACCEPT_ENCODING", "")),
             connection = environ["HTTP_CONNECTION"],
             remote_address = environ["REMOTE_ADDR"],
             cookies = cookies,
-            content_type = None if c_type is None else ContentType(c_type),
+            content_type = None if c_type is None else ContentType.of(c_type),
             raw=raw
         )
+
+    def get(self, name: str, default: str | None = None) -> str | None:
+        """Get the value of a header by its name in any casing"""
+        lowered = name.lower()
+        canonical = _lowered_names.get(lowered)
+        if canonical is not None:
+            return self.raw.get(canonical, default)
+        # Only names seen after the translation table filled up are missing from it
+        for raw_name, val in self.raw.items():
+            if raw_name.lower() == lowered:
+                return val
+        return default
+
+    def best_match(self, offered: Sequence[str]) -> str | None:
+        """Choose the media type the client prefers from those offered, or None if none are"""
+        return best_match(self.accept, offered)
+
+    def best_language(self, offered: Sequence[str]) -> str | None:
+        """Choose the language the client prefers from those offered, or None if none are"""
+        return best_match(self.accept_language, offered, language_range_matches)
     
     
 @dataclass(frozen=True)
@@ -87,14 +168,38 @@ class Request:
     path: str
     headers: Headers
     context: dict[Any, Any] = field(default_factory=dict)
+    background_tasks: list[BackgroundTask] = field(default_factory=list)
+    # A time.monotonic() value after which the client will have given up on the response
+    deadline: float | None = None
+    # Headers middleware adds to the response, whether it succeeds or fails
+    response_headers: WSGIFormatHeaders = field(default_factory=list)
+
+    def add_response_header(self, name: str, value: str) -> None:
+        """Add a header to the response to this request, such as a Set-Cookie from middleware"""
+        self.response_headers.append((name, value))
+
+    def add_background_task(self, task: BackgroundTask) -> None:
+        """Schedule a task to run once the response to this request has been sent"""
+        self.background_tasks.append(task)
+
+    def remaining(self) -> float | None:
+        """Get the number of seconds left before the deadline of this request, if it has one"""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def check_deadline(self) -> None:
+        """Raise a 504 error if the deadline of this request has passed"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise HTTPError("Request deadline exceeded", 504)
     
 class HTTPError(Exception):
     """
     An error related to an HTTP request, response or parsing of data associated with these entities
     """
-    def __init__(self, msg: str) -> None:
+    def __init__(self, msg: str, status: int = 400) -> None:
         super().__init__(msg)
-        self.status = 400
+        self.status = status
 
 class RouteError(Exception):
     """
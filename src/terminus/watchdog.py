@@ -0,0 +1,108 @@
+"""
+Detection of slow requests while they are still running
+"""
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from pathlib import Path
+from types import FrameType
+
+from terminus.types import Request, RouteError
+
+
+@dataclass
+class RunningRequest:
+    req: Request
+    raw_path: str
+    started: float
+    thread_name: str
+    reported: bool = False
+
+
+class SlowRequestWatchdog:
+    """
+    Watches requests running through the execution pipeline from a background thread. When a
+    request has run for longer than <threshold> seconds, the current stack of the thread handling
+    it is logged along with the route template and request ID, so a blocking call can be seen while
+    it is happening. Each request is reported at most once.
+    Arguments:
+        - <threshold> The number of seconds a request may run before it is reported
+        - <interval> The number of seconds between checks. Defaults to a quarter of the threshold
+        - <write_to> The file, if any, to write reports to (stdout is always written to)
+    """
+    def __init__(self, threshold: float, interval: float | None = None,
+                 write_to: Path | None = None) -> None:
+        if threshold <= 0:
+            raise RouteError("The slow request threshold must be positive")
+        self.threshold = threshold
+        self._interval = interval if interval is not None else threshold / 4
+        self._write_to = write_to
+        self._running: dict[int, RunningRequest] = {}
+        self._thread: threading.Thread | None = None
+
+    def start(self, req: Request, raw_path: str) -> None:
+        """Start watching a request handled by the current thread"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._watch, name="terminus-watchdog",
+                                            daemon=True)
+            self._thread.start()
+        thread = threading.current_thread()
+        self._running[thread.ident or 0] = RunningRequest(
+            req, raw_path, time.monotonic(), thread.name
+        )
+
+    def finish(self) -> None:
+        """Stop watching the request handled by the current thread"""
+        self._running.pop(threading.get_ident(), None)
+
+    def check(self) -> list[str]:
+        """Report every request which has newly exceeded the threshold, returning the reports"""
+        now = time.monotonic()
+        slow = [
+            (thread_id, running) for thread_id, running in list(self._running.items())
+            if not running.reported and now - running.started > self.threshold
+        ]
+        if not slow:
+            return []
+
+        frames = sys._current_frames()
+        reports: list[str] = []
+        for thread_id, running in slow:
+            frame = frames.get(thread_id)
+            # The request may have finished since the snapshot was taken
+            if frame is None or self._running.get(thread_id) is not running:
+                continue
+            running.reported = True
+            reports.append(self._format_report(running, thread_id, now, frame))
+
+        for report in reports:
+            print(report)
+            if self._write_to is not None:
+                with open(self._write_to, "a") as f:
+                    f.write(report)
+        return reports
+
+    def _watch(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            self.check()
+
+    def _format_report(self, running: RunningRequest, thread_id: int, now: float,
+                       frame: FrameType) -> str:
+        req = running.req
+        if "unique_id" in req.context:
+            req_id = str(req.context["unique_id"])
+        else:
+            req_id = req.headers.get("X-Request-ID", "None")
+
+        stack = "".join(traceback.format_stack(frame))
+        return "\n" + "\n".join([
+            f"Slow request: {req.method.value} {running.raw_path} ({req.path})",
+            f"Request ID: {req_id}",
+            f"Elapsed: {now - running.started:.3f}s (threshold {self.threshold}s)",
+            f"Thread: {running.thread_name} ({thread_id})",
+            "Stack (most recent call last):",
+            stack
+        ])